@@ -0,0 +1,247 @@
+from typing import Dict, Optional, Tuple
+from concurrent.futures import CancelledError, Future
+import collections
+import os
+import threading
+import time
+
+from . import metrics
+from .models import SolveOptions, SolveRequest
+from .profiles import hierarchical_processes
+
+# Priority classes, served strictly in this order: what-ifs a planner is waiting on go
+# first, nightly full re-plans (X-Priority: batch) get the workers nobody else needs
+PRIORITY_CLASSES = ("interactive", "normal", "batch")
+DEFAULT_CLIENT = "anonymous"
+# Solves waiting for a worker, in total and per client; more are rejected with 429
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", 64))
+ADMISSION_CLIENT_QUEUE_SIZE = int(os.environ.get("ADMISSION_CLIENT_QUEUE_SIZE", 16))
+# Estimated memory the models of the running solves may take together
+SOLVER_MEMORY_BUDGET_MB = int(os.environ.get("SOLVER_MEMORY_BUDGET_MB", 2048))
+
+# Peak solve memory of a model, fitted on the benchmark instances
+# (flow-200x5 takes about 80 MB, setups-200x5 about 920 MB)
+MODEL_BASE_BYTES = 16 * 2**20
+BYTES_PER_ALTERNATIVE = 6 * 2**10  # optional interval of one eligible line or operator
+BYTES_PER_SETUP_ARC = 2.5 * 2**10  # circuit arc between two tasks of a line with setups
+BYTES_PER_LINE_PROCESS = 96 * 2**20  # process a hierarchical solve sequences lines in, with OR-Tools loaded
+
+
+class AdmissionRejected(Exception):
+    """A solve the server will not take now (429: queue full) or at all (413: too large)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def estimate_model_bytes(req: SolveRequest) -> int:
+    """
+    Peak memory of solving `req`, from its line and operator alternatives and its setup
+    arcs. Rolling-horizon solves only hold one window at a time; hierarchical ones also hold
+    the processes they sequence lines in.
+    """
+    options = req.options or SolveOptions()
+    operators_by_skill = collections.Counter(skill for op in req.operators for skill in set(op.skills))
+    lines_with_setups = {s.lineId for s in req.setupTimes or [] if s.duration}
+    alternatives = 0
+    tasks_per_line = collections.Counter()
+    for job in req.jobs:
+        for task in job.tasks:
+            alternatives += len(task.eligibleLines) + operators_by_skill[task.skill]
+            tasks_per_line.update(task.eligibleLines)
+    arcs = sum(tasks_per_line[line_id] ** 2 for line_id in lines_with_setups)
+    processes = 0
+
+    if options.decomposition == 'hierarchical':
+        # Line circuits only hold the tasks assigned to the line, and the repair model has one
+        # line per task and no circuits
+        tasks = sum(len(job.tasks) for job in req.jobs)
+        lines_per_task = sum(tasks_per_line.values()) / max(1, tasks)
+        alternatives -= sum(tasks_per_line.values()) - tasks
+        arcs = arcs / max(1.0, lines_per_task) ** 2
+        processes = hierarchical_processes(options, len(req.lines))
+        if processes == 1:
+            processes = 0  # sequenced in the solver worker itself
+
+    share = 1.0
+    if options.decomposition == 'rolling' and req.jobs:
+        share = min(1.0, (options.rollingWindowJobs + options.rollingOverlapJobs) / len(req.jobs))
+    return int(MODEL_BASE_BYTES + alternatives * share * BYTES_PER_ALTERNATIVE + arcs * share ** 2 * BYTES_PER_SETUP_ARC
+               + processes * BYTES_PER_LINE_PROCESS)
+
+
+class Ticket:
+    """A solve admitted to the queue: what it runs as, for whom, and its memory estimate."""
+
+    def __init__(self, request: SolveRequest, client: str, priority: str, estimate: int, degraded: bool):
+        self.request = request
+        self.client = client
+        self.priority = priority
+        self.estimate = estimate
+        self.degraded = degraded
+        self.queued_at: Optional[float] = None
+
+
+class AdmissionQueue:
+    """
+    Bounded queue in front of the worker pool. A solve only goes to the pool when a worker
+    is free and its estimated model fits in what is left of the memory budget, so the pool
+    never holds more models than it has memory for. Waiting solves leave by priority class;
+    within a class, clients take turns, so one client's burst cannot hold up the others.
+    """
+
+    def __init__(self, submit, workers: int, memory_budget: int = SOLVER_MEMORY_BUDGET_MB * 2**20,
+                 max_queued: int = ADMISSION_QUEUE_SIZE, max_queued_per_client: int = ADMISSION_CLIENT_QUEUE_SIZE):
+        self.submit_to_pool = submit
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.lock = threading.Lock()
+        # priority class -> client -> waiting (ticket, future, fn, args); clients rotate to the back once served
+        self.waiting = {priority: collections.OrderedDict() for priority in PRIORITY_CLASSES}
+        self.queued_by_client = collections.Counter()
+        self.running = 0
+        self.reserved = 0
+
+    def admit(self, req: SolveRequest, client: str = DEFAULT_CLIENT, priority: str = "normal") -> Ticket:
+        """
+        Check a solve against the memory budget. One too large is degraded to a rolling-horizon
+        solve when its windows fit, and rejected otherwise.
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class '{priority}', expected one of {list(PRIORITY_CLASSES)}")
+        estimate = estimate_model_bytes(req)
+        if estimate <= self.memory_budget:
+            return Ticket(req, client, priority, estimate, degraded=False)
+        options = req.options or SolveOptions()
+        if options.decomposition != 'rolling':
+            rolling = req.model_copy(update={'options': options.model_copy(update={'decomposition': 'rolling'})})
+            rolling_estimate = estimate_model_bytes(rolling)
+            if rolling_estimate <= self.memory_budget:
+                return Ticket(rolling, client, priority, rolling_estimate, degraded=True)
+        metrics.registry.inc("scheduler_admissions_total", priority=priority, outcome="too_large")
+        raise AdmissionRejected(413, f"Estimated model size {estimate / 2**20:.0f} MB is over the solver memory "
+                                     f"budget of {self.memory_budget / 2**20:.0f} MB")
+
+    def submit(self, ticket: Ticket, fn, *args) -> Future:
+        """Queue fn(*args) for the pool. The future stays pending until a worker takes it, and can be cancelled until then."""
+        future = Future()
+        with self.lock:
+            if sum(self.queued_by_client.values()) >= self.max_queued:
+                reason = "Solve queue is full"
+            elif self.queued_by_client[ticket.client] >= self.max_queued_per_client:
+                reason = f"Client {ticket.client} has {self.queued_by_client[ticket.client]} solves waiting"
+            else:
+                reason = None
+                ticket.queued_at = time.perf_counter()
+                clients = self.waiting[ticket.priority]
+                clients.setdefault(ticket.client, collections.deque()).append((ticket, future, fn, args))
+                self.queued_by_client[ticket.client] += 1
+        if reason is not None:
+            metrics.registry.inc("scheduler_admissions_total", priority=ticket.priority, outcome="queue_full")
+            raise AdmissionRejected(429, f"{reason}: retry later")
+        metrics.registry.inc("scheduler_admissions_total", priority=ticket.priority,
+                             outcome="degraded" if ticket.degraded else "admitted")
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """Start waiting solves while workers and memory are free."""
+        started = []
+        with self.lock:
+            while self.running < self.workers:
+                head = self._head()
+                if head is None:
+                    break
+                ticket, future, fn, args = head[0]
+                # The first in line waits for memory rather than being overtaken; a solve
+                # always starts on an idle pool, so large ones are not starved
+                if self.running and self.reserved + ticket.estimate > self.memory_budget:
+                    break
+                self._pop(*head[1:])
+                if not future.set_running_or_notify_cancel():
+                    continue  # cancelled while waiting
+                self.running += 1
+                self.reserved += ticket.estimate
+                metrics.registry.observe("scheduler_queue_wait_seconds", time.perf_counter() - ticket.queued_at,
+                                         priority=ticket.priority)
+                started.append((ticket, future, fn, args))
+            self._update_gauges()
+        for ticket, future, fn, args in started:
+            try:
+                pool_future = self.submit_to_pool(fn, *args)
+            except Exception as e:
+                self._finished(ticket, future, None, e)
+                continue
+            pool_future.add_done_callback(lambda done, t=ticket, f=future: self._finished(t, f, done))
+
+    def _head(self) -> Optional[Tuple]:
+        """The next waiting solve, with its priority class and client."""
+        for priority in PRIORITY_CLASSES:
+            for client, entries in self.waiting[priority].items():
+                return entries[0], priority, client
+        return None
+
+    def _pop(self, priority: str, client: str):
+        clients = self.waiting[priority]
+        clients[client].popleft()
+        self.queued_by_client[client] -= 1
+        if not self.queued_by_client[client]:
+            del self.queued_by_client[client]
+        if clients[client]:
+            clients.move_to_end(client)
+        else:
+            del clients[client]
+
+    def _finished(self, ticket: Ticket, future: Future, done: Optional[Future], error: Optional[Exception] = None):
+        with self.lock:
+            self.running -= 1
+            self.reserved -= ticket.estimate
+        if error is None and done.cancelled():
+            error = CancelledError()
+        elif error is None:
+            error = done.exception()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            result = done.result()
+            if ticket.degraded:
+                result = dict(result, degraded='rolling', logs=[
+                    f"Admission: estimated model over the {self.memory_budget / 2**20:.0f} MB memory budget, "
+                    f"solved as a rolling horizon",
+                ] + result.get('logs', []))
+            future.set_result(result)
+        self._dispatch()
+
+    def cancel_waiting(self):
+        """Cancel every solve still waiting (on shutdown)."""
+        with self.lock:
+            waiting = [entry for clients in self.waiting.values() for entries in clients.values() for entry in entries]
+            for clients in self.waiting.values():
+                clients.clear()
+            self.queued_by_client.clear()
+            self._update_gauges()
+        for _, future, _, _ in waiting:
+            future.cancel()
+
+    def _update_gauges(self):
+        for priority, clients in self.waiting.items():
+            metrics.registry.set("scheduler_queue_depth", sum(len(entries) for entries in clients.values()),
+                                 priority=priority)
+        metrics.registry.set("scheduler_solves_running", self.running)
+        metrics.registry.set("scheduler_solver_memory_reserved_bytes", self.reserved)
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return {
+                "queued": {priority: sum(len(entries) for entries in clients.values())
+                           for priority, clients in self.waiting.items()},
+                "queuedByClient": dict(self.queued_by_client),
+                "running": self.running,
+                "workers": self.workers,
+                "memoryReservedBytes": self.reserved,
+                "memoryBudgetBytes": self.memory_budget,
+            }
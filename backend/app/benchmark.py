@@ -0,0 +1,268 @@
+"""
+Solver benchmark: seeded synthetic SME instances run through solve_schedule.
+
+    python -m app.benchmark --suite small --output bench.json
+    python -m app.benchmark --suite medium --option setupModel=sparse --compare bench.json
+    python -m app.benchmark --suite large --option intervalEncoding=lean --compare bench.json
+
+Every instance is solved in a fresh process so its peak RSS is its own. Results are written
+as JSON so runs from different commits can be compared with --compare.
+"""
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import ortools
+
+from .models import SolveOptions, SolveRequest
+
+# Instance families; each entry is run once per seed
+SUITES = {
+    "small": [
+        {"name": "flow-10x3", "jobs": 10, "tasks_per_job": 3, "lines": 3, "operators": 4},
+        {"name": "setups-10x3", "jobs": 10, "tasks_per_job": 3, "lines": 3, "operators": 4, "setup_density": 0.5},
+        {"name": "shifts-10x3", "jobs": 10, "tasks_per_job": 3, "lines": 3, "operators": 4, "shift_pattern": "day"},
+    ],
+    "medium": [
+        {"name": "flow-50x4", "jobs": 50, "tasks_per_job": 4, "lines": 5, "operators": 8, "skills": 3},
+        {"name": "setups-50x4", "jobs": 50, "tasks_per_job": 4, "lines": 5, "operators": 8, "skills": 3,
+         "setup_density": 0.3},
+        {"name": "shifts-50x4", "jobs": 50, "tasks_per_job": 4, "lines": 5, "operators": 8, "skills": 3,
+         "shift_pattern": "two_shift"},
+        {"name": "weekly-50x4", "jobs": 50, "tasks_per_job": 4, "lines": 5, "operators": 8, "skills": 3,
+         "shift_pattern": "weekly", "pausable_share": 0.25},
+    ],
+    "large": [
+        {"name": "flow-200x5", "jobs": 200, "tasks_per_job": 5, "lines": 10, "operators": 20, "skills": 4},
+        {"name": "setups-200x5", "jobs": 200, "tasks_per_job": 5, "lines": 10, "operators": 20, "skills": 4,
+         "setup_density": 0.1, "shift_pattern": "two_shift"},
+    ],
+}
+
+DAY = 24 * 60
+
+
+def generate_instance(seed: int, jobs: int = 10, tasks_per_job: int = 3, lines: int = 3, operators: int = 4,
+                      skills: int = 1, lines_per_task: int = 2, setup_density: float = 0.0,
+                      shift_pattern: str = "none", min_duration: int = 10, max_duration: int = 60,
+                      due_slack: float = 1.5, pausable_share: float = 0.0, **_) -> SolveRequest:
+    """
+    A reproducible SME instance: the same arguments always give the same request.
+
+    setup_density is the share of (line, from job, to job) triples with a setup time.
+    shift_pattern: 'none' (always available), 'day' (operators work 8h a day),
+    'two_shift' (lines and operators run 16h a day) or 'weekly' (two shifts on weekdays,
+    as a recurring calendar template). pausable_share of the tasks may pause over breaks.
+    Due dates are spread up to due_slack times a rough makespan estimate.
+    """
+    rng = random.Random(seed)
+    line_ids = [f"L{i + 1}" for i in range(lines)]
+    skill_ids = [f"S{i + 1}" for i in range(skills)]
+
+    operator_list = []
+    for i in range(operators):
+        # Every skill has at least one operator
+        own = {skill_ids[i % skills]} | {s for s in skill_ids if rng.random() < 0.3}
+        operator_list.append({"id": f"O{i + 1}", "name": f"Operator {i + 1}", "skills": sorted(own)})
+
+    job_list = []
+    total_work = 0
+    for j in range(jobs):
+        tasks = []
+        for t in range(tasks_per_job):
+            duration = rng.randint(min_duration, max_duration)
+            total_work += duration
+            tasks.append({
+                "id": f"J{j + 1}-task-{t}",
+                "name": f"Op {t + 1}",
+                "eligibleLines": rng.sample(line_ids, min(lines_per_task, lines)),
+                "duration": duration,
+                "skill": rng.choice(skill_ids),
+                "pausable": pausable_share > 0 and rng.random() < pausable_share,
+            })
+        job_list.append({
+            "id": f"J{j + 1}",
+            "name": f"Order {j + 1}",
+            "color": "#%06x" % rng.randrange(0x1000000),
+            "priority": rng.randint(1, 3),
+            "tasks": tasks,
+        })
+
+    # Rough makespan: work spread over the lines, stretched by the share of time on shift
+    on_shift = {"none": 1.0, "day": 8 / 24, "two_shift": 16 / 24, "weekly": 80 / 168}[shift_pattern]
+    estimate = total_work / max(1, min(lines, operators)) / on_shift
+    for job in job_list:
+        job["dueDate"] = rng.randint(int(estimate * 0.3), max(int(estimate * 0.3) + 1, int(estimate * due_slack)))
+
+    setup_times = []
+    if setup_density > 0:
+        for line_id in line_ids:
+            for a in job_list:
+                for b in job_list:
+                    if a is not b and rng.random() < setup_density:
+                        setup_times.append({"lineId": line_id, "fromJobId": a["id"], "toJobId": b["id"],
+                                            "duration": rng.randint(5, 30)})
+
+    availabilities = []
+    calendars = []
+    days = int(estimate * 3 / DAY) + 2
+    if shift_pattern == "day":
+        shifts = [{"start": d * DAY + 8 * 60, "end": d * DAY + 16 * 60} for d in range(days)]
+        availabilities = [{"resourceId": op["id"], "intervals": shifts} for op in operator_list]
+    elif shift_pattern == "two_shift":
+        shifts = [{"start": d * DAY + 6 * 60, "end": d * DAY + 22 * 60} for d in range(days)]
+        availabilities = [{"resourceId": r, "intervals": shifts} for r in line_ids + [op["id"] for op in operator_list]]
+    elif shift_pattern == "weekly":
+        calendars = [{"id": "weekdays", "period": 7 * DAY,
+                      "intervals": [{"start": d * DAY + 6 * 60, "end": d * DAY + 22 * 60} for d in range(5)]}]
+        availabilities = [{"resourceId": r, "calendarId": "weekdays"} for r in line_ids + [op["id"] for op in operator_list]]
+
+    return SolveRequest(
+        jobs=job_list,
+        lines=[{"id": line_id, "name": line_id} for line_id in line_ids],
+        operators=operator_list,
+        setupTimes=setup_times,
+        availabilities=availabilities,
+        calendars=calendars,
+    )
+
+
+def run_instance(config: Dict, seed: int, options: Dict) -> Dict:
+    """Generate and solve one instance (in a fresh worker process). Returns its measurements."""
+    from .solver import solve_schedule
+
+    req = generate_instance(seed, **config)
+    req.options = SolveOptions(**options)
+    t_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # keep the solver banners out of the report
+        result = solve_schedule(req)
+    elapsed = time.perf_counter() - t_start
+    stats = result.get("stats", {})
+    return {
+        "name": config["name"],
+        "seed": seed,
+        "config": config,
+        "tasks": sum(len(job.tasks) for job in req.jobs),
+        "status": result.get("status"),
+        "fallback": result.get("fallback", False),
+        "makespan": result.get("makespan"),
+        "tardiness": result.get("tardiness"),
+        "objective": stats.get("objective"),
+        "bestBound": stats.get("best_bound"),
+        "gap": stats.get("gap"),
+        "preprocessTime": stats.get("preprocess_time"),
+        "buildTime": stats.get("build_time"),
+        "solveTime": stats.get("solve_time"),
+        "totalTime": elapsed,
+        "numVariables": stats.get("num_variables"),
+        "numConstraints": stats.get("num_constraints"),
+        # Search effort, to compare how much propagation a model encoding gets per second
+        "branches": stats.get("branches"),
+        "conflicts": stats.get("conflicts"),
+        # ru_maxrss is in KiB on Linux
+        "peakRssMb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_suite(configs: List[Dict], seeds: List[int], options: Dict) -> List[Dict]:
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        for seed in seeds:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_instance, config, seed, options).result()
+            results.append(result)
+            print(f"{result['name']:<16} seed={seed:<3} {result['status']:<8} obj={result['objective']} "
+                  f"gap={_fmt(result['gap'], '.2%')} build={_fmt(result['buildTime'], '.3f')}s "
+                  f"solve={_fmt(result['solveTime'], '.3f')}s vars={result['numVariables']} "
+                  f"rss={result['peakRssMb']:.0f}MB", flush=True)
+    return results
+
+
+def compare(results: List[Dict], baseline: Dict):
+    """Print solve time and objective of this run against a previous results file."""
+    previous = {(r["name"], r["seed"]): r for r in baseline["results"]}
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'}:")
+    for r in results:
+        old = previous.get((r["name"], r["seed"]))
+        if old is None:
+            continue
+        print(f"{r['name']:<16} seed={r['seed']:<3} "
+              f"solve {_fmt(old['solveTime'], '.3f')}s -> {_fmt(r['solveTime'], '.3f')}s  "
+              f"build {_fmt(old['buildTime'], '.3f')}s -> {_fmt(r['buildTime'], '.3f')}s  "
+              f"objective {old['objective']} -> {r['objective']}  "
+              f"branches {old.get('branches')} -> {r.get('branches')}  "
+              f"constraints {old['numConstraints']} -> {r['numConstraints']}  "
+              f"rss {old['peakRssMb']:.0f} -> {r['peakRssMb']:.0f}MB")
+
+
+def _fmt(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_option(text: str):
+    name, _, value = text.partition("=")
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the scheduler on synthetic instances.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="small")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--time-limit", type=float, default=10.0, help="seconds per instance")
+    parser.add_argument("--profile", default="deterministic", help="solver profile")
+    parser.add_argument("--option", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra SolveOptions field, e.g. setupModel=sparse (repeatable)")
+    parser.add_argument("--output", help="results JSON file (default benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="previous results JSON file to compare against")
+    args = parser.parse_args(argv)
+
+    options = {"solverProfile": args.profile, "timeLimitSeconds": args.time_limit}
+    options.update(_parse_option(o) for o in args.option)
+    SolveOptions(**options)  # fail fast on invalid values
+
+    commit = _git_commit()
+    results = run_suite(SUITES[args.suite], args.seeds, options)
+    report = {
+        "commit": commit,
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "ortools": ortools.__version__,
+        "machine": platform.machine(),
+        "cpus": multiprocessing.cpu_count(),
+        "suite": args.suite,
+        "options": options,
+        "results": results,
+    }
+    output = args.output or f"benchmark-{commit or 'local'}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
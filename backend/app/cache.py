@@ -0,0 +1,163 @@
+from typing import Dict, Optional
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .models import SolveRequest
+
+SCHEDULE_CACHE_ENTRIES = int(os.environ.get("SCHEDULE_CACHE_ENTRIES", 256))
+SCHEDULE_CACHE_MAX_BYTES = int(os.environ.get("SCHEDULE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+SCHEDULE_CACHE_TTL = int(os.environ.get("SCHEDULE_CACHE_TTL", 3600))
+# Optional on-disk store shared across restarts (disabled when unset)
+SCHEDULE_CACHE_DIR = os.environ.get("SCHEDULE_CACHE_DIR")
+SCHEDULE_CACHE_DISK_MAX_BYTES = int(os.environ.get("SCHEDULE_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+
+
+def request_cache_key(req: SolveRequest, solver_parameters: Dict) -> str:
+    """
+    Stable hash of the canonicalized request and solver parameters.
+    Dumping through the Pydantic model fills in defaults, so omitted and explicit default
+    fields hash the same; keys are sorted so field order in the posted JSON does not matter.
+    """
+    canonical = json.dumps(
+        {"request": req.model_dump(mode="json"), "solver": solver_parameters},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ScheduleCache:
+    """
+    LRU + TTL cache of solve results, bounded by entry count and total size.
+    Results are stored as JSON bytes: their size is known and each hit returns a fresh copy.
+    """
+
+    def __init__(self, max_entries: int = SCHEDULE_CACHE_ENTRIES, max_bytes: int = SCHEDULE_CACHE_MAX_BYTES,
+                 ttl_seconds: int = SCHEDULE_CACHE_TTL, disk_dir: Optional[str] = SCHEDULE_CACHE_DIR,
+                 disk_max_bytes: int = SCHEDULE_CACHE_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.entries = collections.OrderedDict()  # key -> (stored_at, payload)
+        self.bytes = 0
+        self.stats = {"hits": 0, "diskHits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if time.time() - stored_at <= self.ttl_seconds:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return json.loads(payload)
+                self._remove(key)
+
+            payload = self._disk_get(key)
+            if payload is not None:
+                self.stats["diskHits"] += 1
+                self._put_memory(key, payload)
+                return json.loads(payload)
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, result: Dict):
+        payload = json.dumps(result, separators=(",", ":")).encode("utf-8")
+        with self.lock:
+            self.stats["stores"] += 1
+            self._put_memory(key, payload)
+            self._disk_put(key, payload)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            if self.disk_dir:
+                for name in os.listdir(self.disk_dir):
+                    if name.endswith(".json"):
+                        os.remove(os.path.join(self.disk_dir, name))
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["diskHits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hitRate": (self.stats["hits"] + self.stats["diskHits"]) / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "ttlSeconds": self.ttl_seconds,
+                "diskDir": self.disk_dir,
+            }
+
+    # --- in-memory store ---
+
+    def _remove(self, key: str):
+        _, payload = self.entries.pop(key)
+        self.bytes -= len(payload)
+
+    def _put_memory(self, key: str, payload: bytes):
+        if key in self.entries:
+            self._remove(key)
+        if len(payload) > self.max_bytes:
+            return
+        self.entries[key] = (time.time(), payload)
+        self.bytes += len(payload)
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.stats["evictions"] += 1
+
+    # --- on-disk store ---
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, payload: bytes):
+        if not self.disk_dir:
+            return
+        tmp_path = self._disk_path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self._disk_path(key))
+
+        # Size-based eviction, oldest files first
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.disk_dir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.stats["evictions"] += 1
+
+
+schedule_cache = ScheduleCache()
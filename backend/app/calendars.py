@@ -0,0 +1,370 @@
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_left, bisect_right
+import abc
+import math
+
+from .models import CalendarTemplate, ResourceAvailability, SolveRequest
+
+# Expansion grows by at least this many minutes at a time (one week)
+EXPANSION_CHUNK = 7 * 24 * 60
+
+
+class Calendar(abc.ABC):
+    """
+    Working time of one resource as sorted, merged windows (starts[k], ends[k]), expanded
+    lazily: recurring templates are only unrolled as far as a query needs, so a weekly
+    pattern costs nothing beyond the horizon actually solved. Touching windows are merged,
+    a task may run across them. Lookups are bisections on the window bounds, and prefix
+    sums of window lengths (cum[k] = working minutes before window k) answer "when is this
+    much work done" for pausable tasks.
+
+    Subclasses only provide _generate(lo, hi): the windows inside [lo, hi).
+    """
+
+    def __init__(self, end: Optional[int], repeat_after: int, period: int, reserved: List[Tuple[int, int]]):
+        # No windows at or after `end` (None: recurs forever); from repeat_after on the
+        # windows repeat every `period` minutes. Reserved time is never worked and never
+        # paused across.
+        self.reserved = merge(reserved)
+        self.reserved_starts = [s for s, _ in self.reserved]
+        self.end = end
+        self.repeat_after = repeat_after
+        self.period = max(1, period)
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.cum: List[int] = []
+        self.expanded = 0
+
+    @abc.abstractmethod
+    def _generate(self, lo: int, hi: int) -> List[Tuple[int, int]]:
+        """The windows inside [lo, hi), sorted."""
+
+    def expand(self, until: int):
+        """Make sure every window starting before `until` is known."""
+        if until <= self.expanded or (self.end is not None and self.expanded >= self.end):
+            return
+        target = max(until, self.expanded + EXPANSION_CHUNK)
+        if self.end is not None:
+            target = min(target, self.end)
+        for start, end in self._generate(self.expanded, target):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.cum.append(self.cum[-1] + self.ends[-1] - self.starts[-1] if self.starts else 0)
+                self.starts.append(start)
+                self.ends.append(end)
+        self.expanded = target
+
+    def exhausted(self) -> bool:
+        return self.end is not None and self.expanded >= self.end
+
+    def search_limit(self, t: int) -> int:
+        """No start after this is found by a query from t that was not found before it."""
+        if self.end is not None:
+            return self.end
+        return max(t, self.repeat_after) + self.period
+
+    def _window(self, k: int, until: float) -> bool:
+        """
+        Whether window k exists, expanding until its end is final (a later window is known)
+        or it reaches `until`. Expansion merges into the last window, so it may still grow.
+        """
+        while (k >= len(self.starts) - 1 and not self.exhausted() and self.expanded <= until
+               and (k >= len(self.starts) or self.ends[k] >= self.expanded)):
+            self.expand(self.expanded + 1)
+        return k < len(self.starts)
+
+    # --- queries ---
+
+    def earliest_fit(self, lo: int, hi: float, duration: int) -> Optional[int]:
+        """Earliest start in [lo, hi] with the whole task inside one window."""
+        limit = min(hi, self.search_limit(lo))
+        self.expand(lo + duration + 1)
+        k = bisect_left(self.ends, lo + duration)
+        while self._window(k, limit + duration):
+            start = max(lo, self.starts[k])
+            if start > limit:
+                return None
+            if start + duration <= self.ends[k]:
+                return start
+            k += 1
+        return None
+
+    def latest_fit(self, lo: int, hi: int, duration: int) -> Optional[int]:
+        """Latest start in [lo, hi] with the whole task inside one window."""
+        self.expand(hi + duration + 1)
+        for k in range(bisect_right(self.starts, hi) - 1, -1, -1):
+            start = min(hi, self.ends[k] - duration)
+            if start < lo:
+                if self.ends[k] < lo + duration:
+                    return None
+                continue
+            if start >= self.starts[k]:
+                return start
+        return None
+
+    def windows(self, lo: int, hi: int) -> List[Tuple[int, int]]:
+        """The windows in [lo, hi), clipped to it."""
+        self.expand(hi)
+        first = bisect_right(self.ends, lo)
+        last = bisect_left(self.starts, hi)
+        return [(max(lo, s), min(hi, e)) for s, e in zip(self.starts[first:last], self.ends[first:last])]
+
+    def worked(self, t: int) -> int:
+        """Working minutes in [0, t)."""
+        self.expand(t + 1)
+        k = bisect_right(self.starts, t) - 1
+        if k < 0:
+            return 0
+        return self.cum[k] + min(t, self.ends[k]) - self.starts[k]
+
+    def available(self, lo: int, hi: int) -> int:
+        """Working minutes in [lo, hi)."""
+        return self.worked(hi) - self.worked(lo) if hi > lo else 0
+
+    def finish(self, start: int, work: int) -> Optional[int]:
+        """
+        End of `work` minutes of pausable work started at `start`: the work stops at the end
+        of each window and resumes at the next one. None when the calendar ends first.
+        """
+        if work <= 0:
+            return start
+        target = self.worked(start) + work
+        # Growing the last window only adds work after what is already known
+        while True:
+            known = self.cum[-1] + self.ends[-1] - self.starts[-1] if self.starts else 0
+            if known >= target:
+                break
+            # A whole repetition without any working time: it never resumes
+            if self.exhausted() or (self.expanded > self.search_limit(start) and known == target - work):
+                return None
+            self.expand(self.expanded + EXPANSION_CHUNK)
+        k = bisect_left(self.cum, target) - 1
+        return self.starts[k] + target - self.cum[k]
+
+    def reserved_within(self, start: int, end: int) -> Optional[int]:
+        """End of the first reserved period beginning inside (start, end), if any."""
+        k = bisect_right(self.reserved_starts, start)
+        if k < len(self.reserved) and self.reserved_starts[k] < end:
+            return self.reserved[k][1]
+        return None
+
+    def pausable_start(self, t: int, work: int) -> Optional[int]:
+        """Earliest start >= t of pausable work that does not pause across reserved time."""
+        while True:
+            start = self.earliest_fit(t, math.inf, min(work, 1))
+            if start is None:
+                return None
+            end = self.finish(start, work)
+            if end is None:
+                return None
+            blocked_until = self.reserved_within(start, end)
+            if blocked_until is None:
+                return start
+            t = blocked_until
+
+    def pause_segments(self, lo: int, hi: int, work: int) -> Dict[int, List[Tuple[int, int]]]:
+        """
+        Starts in [lo, hi] at which pausable work can begin (while the resource is working),
+        grouped by the span (end - start) the work then takes: span -> [(first, last start)].
+        Spans only change where the end crosses a break, so there are few of them.
+        """
+        spans: Dict[int, List[Tuple[int, int]]] = {}
+        for w_start, w_end in self.windows(lo, hi + 1):
+            s = w_start
+            last = min(hi, w_end - 1)
+            while s <= last:
+                end = self.finish(s, work)
+                if end is None:
+                    return spans
+                # The span holds while the end stays inside the window it falls in
+                k = bisect_left(self.ends, end)
+                seg_end = min(last, s + self.ends[k] - end) if work > 0 else last
+                segments = spans.setdefault(end - s, [])
+                for first, last_start in self._not_across_reserved(s, seg_end, end - s):
+                    if segments and segments[-1][1] + 1 == first:
+                        segments[-1] = (segments[-1][0], last_start)
+                    else:
+                        segments.append((first, last_start))
+                s = seg_end + 1
+        return {span: segments for span, segments in spans.items() if segments}
+
+    def _not_across_reserved(self, first: int, last: int, span: int) -> List[Tuple[int, int]]:
+        """The starts in [first, last] whose span does not contain the start of reserved time."""
+        result = []
+        k = bisect_right(self.reserved_starts, first)
+        while k < len(self.reserved) and self.reserved_starts[k] < last + span and first <= last:
+            # Starts in (reserved start - span, reserved start) would run into it
+            blocked_from = self.reserved_starts[k] - span + 1
+            if blocked_from > first:
+                result.append((first, min(last, blocked_from - 1)))
+            first = max(first, self.reserved_starts[k])
+            k += 1
+        if first <= last:
+            result.append((first, last))
+        return result
+
+
+class ResourceCalendar(Calendar):
+    """
+    Calendar of one resource: its explicit intervals, plus the recurring template it refers
+    to (within the template's validity), minus its exceptions (holidays, maintenance).
+    """
+
+    def __init__(self, avail: ResourceAvailability, template: Optional[CalendarTemplate]):
+        self.intervals = sorted((i.start, i.end) for i in avail.intervals if i.end > i.start)
+        reserved = [(i.start, i.end) for i in avail.reserved if i.end > i.start]
+        self.exceptions = merge([(i.start, i.end) for i in avail.exceptions if i.end > i.start] + reserved)
+        self.template = template
+        explicit_end = max([e for _, e in self.intervals] + [0])
+        self.pattern: List[Tuple[int, int]] = []
+        if template is not None:
+            self.pattern = sorted((i.start, i.end) for i in template.intervals if i.end > i.start)
+        if self.pattern and template.validUntil is None:
+            end = None
+            repeat_after = max([explicit_end, template.validFrom] + [e for _, e in self.exceptions])
+            repeat_after += max(e for _, e in self.pattern)
+        else:
+            end = explicit_end
+            if self.pattern:
+                end = max(end, template.validUntil + max(e for _, e in self.pattern))
+            repeat_after = end
+        super().__init__(end, repeat_after, template.period if template is not None else 1, reserved)
+
+    def _generate(self, lo: int, hi: int) -> List[Tuple[int, int]]:
+        pieces = [(max(lo, s), min(hi, e)) for s, e in self.intervals if s < hi and e > lo]
+        if self.pattern:
+            template = self.template
+            first = max(lo, template.validFrom)
+            last = hi if template.validUntil is None else min(hi, template.validUntil)
+            reach = max(e for _, e in self.pattern)
+            # Occurrences are anchored at validFrom + k * period; one may spill into the next period
+            k = max(0, (lo - template.validFrom - reach) // template.period)
+            base = template.validFrom + k * template.period
+            while base < hi and (template.validUntil is None or base < template.validUntil):
+                for s, e in self.pattern:
+                    if base + e > lo and base + s < hi:
+                        pieces.append((max(lo, base + s), min(hi, base + e)))
+                base += template.period
+        return subtract(merge(pieces), self.exceptions)
+
+
+class JointCalendar(Calendar):
+    """Time when all of several resources are working (e.g. a line and its operator)."""
+
+    def __init__(self, calendars: List[Calendar]):
+        self.parts = calendars
+        ends = [c.end for c in calendars if c.end is not None]
+        period = 1
+        for c in calendars:
+            period = math.lcm(period, c.period)
+        super().__init__(min(ends) if ends else None, max(c.repeat_after for c in calendars), period,
+                         [r for c in calendars for r in c.reserved])
+
+    def _generate(self, lo: int, hi: int) -> List[Tuple[int, int]]:
+        windows = self.parts[0].windows(lo, hi)
+        for other in self.parts[1:]:
+            windows = intersect(windows, other.windows(lo, hi))
+        return windows
+
+
+def merge(windows: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(windows: List[Tuple[int, int]], blocked: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sorted merged windows minus sorted blocked intervals."""
+    result = []
+    for start, end in windows:
+        for b_start, b_end in blocked:
+            if b_end <= start or b_start >= end:
+                continue
+            if b_start > start:
+                result.append((start, b_start))
+            start = max(start, b_end)
+            if start >= end:
+                break
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def intersect(a: List[Tuple[int, int]], b: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Intersection of two sorted merged window lists."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def check_calendars(req: SolveRequest):
+    """Raise ValueError for templates that cannot be expanded or are not defined."""
+    templates = set()
+    for template in req.calendars or []:
+        if template.period <= 0:
+            raise ValueError(f"Calendar {template.id} needs a positive period")
+        templates.add(template.id)
+    for avail in req.availabilities or []:
+        if avail.calendarId is not None and avail.calendarId not in templates:
+            raise ValueError(f"Unknown calendar {avail.calendarId} for resource {avail.resourceId}")
+
+
+class CalendarSet:
+    """
+    Calendars of a request's resources, built on first use. Resources without availability
+    are always available (None). Joint calendars are cached per combination of calendars.
+    """
+
+    def __init__(self, req: SolveRequest):
+        self.templates = {template.id: template for template in req.calendars or []}
+        # First entry wins, as everywhere else
+        self.availability: Dict[str, ResourceAvailability] = {}
+        for avail in req.availabilities or []:
+            self.availability.setdefault(avail.resourceId, avail)
+        self.calendars: Dict[str, Optional[Calendar]] = {}
+        self.joint: Dict[Tuple[int, ...], Optional[Calendar]] = {}
+        self.by_key: Dict[Tuple, Calendar] = {}
+
+    def key(self, resource_id: str) -> Optional[Tuple]:
+        """Identical availabilities share a key (and a calendar)."""
+        avail = self.availability.get(resource_id)
+        if avail is None:
+            return None
+        return (tuple((i.start, i.end) for i in avail.intervals), avail.calendarId,
+                tuple((i.start, i.end) for i in avail.exceptions), tuple((i.start, i.end) for i in avail.reserved))
+
+    def get(self, resource_id: str) -> Optional[Calendar]:
+        if resource_id not in self.calendars:
+            key = self.key(resource_id)
+            if key is not None and key not in self.by_key:
+                avail = self.availability[resource_id]
+                self.by_key[key] = ResourceCalendar(avail, self.templates.get(avail.calendarId))
+            self.calendars[resource_id] = self.by_key.get(key)
+        return self.calendars[resource_id]
+
+    def joint_of(self, resource_ids: List[Optional[str]]) -> Optional[Calendar]:
+        """Working time shared by all the given resources (None when always available)."""
+        calendars = {}
+        for resource_id in resource_ids:
+            calendar = self.get(resource_id) if resource_id is not None else None
+            if calendar is not None:
+                calendars[id(calendar)] = calendar
+        key = tuple(sorted(calendars))
+        if key not in self.joint:
+            parts = [calendars[k] for k in key]
+            self.joint[key] = None if not parts else parts[0] if len(parts) == 1 else JointCalendar(parts)
+        return self.joint[key]
@@ -0,0 +1,767 @@
+from typing import Dict, List, Optional
+import collections
+import copy
+import os
+import time
+from ortools.sat.python import cp_model
+
+from .dispatch import dispatch_placements
+from .metrics import PhaseTimer
+from .models import Job, SolveOptions, SolveRequest, Task
+from .preprocess import ProblemIndex, index_previous_schedule
+from .presolve import Presolve
+
+# Readable CP-SAT names ('start_3_1', 'arc_0_2_L1'). MODEL_NAMES=0 leaves them empty: on
+# large models the name strings are a good share of the model's memory.
+MODEL_NAMES = os.environ.get("MODEL_NAMES", "1") != "0"
+# Compiled models each solver process keeps, so what-if variants of a plan skip building it
+COMPILED_MODEL_ENTRIES = int(os.environ.get("COMPILED_MODEL_ENTRIES", 2))
+# Distinct line (operator) sets the lean encoding adds a redundant cumulative for
+REDUNDANT_CUMULATIVE_SETS = 64
+
+
+class ModelChangeError(ValueError):
+    """A change the compiled model has no handle for: build a new model from the changed request."""
+
+
+class CompiledModel:
+    """
+    The CP-SAT model of a solve request, built once, with handles on its variables and
+    constraints. copy() gives a variant that shares everything but the proto; its due dates,
+    priorities, fixed starts and enabled resources can then be changed in the proto itself,
+    so what-if variants of a plan skip model building. The variant's `req` follows every
+    change, for its results and its dispatch fallback. Changes the compiled model cannot
+    express (a new due date on a job compiled without one, a start outside the task's
+    presolved bounds, a task left without a line) raise ModelChangeError.
+    """
+
+    def __init__(self, req: SolveRequest, names: bool = MODEL_NAMES):
+        options = req.options or SolveOptions()
+        t_start = time.perf_counter()
+        timer = PhaseTimer()
+        index = ProblemIndex(req)
+        pooled = options.resourceModel == 'pooled'
+        if pooled:
+            index.build_pools()
+        previous = index_previous_schedule(req.previousSchedule)
+        frozen_ids = set(options.frozenTaskIds)
+        fixed = {task_id: previous[task_id] for task_id in frozen_ids if task_id in previous}
+        # Greedy schedule: hints for tasks the previous schedule does not cover
+        dispatched = dispatch_placements(req, options.dispatchRule, index, fixed)[0] if options.warmStart else None
+        t_preprocessed = time.perf_counter()
+        timer.lap("preprocess")
+
+        model = cp_model.CpModel()
+        timer.set_model(model)
+
+        # Horizon from release dates, shifts and total work (see ProblemIndex.horizon);
+        # frozen tasks must still fit where they were and the previous and greedy schedules must stay valid hints
+        task_ids = frozen_ids | {t.id for job in req.jobs for t in job.tasks}
+        frozen_ends = [int(float(previous[t]['end'])) for t in task_ids if previous.get(t, {}).get('end') is not None]
+        dispatched_ends = [p[1] for job_placements in dispatched or [] for p in job_placements]
+        horizon = max([index.horizon(fixed)] + frozen_ends + dispatched_ends)
+
+        # Start bounds and reduced alternatives from precedence, manual starts and shifts
+        presolve = Presolve(req, index, horizon, fixed)
+        timer.lap("presolve")
+    
+        task_info = collections.defaultdict(list) # (job_id, task_idx) -> list of machine options
+        job_starts = {} # (job_id, task_idx) -> start_var
+        job_ends = {} # (job_id, task_idx) -> end_var
+        hinted_ends = {} # (job_id, task_idx) -> end in the previous or greedy schedule
+        hinted_lines = {} # (job_id, task_idx) -> (start, line) in the previous or greedy schedule
+    
+        line_to_intervals = collections.defaultdict(list)
+        setup_index = index.setup_index
+        operator_to_intervals = collections.defaultdict(list)
+        lean = options.intervalEncoding == 'lean'
+        task_intervals = {} # (job_id, task_idx) -> the task's own interval (lean encoding)
+        # Presence of the only alternative of a task in the lean encoding, hinted once here so
+        # the hint stays complete without repeating it for every task
+        always = model.new_constant(1) if lean else None
+        if lean:
+            model.add_hint(always, 1)
+    
+        for job_idx, job in enumerate(req.jobs):
+            for t_idx, task in enumerate(job.tasks):
+                suffix = f"_{job_idx}_{t_idx}" if names else ""
+            
+                # Global start/end for the task, within its presolved bounds
+                duration = index.durations[job_idx][t_idx]
+                est, lst = presolve.start_bounds(job_idx, t_idx, horizon)
+                start_var = model.new_int_var(est, lst, f"start{suffix}" if names else "")
+                if task.pausable:
+                    # Span = working time plus the breaks it waits out, fixed by add_pausable_span
+                    size = model.new_int_var(duration, max(duration, horizon - est), f"span{suffix}" if names else "")
+                    end_var = model.new_int_var(min(est + duration, horizon), horizon, f"end{suffix}" if names else "")
+                    model.add(end_var == start_var + size)
+                else:
+                    size = duration
+                    end_var = model.new_int_var(min(est + duration, horizon), min(lst + duration, horizon), f"end{suffix}" if names else "")
+            
+                # --- MANUAL OVERRIDE LOGIC ---
+                # Pinned tasks already have a single-value domain
+                if task.manualStart is not None and not presolve.is_pinned(job_idx, t_idx):
+                    model.add(start_var == task.manualStart)
+            
+                job_starts[job_idx, t_idx] = start_var
+                job_ends[job_idx, t_idx] = end_var
+
+                if lean:
+                    # The task's own interval links start, size and end once (see optional_alternative)
+                    task_intervals[job_idx, t_idx] = model.new_interval_var(start_var, size, end_var, f"interval{suffix}" if names else "")
+
+            
+                # --- MACHINE ASSIGNMENT ---
+                machine_options = []
+                for line_id in presolve.lines[job_idx, t_idx]:
+                    alt_suffix = f"{suffix}_{index.line_index[line_id]}" if names else ""
+                    if lean and len(presolve.lines[job_idx, t_idx]) == 1:
+                        l_presence, l_interval = always, task_intervals[job_idx, t_idx]
+                    else:
+                        l_presence = model.new_bool_var(f"presence_line{alt_suffix}" if names else "")
+                        l_interval = optional_alternative(model, start_var, size, end_var, l_presence, lean,
+                                                          f"interval_line{alt_suffix}" if names else "")
+                
+                    machine_options.append((line_id, l_presence))
+                    line_to_intervals[line_id].append({
+                        'interval': l_interval,
+                        'presence': l_presence,
+                        'job_id': job.id,
+                        'family': job.setupFamily or job.id,
+                        'start': start_var,
+                        'end': end_var,
+                        'task': (job_idx, t_idx)
+                    })
+
+                if len(machine_options) > 1 or (machine_options and not lean):
+                    model.add_exactly_one([opt[1] for opt in machine_options])
+            
+                # --- OPERATOR ASSIGNMENT ---
+                op_options = []
+                for op_id in presolve.operators[job_idx, t_idx]:
+                    alt_op_suffix = f"{suffix}_{index.operator_index[op_id]}" if names else ""
+                    if lean and len(presolve.operators[job_idx, t_idx]) == 1:
+                        op_presence, op_interval = always, task_intervals[job_idx, t_idx]
+                    else:
+                        op_presence = model.new_bool_var(f"presence_op{alt_op_suffix}" if names else "")
+                        op_interval = optional_alternative(model, start_var, size, end_var, op_presence, lean,
+                                                           f"interval_op{alt_op_suffix}" if names else "")
+                
+                    op_options.append((op_id, op_presence))
+                    operator_to_intervals[op_id].append(op_interval)
+            
+                if len(op_options) > 1 or (op_options and not lean):
+                    model.add_exactly_one([opt[1] for opt in op_options])
+            
+                task_info[job_idx, t_idx] = {
+                    'lines': machine_options,
+                    'operators': op_options
+                }
+
+                # --- SHIFTS / AVAILABILITIES ---
+                timer.lap("variables")
+                if task.pausable:
+                    add_pausable_span(model, index, start_var, size, machine_options, op_options, est, lst, duration)
+                else:
+                    add_calendar_domains(model, index, start_var, (machine_options, op_options), est, lst, duration)
+                timer.lap("availability")
+
+                # --- WARM START / FREEZE FROM PREVIOUS SCHEDULE ---
+                prev = previous.get(task.id)
+                frozen = prev is not None and task.id in frozen_ids and task.manualStart is None
+                if prev is None and dispatched is not None:
+                    start, end, line_id, op_id = dispatched[job_idx][t_idx]
+                    prev = {'start': start, 'end': end, 'line': line_id, 'operator': op_id}
+                if prev is not None:
+                    if pooled:
+                        prev = dict(prev, line=index.pool(prev.get('line')), operator=index.pool(prev.get('operator')))
+                    apply_previous_placement(model, prev, start_var, end_var, machine_options, op_options, frozen, always)
+                    if prev.get('end') is not None:
+                        hinted_ends[job_idx, t_idx] = int(float(prev['end']))
+                    hinted_lines[job_idx, t_idx] = (int(float(prev['start'])), prev.get('line'))
+
+        timer.lap("variables")
+
+        # --- RESOURCE CAPACITY ---
+        # Shifts are already in the start domains: the no-overlap only holds the tasks
+        def add_capacity(resource_id, all_intervals):
+            capacity = index.pool_capacity(resource_id)
+            if capacity == 1:
+                model.add_no_overlap(all_intervals)
+            else:
+                # Pool of identical resources: each task takes one unit
+                model.add_cumulative(all_intervals, [1] * len(all_intervals), capacity)
+            timer.lap("no_overlap")
+
+        # Constraint: No overlap on lines (including shifts and setup times)
+        for line_id, data_list in line_to_intervals.items():
+            intervals = [d['interval'] for d in data_list]
+        
+            add_capacity(line_id, intervals)
+            
+            # Apply setup times if any
+            if line_id in index.lines_with_setups:
+                if options.setupModel == 'sparse':
+                    add_sparse_setups(model, line_id, data_list, setup_index, names)
+                elif options.setupModel == 'family':
+                    add_family_setup_circuit(model, line_id, data_list, setup_index, horizon, names)
+                else:
+                    add_setup_circuit(model, line_id, data_list, setup_index, hinted_lines, names)
+                timer.lap(f"setups_{options.setupModel}")
+
+        # Constraint: No overlap for operators
+        for op_id, intervals in operator_to_intervals.items():
+            add_capacity(op_id, intervals)
+
+        if lean:
+            for kind in (presolve.lines, presolve.operators):
+                add_redundant_cumulatives(model, index, task_intervals, kind)
+            timer.lap("redundant_cumulative")
+
+        # Constraint: Precedence in jobs (Strict sequence)
+        for job_idx, job in enumerate(req.jobs):
+            for t_idx in range(len(job.tasks) - 1):
+                model.add(job_starts[job_idx, t_idx + 1] >= job_ends[job_idx, t_idx])
+        timer.lap("precedence")
+
+        # --- SME Specific Objectives ---
+        # 1. Total Makespan
+        makespan = model.new_int_var(0, horizon, "makespan" if names else "")
+        if req.jobs:
+            job_ends_vars = []
+            for j_idx, job in enumerate(req.jobs):
+                if job.tasks:
+                     job_ends_vars.append(job_ends[j_idx, len(job.tasks)-1])
+            if job_ends_vars:
+                model.add_max_equality(makespan, job_ends_vars)
+    
+        # 2. Tardiness
+        total_weighted_tardiness = model.new_int_var(0, horizon * 10000, "tardiness" if names else "") # Increased bounds
+        job_tardiness_vars = []
+        job_tardiness = {} # job_idx -> (tardiness, weighted tardiness, due date and weight constraint indices)
+        hinted_tardiness = 0
+    
+        for job_idx, job in enumerate(req.jobs):
+            if not job.tasks: continue
+            if job.dueDate is None: continue  # No deadline = no tardiness penalty
+            finish_time = job_ends[job_idx, len(job.tasks) - 1]
+            tardiness = model.new_int_var(0, horizon, f"tardiness_j{job_idx}" if names else "")
+        
+            # tardiness >= finish - due
+            # tardiness >= 0
+            due = model.add(tardiness >= finish_time - job.dueDate)
+            model.add(tardiness >= 0)
+        
+            weighted_tardiness = model.new_int_var(0, horizon * 100, f"weighted_tardiness_j{job_idx}" if names else "")
+            weighting = model.add(weighted_tardiness == tardiness * job.priority)
+            job_tardiness_vars.append(weighted_tardiness)
+            job_tardiness[job_idx] = (tardiness, weighted_tardiness, due.index, weighting.index)
+            if (job_idx, len(job.tasks) - 1) in hinted_ends:
+                late = max(0, hinted_ends[job_idx, len(job.tasks) - 1] - job.dueDate)
+                model.add_hint(tardiness, late)
+                model.add_hint(weighted_tardiness, late * job.priority)
+                hinted_tardiness += late * job.priority
+        
+        if job_tardiness_vars:
+            model.add(total_weighted_tardiness == sum(job_tardiness_vars))
+        else:
+            model.add(total_weighted_tardiness == 0)
+        # With every task hinted the objective can be hinted too: CP-SAT then checks the complete
+        # hint first instead of only steering its search with it
+        if len(hinted_ends) == len(job_ends):
+            model.add_hint(makespan, max(hinted_ends.values(), default=0))
+            model.add_hint(total_weighted_tardiness, hinted_tardiness)
+
+        # Objective: Minimize Weighted Tardiness (Primary) + Makespan (Secondary) + StartTimes (Tertiary/Tie-Breaker)
+        # Scaled to prioritize tardiness
+        # Adding 'start_vars' sum helps compact the schedule to the left, reducing "floating" tasks and stabilizing results.
+        all_start_ints = []
+        for job_idx, job in enumerate(req.jobs):
+             for t_idx in range(len(job.tasks)):
+                 all_start_ints.append(job_starts[job_idx, t_idx])
+    
+        model.minimize(total_weighted_tardiness * 10000 + makespan * 100 + sum(all_start_ints))
+        timer.lap("objective")
+
+        self.req = req
+        self.compiled_req = req
+        self.options = options
+        self.index = index
+        self.pooled = pooled
+        self.fixed = fixed
+        self.horizon = horizon
+        self.presolve = presolve
+        self.model = model
+        self.timer = timer
+        self.task_info = task_info
+        self.job_starts = job_starts
+        self.job_ends = job_ends
+        self.job_tardiness = job_tardiness
+        self.makespan = makespan
+        self.total_weighted_tardiness = total_weighted_tardiness
+        self.job_index = {job.id: job_idx for job_idx, job in enumerate(req.jobs)}
+        self.task_index = {task.id: (job_idx, t_idx) for job_idx, job in enumerate(req.jobs)
+                           for t_idx, task in enumerate(job.tasks)}
+        self.disabled = set()
+        self.reused = False
+        self.t_start = t_start
+        self.t_preprocessed = t_preprocessed
+        self.t_built = time.perf_counter()
+
+    # --- variants ---
+
+    def copy(self) -> 'CompiledModel':
+        """A variant to change: a copy of the proto sharing the indexes, bounds and handles."""
+        variant = copy.copy(self)
+        variant.t_start = variant.t_preprocessed = time.perf_counter()
+        variant.model = self.model.clone()
+        variant.timer = PhaseTimer()
+        variant.timer.set_model(variant.model)
+        variant.fixed = dict(self.fixed)
+        variant.disabled = set(self.disabled)
+        variant.reused = True
+        variant.timer.lap("copy")
+        variant.t_built = time.perf_counter()
+        return variant
+
+    def set_due_date(self, job_id: str, due_date: Optional[int]):
+        job_idx = self._job(job_id)
+        if job_idx not in self.job_tardiness:
+            if due_date is None:
+                return
+            raise ModelChangeError(f"Job {job_id} was compiled without a due date")
+        _, _, due, _ = self.job_tardiness[job_idx]
+        # tardiness - end >= -due; with no due date any tardiness is allowed and 0 is cheapest
+        lower = cp_model.INT_MIN if due_date is None else -due_date
+        self.model.proto.constraints[due].linear.domain[:] = [lower, cp_model.INT_MAX]
+        self._update_job(job_idx, dueDate=due_date)
+
+    def set_priority(self, job_id: str, priority: int):
+        job_idx = self._job(job_id)
+        if job_idx in self.job_tardiness:
+            # weighted - priority * tardiness == 0
+            tardiness, _, _, weighting = self.job_tardiness[job_idx]
+            linear = self.model.proto.constraints[weighting].linear
+            linear.coeffs[list(linear.vars).index(tardiness.index)] = -priority
+        self._update_job(job_idx, priority=priority)
+
+    def fix_start(self, task_id: str, start: int):
+        """Set a manual start, as Task.manualStart does."""
+        job_idx, t_idx = self._task(task_id)
+        self._pin_start(task_id, job_idx, t_idx, start)
+        job = self.req.jobs[job_idx]
+        tasks = list(job.tasks)
+        tasks[t_idx] = tasks[t_idx].model_copy(update={'manualStart': start})
+        self._update_job(job_idx, tasks=tasks)
+
+    def freeze(self, task_id: str, placement: Dict):
+        """Pin a task to a placement of the previous schedule, as SolveOptions.frozenTaskIds does."""
+        job_idx, t_idx = self._task(task_id)
+        if self.req.jobs[job_idx].tasks[t_idx].manualStart is not None:
+            return  # manual starts win over frozen placements
+        self._pin_start(task_id, job_idx, t_idx, int(float(placement['start'])))
+        info = self.task_info[job_idx, t_idx]
+        for key, options in (('line', info['lines']), ('operator', info['operators'])):
+            chosen = self.index.pool(placement.get(key)) if self.pooled else placement.get(key)
+            if any(res_id == chosen for res_id, _ in options):
+                for res_id, presence in options:
+                    if res_id == chosen:
+                        self.model.proto.variables[presence.index].domain[:] = [1, 1]
+        self.fixed[task_id] = placement
+
+    def set_resource_enabled(self, resource_id: str, enabled: bool):
+        """Take a line or operator out of the plan (or back in), as removing it from the request does."""
+        if self.pooled:
+            raise ModelChangeError("Pooled resources share capacity: build a new model to change them")
+        if enabled == (resource_id not in self.disabled):
+            return
+        if enabled and resource_id not in set(self.index.line_ids) | set(self.index.operator_ids):
+            raise ModelChangeError(f"Resource {resource_id} is not in the compiled model")
+        for (job_idx, t_idx), info in self.task_info.items():
+            for key in ('lines', 'operators'):
+                options = info[key]
+                if not any(res_id == resource_id for res_id, _ in options):
+                    continue
+                if not enabled and all(res_id == resource_id or res_id in self.disabled for res_id, _ in options):
+                    raise ModelChangeError(
+                        f"Task {self.req.jobs[job_idx].tasks[t_idx].id} has no other {key[:-1]} than {resource_id}")
+                for res_id, presence in options:
+                    if res_id == resource_id:
+                        self.model.proto.variables[presence.index].domain[:] = [0, 1] if enabled else [0, 0]
+        if enabled:
+            self.disabled.discard(resource_id)
+        else:
+            self.disabled.add(resource_id)
+        self._sync_resources()
+
+    def _job(self, job_id: str) -> int:
+        if job_id not in self.job_index:
+            raise ModelChangeError(f"Job {job_id} is not in the compiled model")
+        return self.job_index[job_id]
+
+    def _task(self, task_id: str):
+        if task_id not in self.task_index:
+            raise ModelChangeError(f"Task {task_id} is not in the compiled model")
+        return self.task_index[task_id]
+
+    def _pin_start(self, task_id: str, job_idx: int, t_idx: int, start: int):
+        compiled_start = self.compiled_req.jobs[job_idx].tasks[t_idx].manualStart
+        if compiled_start is not None and compiled_start != start:
+            # Other tasks' presolved bounds were derived from the compiled manual start
+            raise ModelChangeError(f"Task {task_id} was compiled with manual start {compiled_start}")
+        variable = self.model.proto.variables[self.job_starts[job_idx, t_idx].index]
+        if not cp_model.Domain.from_flat_intervals(list(variable.domain)).contains(start):
+            raise ModelChangeError(f"Start {start} of task {task_id} is outside its compiled bounds")
+        variable.domain[:] = [start, start]
+
+    def _update_job(self, job_idx: int, **fields):
+        jobs = list(self.req.jobs)
+        jobs[job_idx] = jobs[job_idx].model_copy(update=fields)
+        self.req = self.req.model_copy(update={'jobs': jobs})
+
+    def _sync_resources(self):
+        """Lines, operators and eligible lines of `req` without the disabled resources."""
+        base = self.compiled_req
+        jobs = list(self.req.jobs)
+        for job_idx, job in enumerate(jobs):
+            tasks = list(job.tasks)
+            for t_idx, task in enumerate(tasks):
+                eligible = [l for l in base.jobs[job_idx].tasks[t_idx].eligibleLines if l not in self.disabled]
+                if eligible != task.eligibleLines:
+                    tasks[t_idx] = task.model_copy(update={'eligibleLines': eligible})
+            if tasks != job.tasks:
+                jobs[job_idx] = job.model_copy(update={'tasks': tasks})
+        self.req = self.req.model_copy(update={
+            'jobs': jobs,
+            'lines': [line for line in base.lines if line.id not in self.disabled],
+            'operators': [op for op in base.operators if op.id not in self.disabled],
+        })
+
+    # --- results ---
+
+    def read_results(self, values) -> List[Dict]:
+        """Result jobs from the solver, or from a solution callback during the search."""
+        results = []
+        for job_idx, job in enumerate(self.req.jobs):
+            res_job = {"id": job.id, "name": job.name, "tasks": [], "color": job.color}
+            for t_idx, task in enumerate(job.tasks):
+                start_val = values.value(self.job_starts[job_idx, t_idx])
+                end_val = values.value(self.job_ends[job_idx, t_idx])
+                
+                info = self.task_info[job_idx, t_idx]
+                
+                line_id = "Unknown"
+                for l_id, l_presence in info['lines']:
+                    if values.boolean_value(l_presence):
+                        line_id = l_id
+                        break
+                
+                op_id = "None"
+                for o_id, o_presence in info['operators']:
+                    if values.boolean_value(o_presence):
+                        op_id = o_id
+                        break
+                
+                res_job["tasks"].append(result_task(job, task, start_val, end_val, line_id, op_id))
+            results.append(res_job)
+
+        if self.pooled:
+            assign_pool_members(self.index, [t for job in results for t in job["tasks"]])
+        return results
+
+
+_compiled_models: Dict[str, CompiledModel] = collections.OrderedDict()
+
+
+def compiled_model(req: SolveRequest, key: str) -> CompiledModel:
+    """The compiled model of `req`, kept in this process under `key` (e.g. the request's content hash)."""
+    compiled = _compiled_models.get(key)
+    if compiled is None:
+        compiled = CompiledModel(req)
+        _compiled_models[key] = compiled
+        while len(_compiled_models) > COMPILED_MODEL_ENTRIES:
+            _compiled_models.popitem(last=False)
+    _compiled_models.move_to_end(key)
+    return compiled
+
+
+def result_task(job: Job, task: Task, start: int, end: int, line_id: str, op_id: str) -> Dict:
+    """One scheduled task in the /solve response format."""
+    return {
+        "id": task.id,
+        "name": task.name,
+        "start": start,
+        "end": end,
+        "duration": task.duration,
+        "color": job.color,
+        "line": line_id,
+        "operator": op_id,
+        "priority": job.priority,
+        "dueDate": job.dueDate,
+        "manualStart": task.manualStart
+    }
+
+
+def assign_pool_members(index: ProblemIndex, tasks: List[Dict]):
+    """
+    Post-pass for pooled solves: replace each pool id with a concrete line/operator.
+    The cumulative constraint guarantees at most 'capacity' overlapping tasks per pool,
+    so greedy interval colouring in start order always finds a free member.
+    """
+    for key in ('line', 'operator'):
+        by_pool = collections.defaultdict(list)
+        for task in tasks:
+            if index.pool_capacity(task[key]) > 1:
+                by_pool[task[key]].append(task)
+        for pool_id, pool_tasks in by_pool.items():
+            free_at = {member: 0 for member in index.pool_members[pool_id]}
+            for task in sorted(pool_tasks, key=lambda t: (t["start"], t["end"])):
+                member = min(free_at, key=lambda m: (free_at[m] > task["start"], free_at[m]))
+                free_at[member] = task["end"]
+                task[key] = member
+
+
+def apply_previous_placement(model, prev, start_var, end_var, machine_options, op_options, frozen, always):
+    """Hint a task to where it sat in the previous schedule, or pin it there when frozen."""
+    start = int(float(prev['start']))
+    if frozen:
+        model.add(start_var == start)
+    else:
+        model.add_hint(start_var, start)
+        if prev.get('end') is not None:
+            model.add_hint(end_var, int(float(prev['end'])))
+
+    for key, options in (('line', machine_options), ('operator', op_options)):
+        chosen = prev.get(key)
+        if not any(res_id == chosen for res_id, _ in options):
+            continue  # resource removed or no longer eligible: let the solver re-assign
+        for res_id, presence in options:
+            if frozen:
+                if res_id == chosen:
+                    model.add(presence == 1)
+            elif presence is not always:
+                model.add_hint(presence, int(res_id == chosen))
+
+
+def optional_alternative(model, start_var, size, end_var, presence, lean: bool, name: str):
+    """
+    Optional interval of a task on one line or operator. An interval from start, size and end
+    variables enforces start + size == end under its presence literal; in the lean encoding
+    the task's own interval already does that, so a fixed-size alternative is just an offset
+    of the start, without a constraint of its own.
+    """
+    if lean and isinstance(size, int):
+        return model.new_optional_fixed_size_interval_var(start_var, size, presence, name)
+    return model.new_optional_interval_var(start_var, size, end_var, presence, name)
+
+
+def add_redundant_cumulatives(model, index: ProblemIndex, task_intervals: Dict, choices: Dict):
+    """
+    Lean encoding: no more tasks run at once than the resources they can use between them.
+    For each set of lines (or operators) that tasks choose from, a cumulative over the tasks
+    restricted to that set, of its size, plus one over every task. Each is implied by the
+    no-overlaps on the members, but CP-SAT propagates it on the task intervals before any
+    alternative is picked. Beyond REDUNDANT_CUMULATIVE_SETS distinct sets only the one over
+    every task is added.
+    """
+    by_set = collections.defaultdict(list)  # resource set -> tasks choosing from exactly that set
+    for task, resource_ids in choices.items():
+        if resource_ids:
+            by_set[frozenset(resource_ids)].append(task)
+    candidates = [frozenset().union(*by_set)] if by_set else []
+    if len(by_set) <= REDUNDANT_CUMULATIVE_SETS:
+        candidates += [resource_set for resource_set in by_set if len(resource_set) > 1]
+    for resource_set in dict.fromkeys(candidates):
+        tasks = [task for chosen, members in by_set.items() if chosen <= resource_set for task in members]
+        capacity = sum(index.pool_capacity(res_id) for res_id in resource_set)
+        if len(tasks) > capacity:
+            model.add_cumulative([task_intervals[task] for task in tasks], [1] * len(tasks), capacity)
+
+
+def add_calendar_domains(model, index: ProblemIndex, start_var, option_kinds, est: int, lst: int, duration: int):
+    """
+    Keep a task inside one shift window of the line and of the operator it runs on, through
+    its start domain: the start must fit the shifts of at least one line and one operator,
+    and an alternative whose shifts allow fewer starts than that only when it is chosen.
+    Only the windows between the task's bounds are looked at.
+    """
+    domain = cp_model.Domain(est, lst)
+    reified = []
+    for options in option_kinds:
+        if not options:
+            continue
+        starts_by_calendar = {}
+        starts_of = []
+        for res_id, presence in options:
+            calendar = index.calendar_for(res_id)
+            if id(calendar) not in starts_by_calendar:
+                if calendar is None:
+                    starts = [est, lst]
+                else:
+                    starts = [bound for s, e in calendar.windows(est, lst + duration) if max(s, est) <= min(e - duration, lst)
+                              for bound in (max(s, est), min(e - duration, lst))]
+                starts_by_calendar[id(calendar)] = starts
+            starts_of.append(starts_by_calendar[id(calendar)])
+        union = cp_model.Domain.from_flat_intervals([])
+        for starts in starts_by_calendar.values():
+            union = union.union_with(cp_model.Domain.from_flat_intervals(starts))
+        domain = domain.intersection_with(union)
+        union = union.flattened_intervals()
+        reified += [(presence, starts) for (_, presence), starts in zip(options, starts_of) if starts != union]
+    if domain.flattened_intervals() != [est, lst]:
+        model.add_linear_expression_in_domain(start_var, domain)
+    for presence, starts in reified:
+        if not starts:
+            model.add(presence == 0)
+        else:
+            model.add_linear_expression_in_domain(start_var, cp_model.Domain.from_flat_intervals(starts)).only_enforce_if(presence)
+
+
+def add_pausable_span(model, index: ProblemIndex, start_var, span_var, machine_options, op_options,
+                      est: int, lst: int, duration: int):
+    """
+    Span of a pausable task: it may start in any minute its line and operator both work, and
+    its span is the working time plus the breaks they share until it is done. Starts that
+    give the same span are grouped, so there is one literal per distinct span (breaks it
+    crosses), per combination of line and operator calendars, rather than one per gap.
+    """
+    def by_calendar(options):
+        groups = {}
+        for res_id, presence in options:
+            calendar = index.calendar_for(res_id)
+            groups.setdefault(id(calendar), (res_id, []))[1].append(presence)
+        return list(groups.values()) or [(None, [])]
+
+    line_groups = by_calendar(machine_options)
+    op_groups = by_calendar(op_options)
+    for line_id, line_presences in line_groups:
+        for op_id, op_presences in op_groups:
+            if len(line_groups) == 1 and len(op_groups) == 1:
+                chosen = 1
+            else:
+                # Both the line and the operator are from these calendar groups
+                chosen = model.new_bool_var("")
+                picked = [sum(presences) for presences in (line_presences, op_presences) if presences]
+                for group in picked:
+                    model.add(chosen <= group)
+                model.add(chosen >= sum(picked) - (len(picked) - 1))
+            calendar = index.calendars.joint_of([line_id, op_id])
+            spans = calendar.pause_segments(est, lst, duration) if calendar is not None else {duration: [(est, lst)]}
+            literals = []
+            for span, segments in spans.items():
+                literal = model.new_bool_var("")
+                model.add_linear_expression_in_domain(
+                    start_var, cp_model.Domain.from_intervals([list(seg) for seg in segments])
+                ).only_enforce_if(literal)
+                model.add(span_var == span).only_enforce_if(literal)
+                literals.append(literal)
+            model.add(sum(literals) == chosen)
+
+
+def add_setup_circuit(model, line_id, data_list, setup_index, hinted_lines=None, names=True):
+    """
+    Exact sequencing on a line: one circuit node per task, arc i->j means j directly follows i.
+    When every task has a hinted start and line, the arcs of that sequence are hinted too.
+    """
+    num_tasks = len(data_list)
+    depot = num_tasks
+    arcs = []
+    for i in range(num_tasks):
+        presence_i = data_list[i]['presence']
+
+        # Depot -> i and i -> Depot
+        arcs.append((depot, i, model.new_bool_var(f"arc_depot_{i}_{line_id}" if names else "")))
+        arcs.append((i, depot, model.new_bool_var(f"arc_{i}_depot_{line_id}" if names else "")))
+
+        # i -> i (if not present)
+        arcs.append((i, i, presence_i.Not()))
+
+        for j in range(num_tasks):
+            if i == j: continue
+            lit_ij = model.new_bool_var(f"arc_{i}_{j}_{line_id}" if names else "")
+            arcs.append((i, j, lit_ij))
+            # The arc must also order the tasks in time, even with no setup,
+            # otherwise the solver can pick a circuit that dodges the real setups.
+            setup = setup_index.get((line_id, data_list[i]['job_id'], data_list[j]['job_id']), 0)
+            model.add(data_list[i]['end'] + setup <= data_list[j]['start']).only_enforce_if(lit_ij)
+
+    # Depot -> Depot: the line may end up with no task at all
+    arcs.append((depot, depot, model.new_bool_var(f"arc_depot_depot_{line_id}" if names else "")))
+    model.add_circuit(arcs)
+
+    if hinted_lines and all(d['task'] in hinted_lines for d in data_list):
+        order = [depot] + [i for _, i in sorted((hinted_lines[d['task']][0], i) for i, d in enumerate(data_list)
+                                                if hinted_lines[d['task']][1] == line_id)] + [depot]
+        follows = set(zip(order, order[1:]))
+        for i, j, literal in arcs:
+            if i != j or i == depot:
+                model.add_hint(literal, int((i, j) in follows))
+
+
+def add_sparse_setups(model, line_id, data_list, setup_index, names=True):
+    """
+    Only pairs of tasks whose jobs have a setup entry get an ordering literal; the line's
+    no-overlap handles everything else. Setups apply between any two ordered tasks, not only
+    direct successors, which is exact when setup times satisfy the triangle inequality.
+    """
+    for i in range(len(data_list)):
+        for j in range(i + 1, len(data_list)):
+            a, b = data_list[i], data_list[j]
+            setup_ab = setup_index.get((line_id, a['job_id'], b['job_id']), 0)
+            setup_ba = setup_index.get((line_id, b['job_id'], a['job_id']), 0)
+            if not setup_ab and not setup_ba:
+                continue
+            both = [a['presence'], b['presence']]
+            a_first = model.new_bool_var(f"order_{i}_{j}_{line_id}" if names else "")
+            model.add(a['end'] + setup_ab <= b['start']).only_enforce_if(both + [a_first])
+            model.add(b['end'] + setup_ba <= a['start']).only_enforce_if(both + [a_first.Not()])
+
+
+def add_family_setup_circuit(model, line_id, data_list, setup_index, horizon, names=True):
+    """
+    Circuit over setup families instead of tasks: the tasks of a family run as one block on the
+    line and setups apply between blocks, so the circuit grows with families, not tasks.
+    The setup between two families is the largest setup between any of their jobs.
+    """
+    families = collections.defaultdict(list)
+    for d in data_list:
+        families[d['family']].append(d)
+    family_ids = list(families)
+    family_jobs = {f: {d['job_id'] for d in families[f]} for f in family_ids}
+
+    if len(family_ids) < 2:
+        return
+
+    block_start, block_end, block_present = [], [], []
+    for k, f in enumerate(family_ids):
+        present = model.new_bool_var(f"family_present_{k}_{line_id}" if names else "")
+        model.add_max_equality(present, [d['presence'] for d in families[f]])
+        start = model.new_int_var(0, horizon, f"family_start_{k}_{line_id}" if names else "")
+        end = model.new_int_var(0, horizon, f"family_end_{k}_{line_id}" if names else "")
+        for d in families[f]:
+            model.add(start <= d['start']).only_enforce_if(d['presence'])
+            model.add(d['end'] <= end).only_enforce_if(d['presence'])
+        block_start.append(start)
+        block_end.append(end)
+        block_present.append(present)
+
+    num_families = len(family_ids)
+    depot = num_families
+    arcs = []
+    for i, f in enumerate(family_ids):
+        arcs.append((depot, i, model.new_bool_var(f"family_arc_depot_{i}_{line_id}" if names else "")))
+        arcs.append((i, depot, model.new_bool_var(f"family_arc_{i}_depot_{line_id}" if names else "")))
+        arcs.append((i, i, block_present[i].Not()))
+        for j, g in enumerate(family_ids):
+            if i == j: continue
+            lit_ij = model.new_bool_var(f"family_arc_{i}_{j}_{line_id}" if names else "")
+            arcs.append((i, j, lit_ij))
+            setup = max(
+                (setup_index.get((line_id, a, b), 0) for a in family_jobs[f] for b in family_jobs[g]),
+                default=0
+            )
+            model.add(block_end[i] + setup <= block_start[j]).only_enforce_if(lit_ij)
+
+    arcs.append((depot, depot, model.new_bool_var(f"family_arc_depot_depot_{line_id}" if names else "")))
+    model.add_circuit(arcs)
@@ -0,0 +1,539 @@
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import collections
+import math
+import multiprocessing
+import time
+from ortools.sat.python import cp_model
+
+from .compiler import CompiledModel, add_calendar_domains, add_setup_circuit
+from .dispatch import dispatch_placements, dispatch_schedule
+from .lns import schedule_objective
+from .models import AvailabilityInterval, Job, ResourceAvailability, SolveOptions, SolveRequest
+from .metrics import merge_phases
+from .preprocess import ProblemIndex, index_previous_schedule
+from .profiles import HIERARCHICAL_PROCESSES, hierarchical_processes, resolve_solver_profile
+from .solver import solve_compiled, solve_schedule
+
+# Due-date thresholds the line assignment checks each line's load against
+HIERARCHICAL_DUE_BUCKETS = 8
+
+_line_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_line_pool() -> ProcessPoolExecutor:
+    """The processes this solver worker sequences lines in, started on its first hierarchical solve."""
+    global _line_pool
+    if _line_pool is None:
+        # Separate processes: building the models is Python and would hold the GIL on threads
+        _line_pool = ProcessPoolExecutor(max_workers=HIERARCHICAL_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _line_pool
+
+
+def _submit_line(*args) -> Future:
+    global _line_pool
+    try:
+        return get_line_pool().submit(sequence_line, *args)
+    except BrokenProcessPool:
+        # A line process died (e.g. killed for memory): start a fresh pool and retry once
+        _line_pool.shutdown(wait=False)
+        _line_pool = None
+        return get_line_pool().submit(sequence_line, *args)
+
+
+def _line_result(future: Future) -> Dict:
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        return {'status': 'error'}  # the line keeps its greedy order
+
+
+def _job_order_key(job_idx: int, job: Job):
+    """Windows follow the backlog in release order, then due date."""
+    release = min((t.manualStart for t in job.tasks if t.manualStart is not None), default=0)
+    due = job.dueDate if job.dueDate is not None else math.inf
+    return (release, due, job_idx)
+
+
+def _subtract(windows: List[Tuple[int, int]], busy: List[Tuple[int, int]], min_hole: int) -> List[Tuple[int, int]]:
+    """Availability windows minus committed busy intervals, dropping holes no remaining task fits in."""
+    busy = sorted(busy)
+    free = []
+    for w_start, w_end in sorted(windows):
+        cursor = w_start
+        for b_start, b_end in busy:
+            if b_end <= cursor or b_start >= w_end:
+                continue
+            if b_start - cursor >= min_hole:
+                free.append((cursor, b_start))
+            cursor = max(cursor, b_end)
+        if w_end - cursor >= min_hole:
+            free.append((cursor, w_end))
+    return free
+
+
+def solve_rolling_horizon(req: SolveRequest, parameters: Optional[Dict] = None) -> Dict:
+    """
+    Solve a long plan as a sequence of overlapping windows of jobs.
+
+    Each window solves its jobs plus a lookahead of the next ones, then commits only its own
+    jobs. Committed tasks are carried into later windows as blocked time on their line and
+    operator. The last committed task of every line stays in the model, frozen, so setups
+    into the next job are still counted. On lines with setups nothing may be inserted
+    before that last task. Every window gets the same time budget, so solve time grows
+    linearly with the number of jobs.
+    """
+    t_start = time.perf_counter()
+    options = req.options or SolveOptions()
+    index = ProblemIndex(req)
+    open_end = 2 * index.horizon()
+    window_size = max(1, options.rollingWindowJobs)
+    window_options = options.model_copy(update={'decomposition': 'none', 'frozenTaskIds': []})
+    window_parameters = {**(parameters or {}), 'max_time_in_seconds': options.rollingWindowSeconds}
+
+    order = sorted(range(len(req.jobs)), key=lambda j: _job_order_key(j, req.jobs[j]))
+    committed = {}  # job_idx -> result job dict
+    busy = collections.defaultdict(list)  # resource id -> [(start, end, task id)]
+    last_on_line = {}  # line id -> (job, task, result task)
+    logs = []
+    window_stats = []
+
+    for w_from in range(0, len(order), window_size):
+        window = order[w_from:w_from + window_size]
+        lookahead = order[w_from + window_size:w_from + window_size + options.rollingOverlapJobs]
+        remaining = [t for j in order[w_from:] for t in req.jobs[j].tasks]
+        min_hole = min((int(math.ceil(t.duration)) for t in remaining), default=1)
+
+        # Boundary state: the last committed task on each line, frozen in place
+        boundary_jobs, previous, frozen = [], [], []
+        for line_id, (job, task, placed) in last_on_line.items():
+            boundary_jobs.append(job.model_copy(update={
+                'tasks': [task.model_copy(update={'eligibleLines': [line_id], 'manualStart': None})],
+                'dueDate': None,
+            }))
+            previous.append(placed)
+            frozen.append(task.id)
+
+        # Everything else committed so far becomes unavailable time
+        availabilities = []
+        for resource_id, intervals in busy.items():
+            blocked = [(s, e) for s, e, task_id in intervals if task_id not in frozen]
+            if resource_id in index.lines_with_setups and resource_id in last_on_line:
+                # No room to honour setups around committed tasks: block up to the boundary task
+                blocked = [(0, last_on_line[resource_id][2]['start'])]
+            calendar = index.calendar_for(resource_id)
+            windows = calendar.windows(0, open_end) if calendar is not None else [(0, open_end)]
+            availabilities.append(ResourceAvailability(
+                resourceId=resource_id,
+                intervals=[AvailabilityInterval(start=s, end=e) for s, e in _subtract(windows, blocked, min_hole)],
+                # Pausable tasks must not pause across committed work
+                reserved=[AvailabilityInterval(start=s, end=e) for s, e in blocked],
+            ))
+        availabilities += [a for a in req.availabilities or [] if a.resourceId not in busy]
+
+        sub_request = SolveRequest(
+            jobs=boundary_jobs + [req.jobs[j] for j in window + lookahead],
+            lines=req.lines,
+            operators=req.operators,
+            setupTimes=req.setupTimes,
+            availabilities=availabilities,
+            calendars=req.calendars,
+            options=window_options.model_copy(update={'frozenTaskIds': frozen}),
+            previousSchedule=previous + (req.previousSchedule or []),
+        )
+        result = solve_schedule(sub_request, window_parameters)
+        if result.get('status') != 'success':
+            return {
+                "status": "failed",
+                "logs": [f"Rolling horizon window {len(window_stats) + 1} failed"] + result.get('logs', []),
+            }
+        window_stats.append(result.get('stats', {}))
+
+        # Commit this window's jobs (not the lookahead)
+        window_results = result['tasks'][len(boundary_jobs):len(boundary_jobs) + len(window)]
+        for job_idx, res_job in zip(window, window_results):
+            committed[job_idx] = res_job
+            job = req.jobs[job_idx]
+            for task, placed in zip(job.tasks, res_job['tasks']):
+                for key in ('line', 'operator'):
+                    busy[placed[key]].append((placed['start'], placed['end'], task.id))
+                current = last_on_line.get(placed['line'])
+                if current is None or placed['end'] > current[2]['end']:
+                    last_on_line[placed['line']] = (job, task, placed)
+
+    results = [committed[j] for j in range(len(req.jobs))]
+    makespan = max((t['end'] for job in results for t in job['tasks']), default=0)
+    tardiness = 0
+    for job, res_job in zip(req.jobs, results):
+        if job.dueDate is not None and res_job['tasks']:
+            tardiness += max(0, res_job['tasks'][-1]['end'] - job.dueDate) * job.priority
+
+    logs.append(f"Solver Status: ROLLING_HORIZON ({len(window_stats)} windows)")
+    logs.append(f"SME Objective (Weighted Tardiness): {tardiness}")
+    logs.append(f"Production Makespan: {makespan}")
+    return {
+        "status": "success",
+        "makespan": makespan,
+        "tardiness": tardiness,
+        "stats": {
+            "windows": len(window_stats),
+            "branches": sum(s.get('branches', 0) for s in window_stats),
+            "conflicts": sum(s.get('conflicts', 0) for s in window_stats),
+            "wall_time": time.perf_counter() - t_start,
+            "build_time": sum(s.get('build_time', 0) for s in window_stats),
+            "solve_time": sum(s.get('solve_time', 0) for s in window_stats),
+            "phases": merge_phases(s.get('phases') for s in window_stats),
+        },
+        "tasks": results,
+        "logs": logs,
+    }
+
+
+def _task_dues(req: SolveRequest) -> Dict[str, int]:
+    """Due date of every task of a job with one: the job's, less the work still to do after the task."""
+    dues = {}
+    for job in req.jobs:
+        if job.dueDate is None:
+            continue
+        after = 0
+        for task in reversed(job.tasks):
+            dues[task.id] = job.dueDate - after
+            after += int(math.ceil(task.duration))
+    return dues
+
+
+def assign_lines(req: SolveRequest, index: ProblemIndex, hints: Dict[str, str], fixed_lines: Dict[str, str],
+                 parameters: Dict) -> Tuple[Optional[Dict[str, str]], Dict]:
+    """
+    Stage one of the hierarchical solve: a line for every task, balancing the lines' load
+    against the due dates. For a few due-date thresholds, the work a line must finish by a
+    threshold beyond the working time it has until then is penalised; the load of the
+    busiest line comes next, and every task moved off its line in the greedy schedule
+    (which did look at setups and operators) costs a little. Sequencing, setups and
+    operators are otherwise left to the later stages.
+    Returns (task id -> line id, or None when nothing was found in time, and the phase entry).
+    """
+    t_start = time.perf_counter()
+    model = cp_model.CpModel()
+    dues = _task_dues(req)
+    total_work = sum(int(math.ceil(t.duration)) for job in req.jobs for t in job.tasks)
+    work = collections.defaultdict(list)  # line id -> [(duration, literal or None when fixed, due)]
+    choices = {}  # task id -> [(line id, literal)]
+    moved = []  # literals of lines other than the hinted one
+    for job in req.jobs:
+        for task in job.tasks:
+            duration = int(math.ceil(task.duration))
+            lines = [line_id for line_id in task.eligibleLines if line_id in index.line_ids]
+            if task.id in fixed_lines:
+                lines = [fixed_lines[task.id]]
+            if len(lines) == 1:
+                work[lines[0]].append((duration, None, dues.get(task.id)))
+                continue
+            choices[task.id] = []
+            for line_id in lines:
+                literal = model.new_bool_var("")
+                choices[task.id].append((line_id, literal))
+                work[line_id].append((duration, literal, dues.get(task.id)))
+                model.add_hint(literal, int(hints.get(task.id) == line_id))
+                if line_id != hints.get(task.id):
+                    moved.append(literal)
+            if choices[task.id]:
+                model.add_exactly_one([literal for _, literal in choices[task.id]])
+
+    due_dates = sorted(set(dues.values()))
+    thresholds = sorted({due_dates[k * (len(due_dates) - 1) // max(1, HIERARCHICAL_DUE_BUCKETS - 1)]
+                         for k in range(HIERARCHICAL_DUE_BUCKETS)}) if due_dates else []
+    overflows = []
+    max_load = model.new_int_var(0, total_work, "")
+    for line_id, entries in work.items():
+        model.add(max_load >= sum(d * literal if literal is not None else d for d, literal, _ in entries))
+        calendar = index.calendar_for(line_id)
+        for threshold in thresholds:
+            due_work = [(d, literal) for d, literal, due in entries if due is not None and due <= threshold]
+            if not due_work:
+                continue
+            capacity = calendar.available(0, threshold) if calendar is not None else max(0, threshold)
+            overflow = model.new_int_var(0, total_work, "")
+            model.add(overflow >= sum(d * literal if literal is not None else d for d, literal in due_work) - capacity)
+            overflows.append(overflow)
+    model.minimize(100 * sum(overflows) + max_load + sum(moved))
+
+    solver = cp_model.CpSolver()
+    for name, value in parameters.items():
+        setattr(solver.parameters, name, value)
+    status = solver.solve(model)
+    phase = {"seconds": time.perf_counter() - t_start, "variables": len(model.proto.variables),
+             "constraints": len(model.proto.constraints)}
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None, phase
+    assignment = {task_id: line_id for task_id, options in choices.items()
+                  for line_id, literal in options if solver.boolean_value(literal)}
+    return assignment, phase
+
+
+def sequence_line(line_req: SolveRequest, line_id: str, releases: Dict[str, int], dues: Dict[str, int],
+                  hints: Dict[str, int], fixed: Dict[str, int], parameters: Dict, deadline: float) -> Dict:
+    """
+    Stage two of the hierarchical solve, one line at a time (in a worker process): sequence
+    the tasks assigned to the line, setups included. Every task starts no earlier than its
+    release (its job predecessor's end in the greedy schedule) and is penalised for ending
+    after `dues` (its end in that schedule). Operators are not modelled here; the repair
+    pass assigns them.
+    The search ends at its time limit or at `deadline` (time.time()), whichever comes first.
+    Returns the status and task id -> start.
+    """
+    t_start = time.perf_counter()
+    index = ProblemIndex(line_req)
+    horizon = max([index.horizon()] + list(releases.values())) + index.horizon()
+    model = cp_model.CpModel()
+    present = model.new_bool_var("")
+    model.add(present == 1)
+    model.add_hint(present, 1)
+
+    data_list = []
+    starts = {}
+    tardiness = []
+    hinted_lines = {}
+    hinted_ends = []
+    for job_idx, job in enumerate(line_req.jobs):
+        previous_end = None
+        for t_idx, task in enumerate(job.tasks):
+            duration = int(math.ceil(task.duration))
+            est = releases.get(task.id, 0)
+            lst = horizon
+            if task.id in fixed:
+                est = lst = fixed[task.id]
+            elif task.manualStart is not None:
+                est = lst = task.manualStart
+            start = model.new_int_var(est, lst, "")
+            end = model.new_int_var(est + duration, lst + duration, "")
+            model.add(end == start + duration)
+            # Pausable tasks only need a working minute to start in; the repair pass stretches them
+            add_calendar_domains(model, index, start, ([(line_id, present)],), est, lst,
+                                 1 if task.pausable else duration)
+            if previous_end is not None:
+                model.add(start >= previous_end)
+            previous_end = end
+            if task.id in hints:
+                model.add_hint(start, hints[task.id])
+                model.add_hint(end, hints[task.id] + duration)
+                hinted_lines[job_idx, t_idx] = (hints[task.id], line_id)
+                hinted_ends.append(hints[task.id] + duration)
+            if task.id in dues:
+                late = model.new_int_var(0, horizon, "")
+                model.add(late >= end - dues[task.id])
+                tardiness.append(late * job.priority)
+                if task.id in hints:
+                    model.add_hint(late, max(0, hints[task.id] + duration - dues[task.id]))
+            starts[task.id] = start
+            data_list.append({
+                'interval': model.new_interval_var(start, duration, end, ""),
+                'presence': present,
+                'job_id': job.id,
+                'start': start,
+                'end': end,
+                'task': (job_idx, t_idx),
+            })
+
+    model.add_no_overlap([d['interval'] for d in data_list])
+    if line_id in index.lines_with_setups:
+        add_setup_circuit(model, line_id, data_list, index.setup_index, hinted_lines, names=False)
+    makespan = model.new_int_var(0, 2 * horizon, "")
+    model.add_max_equality(makespan, [d['end'] for d in data_list])
+    # With every task hinted the objective is hinted too, so CP-SAT starts from the complete hint
+    if len(hinted_ends) == len(data_list):
+        model.add_hint(makespan, max(hinted_ends))
+    model.minimize(sum(tardiness) * 10000 + makespan * 100 + sum(starts.values()))
+
+    solver = cp_model.CpSolver()
+    for name, value in parameters.items():
+        setattr(solver.parameters, name, value)
+    solver.parameters.max_time_in_seconds = max(0.1, min(solver.parameters.max_time_in_seconds, deadline - time.time()))
+    status = solver.solve(model)
+    phase = {"seconds": time.perf_counter() - t_start, "variables": len(model.proto.variables),
+             "constraints": len(model.proto.constraints)}
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return {"status": "failed", "solver_status": solver.status_name(status), "phases": {"sequence": phase}}
+    return {
+        "status": "success",
+        "solver_status": solver.status_name(status),
+        "starts": {task_id: solver.value(start) for task_id, start in starts.items()},
+        "phases": {"sequence": phase},
+    }
+
+
+def _line_request(req: SolveRequest, line_id: str, task_ids: set) -> SolveRequest:
+    """The jobs' tasks assigned to one line, with only that line's setups and availability."""
+    jobs = []
+    for job in req.jobs:
+        tasks = [t.model_copy(update={'eligibleLines': [line_id]}) for t in job.tasks if t.id in task_ids]
+        if tasks:
+            jobs.append(job.model_copy(update={'tasks': tasks}))
+    line = [l for l in req.lines if l.id == line_id]
+    return SolveRequest(
+        jobs=jobs,
+        lines=line,
+        operators=[],
+        setupTimes=[s for s in req.setupTimes or [] if s.lineId == line_id],
+        availabilities=[a for a in req.availabilities or [] if a.resourceId == line_id],
+        calendars=req.calendars,
+    )
+
+
+def solve_hierarchical(req: SolveRequest, parameters: Optional[Dict] = None) -> Dict:
+    """
+    Solve in stages instead of one large model. Stage one assigns every task to a line
+    (see assign_lines). Stage two sequences each line on its own, setup circuit included,
+    with the lines solved side by side in worker processes; a greedy schedule on the chosen
+    lines gives each task its release. The repair pass then puts operators on the tasks and
+    resolves the precedences across lines: a list schedule in the order the lines were
+    sequenced, improved by CP-SAT with lines and line order fixed. Much larger plans fit in
+    the time limit than with one model, at the cost of never moving a task to another line
+    once assigned, so the dispatch-rule schedule is returned when it is better.
+    """
+    t_start = time.perf_counter()
+    options = req.options or SolveOptions()
+    index = ProblemIndex(req)
+    _, profile = resolve_solver_profile(options)
+    solver_parameters = {**profile["parameters"], **(parameters or {})}
+    deadline = t_start + solver_parameters.get("max_time_in_seconds", 10.0)
+    previous = index_previous_schedule(req.previousSchedule)
+    fixed = {task_id: previous[task_id] for task_id in options.frozenTaskIds if task_id in previous}
+    logs = []
+
+    # Greedy schedule: line hints for stage one, and the answer if nothing better is found
+    greedy = dispatch_schedule(req, options.dispatchRule, index, fixed)
+    hints = {}
+    for job, res_job in zip(req.jobs, greedy['tasks']):
+        for task, placed in zip(job.tasks, res_job['tasks']):
+            previous_line = previous.get(task.id, {}).get('line')
+            hints[task.id] = previous_line if previous_line in task.eligibleLines else placed['line']
+
+    # Stage one: lines
+    assign_parameters = {**solver_parameters,
+                         'max_time_in_seconds': max(0.1, min(options.hierarchicalAssignSeconds, deadline - time.perf_counter()))}
+    fixed_lines = {task_id: placed['line'] for task_id, placed in fixed.items() if placed.get('line') in index.line_ids}
+    assignment, assign_phase = assign_lines(req, index, hints, fixed_lines, assign_parameters)
+    if assignment is None:
+        logs.append("Hierarchical: no line assignment found in time, kept the dispatch-rule lines")
+        assignment = {}
+    lines_of = {}
+    for job in req.jobs:
+        for task in job.tasks:
+            eligible = [line_id for line_id in task.eligibleLines if line_id in index.line_ids]
+            line_id = fixed_lines.get(task.id) or assignment.get(task.id) or (eligible[0] if len(eligible) == 1 else hints[task.id])
+            if line_id in index.line_ids:
+                lines_of[task.id] = line_id
+    assigned = req.model_copy(update={'jobs': [
+        job.model_copy(update={'tasks': [t.model_copy(update={'eligibleLines': [lines_of[t.id]]}) if t.id in lines_of else t
+                                         for t in job.tasks]})
+        for job in req.jobs]})
+
+    # Stage two: sequence every line, with releases, due dates and hints from a greedy
+    # schedule on the chosen lines
+    placed, _ = dispatch_placements(assigned, options.dispatchRule, index, fixed)
+    releases, dues, targets = {}, {}, {}
+    for job, job_placements in zip(req.jobs, placed):
+        ready = 0
+        # Tasks before a fixed one keep no release: they must fit in before it
+        last_fixed = max((t_idx for t_idx, task in enumerate(job.tasks) if task.id in fixed), default=-1)
+        for t_idx, (task, (start, end, _, _)) in enumerate(zip(job.tasks, job_placements)):
+            releases[task.id] = ready if t_idx > last_fixed else 0
+            targets[task.id] = start
+            # No later than in the greedy schedule, so moving a task earlier on its line does
+            # not make the tasks after it on other lines late
+            dues[task.id] = end
+            ready = end
+    by_line = collections.defaultdict(set)
+    for task_id, line_id in lines_of.items():
+        by_line[line_id].add(task_id)
+    # Largest lines first, so they do not end up in the last round
+    line_ids = sorted(by_line, key=lambda l: -len(by_line[l]))
+    parallel = hierarchical_processes(options, len(line_ids))
+    rounds = max(1, math.ceil(len(line_ids) / parallel))
+    # Half of the remaining time is kept for the repair pass; building a line's circuit
+    # counts against its share
+    sequence_deadline = time.time() + 0.5 * (deadline - time.perf_counter())
+    line_seconds = options.hierarchicalLineSeconds or max(0.1, 0.5 * (deadline - time.perf_counter()) / rounds)
+    # Probing the circuit arcs of a line takes seconds, longer than the search needs
+    line_parameters = {**solver_parameters, 'max_time_in_seconds': line_seconds, 'num_search_workers': 1,
+                       'cp_model_probing_level': 0}
+    work = [(line_id, _line_request(req, line_id, by_line[line_id]),
+             {t: releases[t] for t in by_line[line_id]}, {t: dues[t] for t in by_line[line_id] if t in dues},
+             {t: targets[t] for t in by_line[line_id]},
+             {t: int(float(fixed[t]['start'])) for t in by_line[line_id] if t in fixed})
+            for line_id in line_ids]
+    t_sequence = time.perf_counter()
+    if parallel > 1:
+        # In rounds of `parallel` lines: the worker's pool may have more processes than this solve asked for
+        line_results = []
+        for first in range(0, len(work), parallel):
+            futures = [_submit_line(line_req, line_id, *line_work, line_parameters, sequence_deadline)
+                       for line_id, line_req, *line_work in work[first:first + parallel]]
+            line_results += [_line_result(future) for future in futures]
+    else:
+        line_results = [sequence_line(line_req, line_id, *line_work, line_parameters, sequence_deadline)
+                        for line_id, line_req, *line_work in work]
+    sequence_time = time.perf_counter() - t_sequence
+    failed = [line_id for (line_id, *_), result in zip(work, line_results) if result['status'] != 'success']
+    for result in line_results:
+        targets.update(result.get('starts', {}))
+    if failed:
+        logs.append(f"Hierarchical: no sequence found in time for line(s) {', '.join(failed)}, kept their greedy order")
+
+    # Repair, first greedy: list-schedule the tasks in the order of the line sequences, which
+    # picks operators and moves tasks behind their job predecessors on other lines
+    t_repair = time.perf_counter()
+    greedy_repair = dispatch_schedule(assigned, options.dispatchRule, index, fixed, order=targets)
+    # Then CP-SAT on the chosen lines with that order on every line fixed, setups as gaps
+    # between neighbours instead of circuits, and the greedy repair as complete hint
+    sequences = collections.defaultdict(list)
+    for job, res_job in zip(req.jobs, greedy_repair['tasks']):
+        for task in res_job['tasks']:
+            sequences[task['line']].append((task['start'], job.id, task['id']))
+    repair_req = assigned.model_copy(update={
+        'setupTimes': [],
+        'previousSchedule': greedy_repair['tasks'],
+        'options': options.model_copy(update={'decomposition': 'none', 'warmStart': False, 'fallback': False}),
+    })
+    compiled = CompiledModel(repair_req)
+    for line_id, sequence in sequences.items():
+        sequence.sort()
+        for (_, before_job, before), (_, after_job, after) in zip(sequence, sequence[1:]):
+            if before in compiled.task_index and after in compiled.task_index:
+                setup = index.setup_index.get((line_id, before_job, after_job), 0)
+                compiled.model.add(compiled.job_starts[compiled.task_index[after]]
+                                   >= compiled.job_ends[compiled.task_index[before]] + setup)
+    # Presolve may otherwise drop the hinted solution and spend the time looking for another
+    result = solve_compiled(compiled, {**solver_parameters, 'keep_all_feasible_solutions_in_presolve': True,
+                                       'max_time_in_seconds': max(0.1, deadline - time.perf_counter())})
+    if result.get('status') != 'success':
+        logs.append("Hierarchical: no repaired schedule from CP-SAT in time, kept the greedy repair")
+        result = dict(greedy_repair, stats={})
+    repair_time = time.perf_counter() - t_repair
+    status = result['logs'][0]
+    if schedule_objective(req, greedy['tasks'])[0] < schedule_objective(req, result['tasks'])[0]:
+        logs.append("Hierarchical: the dispatch-rule schedule is better, returning it")
+        result = dict(greedy, stats={})
+        status = greedy['logs'][0]
+
+    result["logs"] = [
+        f"Solver Status: HIERARCHICAL ({len(line_ids)} lines sequenced, {parallel} in parallel)",
+        f"SME Objective (Weighted Tardiness): {result['tardiness']}",
+        f"Production Makespan: {result['makespan']}",
+        f"Repair: {status}",
+    ] + logs + result['logs'][3:]
+    result["stats"] = {
+        **result["stats"],
+        "lines": len(line_ids),
+        "lines_failed": len(failed),
+        "parallel": parallel,
+        "assign_time": assign_phase["seconds"],
+        "sequence_time": sequence_time,
+        "repair_time": repair_time,
+        "wall_time": time.perf_counter() - t_start,
+        "phases": merge_phases([{"assign": assign_phase}] + [r.get('phases') for r in line_results]
+                               + [result["stats"].get('phases')]),
+    }
+    return result
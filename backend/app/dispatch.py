@@ -0,0 +1,298 @@
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_right
+import collections
+import heapq
+import math
+import time
+
+from .calendars import Calendar
+from .models import SolveRequest
+from .preprocess import ProblemIndex
+
+# Rules the dispatcher orders ready tasks by (see dispatch_placements)
+DISPATCH_RULES = ('edd', 'wspt', 'atc')
+# Lookahead scaling of the ATC rule (usual values are 1-3)
+ATC_K = 2.0
+# How many operators of an interchangeable group are tried for each task
+GROUP_PROBE = 2
+# Holes kept per resource; the oldest ones are given up first
+MAX_HOLES = 64
+
+
+class Timeline:
+    """
+    Occupation of one resource for list scheduling: free holes left between tasks, the time
+    after which it is free for good, and its calendar. Holes too short for any task, and
+    the oldest holes beyond MAX_HOLES, are dropped so earliest-fit queries stay short even with
+    thousands of tasks on a resource.
+    """
+
+    def __init__(self, calendar: Optional[Calendar], min_hole: int):
+        self.calendar = calendar
+        self.min_hole = min_hole
+        self.hole_starts: List[int] = []
+        self.hole_ends: List[int] = []
+        self.hole_jobs: List[Tuple[Optional[str], Optional[str]]] = []  # (job before, job after)
+        self.tail = 0
+        self.last_job: Optional[str] = None
+
+    def fit_window(self, t: int, duration: int, pausable: bool = False) -> Optional[int]:
+        """
+        Earliest start >= t with [start, start + duration] inside one shift window
+        (pausable work only needs the resource to be working at its start).
+        """
+        if self.calendar is None:
+            return t
+        return self.calendar.earliest_fit(t, math.inf, min(duration, 1) if pausable else duration)
+
+    def earliest_fit(self, t: int, duration: int, job_id: str, setup, pausable: bool = False) -> Optional[int]:
+        """
+        Earliest start >= t where the task and its setups fit in a hole or after the tail.
+        For pausable work `duration` is its span from t, breaks included.
+        """
+        i = bisect_right(self.hole_ends, t)
+        for k in range(i, len(self.hole_starts)):
+            if self.hole_ends[k] - max(t, self.hole_starts[k]) < duration:
+                continue
+            before, after = self.hole_jobs[k]
+            start = max(t, self.hole_starts[k] + setup(before, job_id))
+            start = self.fit_window(start, duration, pausable)
+            if start is not None and start + duration + setup(job_id, after) <= self.hole_ends[k]:
+                return start
+        return self.fit_window(max(t, self.tail + setup(self.last_job, job_id)), duration, pausable)
+
+    def reserve(self, start: int, end: int, job_id: str):
+        if start >= self.tail:
+            self._add_hole(len(self.hole_starts), self.tail, start, self.last_job, job_id)
+            self.tail = end
+            self.last_job = job_id
+            return
+        k = bisect_right(self.hole_starts, start) - 1
+        if k < 0 or end > self.hole_ends[k]:
+            # Forced placement over existing work (no shift could hold the task)
+            self.tail = max(self.tail, end)
+            return
+        h_start, h_end = self.hole_starts[k], self.hole_ends[k]
+        before, after = self.hole_jobs[k]
+        del self.hole_starts[k], self.hole_ends[k], self.hole_jobs[k]
+        self._add_hole(k, end, h_end, job_id, after)
+        self._add_hole(k, h_start, start, before, job_id, keep=2)
+
+    def _add_hole(self, k: int, start: int, end: int, before, after, keep: int = 1):
+        """
+        Insert a hole at index k. Past MAX_HOLES the oldest hole is dropped, skipping the
+        `keep` holes from k on that were just added.
+        """
+        if end - start >= self.min_hole:
+            self.hole_starts.insert(k, start)
+            self.hole_ends.insert(k, end)
+            self.hole_jobs.insert(k, (before, after))
+            if len(self.hole_starts) > MAX_HOLES:
+                drop = k + keep if k == 0 else 0
+                del self.hole_starts[drop], self.hole_ends[drop], self.hole_jobs[drop]
+
+
+def dispatch_placements(req: SolveRequest, rule: str = 'atc', index: Optional[ProblemIndex] = None,
+                        fixed: Optional[Dict[str, Dict]] = None, order: Optional[Dict[str, int]] = None):
+    """
+    List-schedule every task with a dispatch rule. Returns placements[job_idx][t_idx] =
+    (start, end, line id, operator id) and the number of manual starts that could not be kept.
+    Tasks in `fixed` (task id -> previous placement, e.g. frozen tasks) are kept where they are.
+
+    Rules: 'edd' (earliest due date), 'wspt' (weighted shortest processing time) or
+    'atc' (apparent tardiness cost). Eligible lines, operator skills, shifts and setup times
+    are respected; pausable tasks stretch over the breaks their line and operator share.
+    A manual start is used as-is when both resources are free, otherwise the task starts as
+    soon as possible after it.
+    With `order` (task id -> target start, e.g. from a decomposed solve) ready tasks are taken
+    in target order instead of by the rule.
+    """
+    index = index or ProblemIndex(req)
+    durations = [[int(math.ceil(t.duration)) for t in job.tasks] for job in req.jobs]
+    all_durations = [d for job_durations in durations for d in job_durations]
+    min_hole = max(1, min(all_durations, default=1))
+    avg_duration = max(1.0, sum(all_durations) / max(1, len(all_durations)))
+
+    lines = {line_id: Timeline(index.calendar_for(line_id), min_hole) for line_id in index.line_ids}
+    operators = {op_id: Timeline(index.calendar_for(op_id), min_hole) for op_id in index.operator_ids}
+
+    def task_end(task, start: int, duration: int, line_id, op_id) -> int:
+        """End of a task started at `start`; pausable work also waits out the shared breaks."""
+        if not task.pausable:
+            return start + duration
+        calendar = index.calendars.joint_of([line_id, op_id])
+        end = calendar.finish(start, duration) if calendar is not None else None
+        return end if end is not None else start + duration
+
+    # Interchangeable operators (same skills and shifts) are probed together, least loaded first
+    groups = collections.defaultdict(list)
+    for op_id in index.operator_ids:
+        groups[frozenset(index.operators[op_id].skills), index.calendars.key(op_id)].append(op_id)
+    groups_by_skill = collections.defaultdict(list)
+    for (skills, _), members in groups.items():
+        for skill in skills:
+            groups_by_skill[skill].append(members)
+
+    def line_setup(line_id):
+        return lambda before, after: index.setup_index.get((line_id, before, after), 0) if before and after else 0
+
+    no_setup = lambda before, after: 0
+    setups = {line_id: line_setup(line_id) if line_id in index.lines_with_setups else no_setup for line_id in lines}
+
+    def priority_key(job_idx: int, t_idx: int, ready: int):
+        job = req.jobs[job_idx]
+        if order is not None:
+            return (order.get(job.tasks[t_idx].id, ready), ready)
+        duration = max(1, durations[job_idx][t_idx])
+        due = job.dueDate if job.dueDate is not None else math.inf
+        if rule == 'edd':
+            return (due, ready)
+        if rule == 'wspt':
+            return (duration / max(job.priority, 1), ready)
+        if rule == 'atc':
+            # Weighted shortest processing time, discounted by the slack left before the due date
+            remaining = sum(durations[job_idx][t_idx:])
+            slack = max(0.0, due - remaining - ready)
+            return (-(max(job.priority, 1) / duration) * math.exp(-slack / (ATC_K * avg_duration)), ready)
+        raise ValueError(f"Unknown dispatch rule '{rule}', expected one of {list(DISPATCH_RULES)}")
+
+    placements = [[None] * len(job.tasks) for job in req.jobs]
+    manual_missed = 0
+
+    # Fixed tasks are booked first, in time order, so the rest is scheduled around them
+    booked = []
+    for job_idx, job in enumerate(req.jobs):
+        for t_idx, task in enumerate(job.tasks):
+            placed = (fixed or {}).get(task.id)
+            if placed is not None:
+                start = int(float(placed['start']))
+                end = start + durations[job_idx][t_idx]
+                if task.pausable and placed.get('end') is not None:
+                    end = int(float(placed['end']))
+                placements[job_idx][t_idx] = (start, end, placed.get('line') or "Unknown", placed.get('operator') or "None")
+                booked.append((start, end, job.id, placed.get('line'), placed.get('operator')))
+    for start, end, job_id, line_id, op_id in sorted(booked, key=lambda b: b[0]):
+        for timeline in (lines.get(line_id), operators.get(op_id)):
+            if timeline is not None:
+                timeline.reserve(start, end, job_id)
+    ready_heap = []
+    for job_idx, job in enumerate(req.jobs):
+        if job.tasks:
+            heapq.heappush(ready_heap, (priority_key(job_idx, 0, 0), job_idx, 0, 0))
+
+    while ready_heap:
+        _, job_idx, t_idx, ready = heapq.heappop(ready_heap)
+        job = req.jobs[job_idx]
+        task = job.tasks[t_idx]
+        duration = durations[job_idx][t_idx]
+        if placements[job_idx][t_idx] is not None:
+            end = placements[job_idx][t_idx][1]
+            if t_idx + 1 < len(job.tasks):
+                heapq.heappush(ready_heap, (priority_key(job_idx, t_idx + 1, end), job_idx, t_idx + 1, end))
+            continue
+        release = max(ready, task.manualStart or 0)
+
+        # Best line and best few operators on their own, then a joint fit on those candidates
+        line_fits = []
+        for line_id in task.eligibleLines:
+            timeline = lines.get(line_id)
+            start = timeline.earliest_fit(release, duration, job.id, setups[line_id], task.pausable) if timeline else None
+            if start is not None:
+                line_fits.append((start, line_id))
+        op_fits = []
+        for members in groups_by_skill.get(task.skill, []):
+            probe = heapq.nsmallest(GROUP_PROBE, members, key=lambda op_id: operators[op_id].tail)
+            for op_id in probe:
+                start = operators[op_id].earliest_fit(release, duration, job.id, no_setup, task.pausable)
+                if start is not None:
+                    op_fits.append((start, op_id))
+        line_fits.sort()
+        op_fits.sort()
+        line_candidates = [line_id for _, line_id in line_fits[:2]] or [None]
+        op_candidates = [op_id for _, op_id in op_fits[:2]] or [None]
+        # No pair can start before both resources are individually free
+        lower_bound = max([release] + [fits[0][0] for fits in (line_fits, op_fits) if fits])
+
+        best = None
+        for line_id, op_id in [(l, o) for l in line_candidates for o in op_candidates]:
+            if best is not None and best[0] == lower_bound:
+                break
+            # Alternate between the two resources until both accept the same start
+            start = lower_bound
+            for _ in range(64):
+                moved = start
+                if task.pausable:
+                    # Start in a minute both work, and hold both over the breaks up to the end
+                    joint = index.calendars.joint_of([line_id, op_id])
+                    moved = joint.pausable_start(moved, duration) if joint is not None else moved
+                    if moved is None:
+                        break
+                span = task_end(task, moved, duration, line_id, op_id) - moved
+                if line_id is not None:
+                    moved = lines[line_id].earliest_fit(moved, span, job.id, setups[line_id], task.pausable)
+                if moved is not None and op_id is not None:
+                    moved = operators[op_id].earliest_fit(moved, span, job.id, no_setup, task.pausable)
+                if moved is None or moved == start:
+                    break
+                start = moved
+            if moved == start and (best is None or start < best[0]):
+                best = (start, line_id, op_id)
+
+        if best is None:
+            # No shift window can hold the task: place it after everything on its first choices
+            line_id, op_id = line_candidates[0], op_candidates[0]
+            start = max([release] + [tl.tail for tl in (lines.get(line_id), operators.get(op_id)) if tl])
+            best = (start, line_id, op_id)
+
+        start, line_id, op_id = best
+        end = task_end(task, start, duration, line_id, op_id)
+        if line_id is not None:
+            lines[line_id].reserve(start, end, job.id)
+        if op_id is not None:
+            operators[op_id].reserve(start, end, job.id)
+        if task.manualStart is not None and start != task.manualStart:
+            manual_missed += 1
+        placements[job_idx][t_idx] = (start, end, line_id or "Unknown", op_id or "None")
+
+        if t_idx + 1 < len(job.tasks):
+            heapq.heappush(ready_heap, (priority_key(job_idx, t_idx + 1, end), job_idx, t_idx + 1, end))
+
+    return placements, manual_missed
+
+
+def dispatch_schedule(req: SolveRequest, rule: str = 'atc', index: Optional[ProblemIndex] = None,
+                      fixed: Optional[Dict[str, Dict]] = None, order: Optional[Dict[str, int]] = None) -> Dict:
+    """Dispatch-rule schedule in the /solve response format."""
+    from .compiler import result_task  # compiler imports this module
+
+    t_start = time.perf_counter()
+    placements, manual_missed = dispatch_placements(req, rule, index, fixed, order)
+    elapsed = time.perf_counter() - t_start
+
+    results = []
+    makespan = 0
+    tardiness = 0
+    for job, job_placements in zip(req.jobs, placements):
+        res_job = {"id": job.id, "name": job.name, "tasks": [], "color": job.color}
+        for task, (start, end, line_id, op_id) in zip(job.tasks, job_placements):
+            res_job["tasks"].append(result_task(job, task, start, end, line_id, op_id))
+            makespan = max(makespan, end)
+        if job.tasks and job.dueDate is not None:
+            tardiness += max(0, job_placements[-1][1] - job.dueDate) * job.priority
+        results.append(res_job)
+
+    logs = [
+        f"Solver Status: DISPATCH_{rule.upper()}",
+        f"SME Objective (Weighted Tardiness): {tardiness}",
+        f"Production Makespan: {makespan}",
+    ]
+    if manual_missed:
+        logs.append(f"{manual_missed} manual start(s) could not be kept and were moved later.")
+    return {
+        "status": "success",
+        "makespan": makespan,
+        "tardiness": tardiness,
+        "stats": {"dispatch_time": elapsed},
+        "tasks": results,
+        "logs": logs,
+    }
@@ -0,0 +1,122 @@
+from typing import Dict, List, Optional
+import json
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from .models import SolveOptions, SolveRequest
+from .preprocess import index_previous_schedule
+
+# Faster encoders (requirements.txt); plain json when orjson is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def diff_schedule(jobs: List[Dict], previous_schedule: Optional[List[Dict]]) -> Dict:
+    """
+    Keep only the tasks whose start, end, line or operator differ from the previous schedule.
+    Jobs without a changed task are dropped; tasks of the previous schedule that no longer
+    exist are listed in 'removedTaskIds'.
+    """
+    base = index_previous_schedule(previous_schedule)
+    changed_jobs = []
+    changed = unchanged = 0
+    seen = set()
+    for job in jobs:
+        tasks = []
+        for task in job["tasks"]:
+            seen.add(task["id"])
+            prev = base.get(task["id"])
+            if prev is not None and all(prev.get(k) == task[k] for k in ("line", "operator")) \
+                    and float(prev.get("start", -1)) == task["start"] and float(prev.get("end", -1)) == task["end"]:
+                unchanged += 1
+            else:
+                tasks.append(task)
+        changed += len(tasks)
+        if tasks:
+            changed_jobs.append({**job, "tasks": tasks})
+    return {
+        "jobs": changed_jobs,
+        "changed": changed,
+        "unchanged": unchanged,
+        "removedTaskIds": [task_id for task_id in base if task_id not in seen],
+    }
+
+
+def columnar_schedule(jobs: List[Dict], req: SolveRequest) -> Dict:
+    """
+    The nested jobs/tasks of a result as parallel arrays. Job metadata is sent once per job,
+    lines and operators are sent once and tasks refer to them (and to their job) by index.
+    """
+    job_meta = {job.id: job for job in req.jobs}
+    line_ids, operator_ids = [], []
+    line_pos, operator_pos = {}, {}
+    columns = {key: [] for key in ("id", "name", "job", "start", "end", "duration", "line", "operator", "manualStart")}
+    job_columns = {key: [] for key in ("id", "name", "color", "priority", "dueDate")}
+
+    for job_idx, job in enumerate(jobs):
+        meta = job_meta.get(job["id"])
+        job_columns["id"].append(job["id"])
+        job_columns["name"].append(job["name"])
+        job_columns["color"].append(job["color"])
+        job_columns["priority"].append(meta.priority if meta else None)
+        job_columns["dueDate"].append(meta.dueDate if meta else None)
+        for task in job["tasks"]:
+            if task["line"] not in line_pos:
+                line_pos[task["line"]] = len(line_ids)
+                line_ids.append(task["line"])
+            if task["operator"] not in operator_pos:
+                operator_pos[task["operator"]] = len(operator_ids)
+                operator_ids.append(task["operator"])
+            columns["id"].append(task["id"])
+            columns["name"].append(task["name"])
+            columns["job"].append(job_idx)
+            columns["start"].append(task["start"])
+            columns["end"].append(task["end"])
+            columns["duration"].append(task["duration"])
+            columns["line"].append(line_pos[task["line"]])
+            columns["operator"].append(operator_pos[task["operator"]])
+            columns["manualStart"].append(task["manualStart"])
+
+    return {"jobs": job_columns, "lines": line_ids, "operators": operator_ids, "tasks": columns}
+
+
+def format_tasks(jobs: List[Dict], req: SolveRequest) -> Dict:
+    """
+    Apply the request's responseFormat and diffOnly options to result jobs.
+    Returns the entries to merge into the response: 'tasks', plus 'format' and 'diff'.
+    """
+    options = req.options or SolveOptions()
+    formatted = {"format": options.responseFormat}
+    if options.diffOnly:
+        diff = diff_schedule(jobs, req.previousSchedule)
+        jobs = diff.pop("jobs")
+        formatted["diff"] = diff
+    formatted["tasks"] = columnar_schedule(jobs, req) if options.responseFormat == 'columnar' else jobs
+    return formatted
+
+
+def encode_response(payload: Dict, accept: Optional[str] = None) -> Response:
+    """
+    Encode a response body as MessagePack when the client asks for it, else as JSON.
+    A client that only accepts MessagePack gets 406 when msgpack is not installed.
+    """
+    accept = accept or ""
+    if MSGPACK_MEDIA_TYPE in accept:
+        if msgpack is not None:
+            return Response(msgpack.packb(payload, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPE)
+        if not any(media_type in accept for media_type in ("application/json", "*/*")):
+            raise HTTPException(status_code=406, detail=f"{MSGPACK_MEDIA_TYPE} needs the msgpack package on the server")
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return Response(body, media_type="application/json")
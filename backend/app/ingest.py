@@ -0,0 +1,296 @@
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+from pydantic import TypeAdapter, ValidationError
+
+from .models import (
+    AvailabilityInterval, Job, Line, Operator, ResourceAvailability, SetupTime, SolveOptions, SolveRequest, Task
+)
+
+# Parquet needs pyarrow (requirements.txt); CSV works without it
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Rows validated at a time (and Parquet batch size)
+IMPORT_CHUNK_ROWS = int(os.environ.get("IMPORT_CHUNK_ROWS", 5000))
+# Row errors reported per import; the rest are only counted
+MAX_IMPORT_ERRORS = int(os.environ.get("MAX_IMPORT_ERRORS", 1000))
+DEFAULT_COLOR = "#3b82f6"
+# Separator of list cells (eligibleLines, skills) in CSV files
+LIST_SEPARATOR = "|"
+
+# File -> (model a row is validated as, list columns). Columns are named after the model
+# fields; 'name' defaults to the id, and jobs default to priority 1.
+ROW_MODELS = {
+    'jobs': (Job, ()),
+    'tasks': (Task, ('eligibleLines',)),
+    'operators': (Operator, ('skills',)),
+    'lines': (Line, ()),
+    'setups': (SetupTime, ()),
+    'availabilities': (AvailabilityInterval, ()),
+}
+# Columns that say where a row belongs rather than being model fields -> required.
+# An availability's kind is 'interval' (a shift, the default), 'exception' (holiday,
+# maintenance) or 'reserved'.
+KEY_COLUMNS = {
+    'tasks': {'jobId': True},
+    'availabilities': {'resourceId': True, 'kind': False},
+}
+REQUIRED_FILES = ('jobs', 'tasks', 'operators')
+AVAILABILITY_KINDS = {'interval': 'intervals', 'exception': 'exceptions', 'reserved': 'reserved'}
+# One validator call per chunk of rows
+_ROW_ADAPTERS = {file: TypeAdapter(List[model]) for file, (model, _) in ROW_MODELS.items()}
+
+
+class UnsupportedFileFormat(ValueError):
+    """An upload in a format this server cannot read (415)."""
+
+
+def read_chunks(source: IO, fmt: str, chunk_rows: int = IMPORT_CHUNK_ROWS) -> Iterator[List[Dict]]:
+    """Rows of a binary CSV or Parquet file, as lists of dicts of at most `chunk_rows`."""
+    if fmt == 'parquet':
+        if pq is None:
+            raise UnsupportedFileFormat("Parquet import needs the pyarrow package installed; use CSV instead")
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pylist()
+        return
+    reader = csv.DictReader(io.TextIOWrapper(source, encoding="utf-8-sig", newline=""))
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def file_format(filename: Optional[str]) -> str:
+    """'parquet' or 'csv' from the file name; Parquet files are refused up front without pyarrow."""
+    fmt = 'parquet' if (filename or '').lower().endswith(('.parquet', '.pq')) else 'csv'
+    if fmt == 'parquet' and pq is None:
+        raise UnsupportedFileFormat(f"{filename}: Parquet import needs the pyarrow package installed; use CSV instead")
+    return fmt
+
+
+class BulkImport:
+    """
+    Builds a SolveRequest from row files (see ROW_MODELS), one chunk of rows at a time.
+    Each chunk is validated in one call as it arrives, and errors are reported by file,
+    row and column; references between files are checked once all rows are in. Only the
+    current chunk is held as raw rows, and the request is assembled from the validated
+    models without validating the whole tree again.
+    """
+
+    def __init__(self):
+        self.errors: List[Dict] = []
+        self.error_count = 0
+        self.rows = collections.Counter()  # file -> rows read
+        self.jobs: Dict[str, Tuple[int, Dict]] = {}  # job id -> (row, fields)
+        self.tasks_by_job = collections.defaultdict(list)  # job id -> [(order, row, Task)]
+        self.task_rows: Dict[str, int] = {}  # task id -> row
+        self.operators: Dict[str, Operator] = {}
+        self.lines: Dict[str, Line] = {}
+        self.setups: List[Tuple[int, SetupTime]] = []
+        self.availabilities = collections.OrderedDict()  # resource id -> {kind field: [AvailabilityInterval]}
+        self.availability_rows: Dict[str, int] = {}  # resource id -> first row
+
+    def error(self, file: str, row: int, column: Optional[str], message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({'file': file, 'row': row, 'column': column, 'error': message})
+
+    def add_file(self, file: str, source: IO, fmt: str = 'csv'):
+        if file not in ROW_MODELS:
+            raise ValueError(f"Unknown import file '{file}', expected one of {sorted(ROW_MODELS)}")
+        for chunk in read_chunks(source, fmt):
+            self.add_rows(file, chunk)
+
+    def add_rows(self, file: str, rows: List[Dict]):
+        """Check and take in one chunk of rows. Row numbers count data rows from 1."""
+        model, list_columns = ROW_MODELS[file]
+        key_columns = KEY_COLUMNS.get(file, {})
+        first = self.rows[file] + 1
+        self.rows[file] += len(rows)
+        prepared = []  # (row, key column values, model fields)
+        for row, raw in enumerate(rows, first):
+            fields = {column: value for column, value in raw.items() if value is not None and value != ''}
+            keys = {}
+            for column, required in key_columns.items():
+                if column in fields:
+                    keys[column] = str(fields.pop(column)).strip()
+                elif required:
+                    self.error(file, row, column, "missing value")
+            if len(keys) < sum(key_columns.values()):
+                continue
+            for column in list_columns:
+                if isinstance(fields.get(column), str):
+                    fields[column] = [v.strip() for v in fields[column].split(LIST_SEPARATOR) if v.strip()]
+            if 'id' in fields and 'name' in model.model_fields:
+                fields.setdefault('name', fields['id'])
+            if model is Job:
+                fields.setdefault('color', DEFAULT_COLOR)
+                fields.setdefault('priority', 1)
+                fields['tasks'] = []
+            prepared.append((row, keys, fields))
+
+        adapter = _ROW_ADAPTERS[file]
+        try:
+            values = adapter.validate_python([fields for _, _, fields in prepared])
+        except ValidationError as e:
+            invalid = set()
+            for error in e.errors():
+                index = error['loc'][0]
+                column = error['loc'][1] if len(error['loc']) > 1 else None
+                self.error(file, prepared[index][0], column, error['msg'])
+                invalid.add(index)
+            prepared = [p for index, p in enumerate(prepared) if index not in invalid]
+            values = adapter.validate_python([fields for _, _, fields in prepared])
+        add = getattr(self, f"_add_{file}")
+        for (row, keys, _), value in zip(prepared, values):
+            add(row, value, **keys)
+
+    def _add_jobs(self, row: int, job: Job):
+        if job.id in self.jobs:
+            return self.error('jobs', row, 'id', f"duplicate job {job.id} (first on row {self.jobs[job.id][0]})")
+        self.jobs[job.id] = (row, job)
+
+    def _add_tasks(self, row: int, task: Task, jobId: str):
+        if task.id in self.task_rows:
+            return self.error('tasks', row, 'id', f"duplicate task {task.id} (first on row {self.task_rows[task.id]})")
+        if task.duration < 0:
+            return self.error('tasks', row, 'duration', "negative duration")
+        self.task_rows[task.id] = row
+        self.tasks_by_job[jobId].append((task.order or 0, row, task))
+
+    def _add_operators(self, row: int, operator: Operator):
+        if operator.id in self.operators:
+            return self.error('operators', row, 'id', f"duplicate operator {operator.id}")
+        self.operators[operator.id] = operator
+
+    def _add_lines(self, row: int, line: Line):
+        if line.id in self.lines:
+            return self.error('lines', row, 'id', f"duplicate line {line.id}")
+        self.lines[line.id] = line
+
+    def _add_setups(self, row: int, setup: SetupTime):
+        if setup.duration < 0:
+            return self.error('setups', row, 'duration', "negative duration")
+        self.setups.append((row, setup))
+
+    def _add_availabilities(self, row: int, interval: AvailabilityInterval, resourceId: str, kind: str = 'interval'):
+        if kind not in AVAILABILITY_KINDS:
+            return self.error('availabilities', row, 'kind', f"unknown kind '{kind}', expected one of {sorted(AVAILABILITY_KINDS)}")
+        if interval.end < interval.start:
+            return self.error('availabilities', row, 'end', "end before start")
+        self.availability_rows.setdefault(resourceId, row)
+        intervals = self.availabilities.setdefault(resourceId, {key: [] for key in AVAILABILITY_KINDS.values()})
+        intervals[AVAILABILITY_KINDS[kind]].append(interval)
+
+    def build(self, options: Optional[SolveOptions] = None) -> Optional[SolveRequest]:
+        """The imported request, or None when any row had an error (see `errors`)."""
+        missing = [file for file in REQUIRED_FILES if not self.rows[file]]
+        for file in missing:
+            self.error(file, 0, None, "no rows")
+
+        # Without a lines file, the lines are the ones the tasks name
+        lines = dict(self.lines)
+        if not self.rows['lines']:
+            for job_tasks in self.tasks_by_job.values():
+                for _, _, task in job_tasks:
+                    for line_id in task.eligibleLines:
+                        lines.setdefault(line_id, Line.model_construct(id=line_id, name=line_id))
+
+        for job_id, job_tasks in self.tasks_by_job.items():
+            for _, row, task in job_tasks:
+                if job_id not in self.jobs:
+                    self.error('tasks', row, 'jobId', f"unknown job {job_id}")
+                unknown = [line_id for line_id in task.eligibleLines if line_id not in lines]
+                if unknown:
+                    self.error('tasks', row, 'eligibleLines', f"unknown lines {unknown}")
+        for row, setup in self.setups:
+            if setup.lineId not in lines:
+                self.error('setups', row, 'lineId', f"unknown line {setup.lineId}")
+            for column in ('fromJobId', 'toJobId'):
+                if getattr(setup, column) not in self.jobs:
+                    self.error('setups', row, column, f"unknown job {getattr(setup, column)}")
+        for resource_id, row in self.availability_rows.items():
+            if resource_id not in lines and resource_id not in self.operators:
+                self.error('availabilities', row, 'resourceId', f"unknown line or operator {resource_id}")
+        if self.error_count:
+            return None
+
+        jobs = []
+        for job_id, (_, job) in self.jobs.items():
+            # Tasks run in their 'order' column, then in file order
+            job_tasks = [task for _, _, task in sorted(self.tasks_by_job.get(job_id, []), key=lambda t: t[:2])]
+            jobs.append(job.model_copy(update={'tasks': job_tasks}))
+        return SolveRequest.model_construct(
+            jobs=jobs,
+            lines=list(lines.values()),
+            operators=list(self.operators.values()),
+            setupTimes=[setup for _, setup in self.setups],
+            availabilities=[
+                ResourceAvailability.model_construct(resourceId=resource_id, **intervals)
+                for resource_id, intervals in self.availabilities.items()
+            ],
+            options=options,
+        )
+
+    def report(self) -> Dict:
+        return {
+            'valid': self.error_count == 0,
+            'rows': dict(self.rows),
+            'jobs': len(self.jobs),
+            'tasks': len(self.task_rows),
+            'errorCount': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def import_files(files: Dict[str, Tuple[IO, str]], options: Optional[SolveOptions] = None) -> Tuple[Optional[SolveRequest], Dict]:
+    """Import {file: (binary source, 'csv' or 'parquet')}; returns the request (None when invalid) and the report."""
+    bulk = BulkImport()
+    for file, (source, fmt) in files.items():
+        bulk.add_file(file, source, fmt)
+    req = bulk.build(options)
+    return req, bulk.report()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Check ERP exports (CSV or Parquet) and convert them to a solve request.")
+    for file in ROW_MODELS:
+        parser.add_argument(f"--{file}", metavar="PATH", required=file in REQUIRED_FILES, help=f"{file} file")
+    parser.add_argument("--options", help="SolveOptions as JSON")
+    parser.add_argument("--output", help="write the solve request JSON here")
+    args = parser.parse_args(argv)
+
+    options = SolveOptions.model_validate_json(args.options) if args.options else None
+    sources = {file: open(getattr(args, file), "rb") for file in ROW_MODELS if getattr(args, file)}
+    try:
+        req, report = import_files({file: (source, file_format(source.name)) for file, source in sources.items()}, options)
+    except UnsupportedFileFormat as e:
+        parser.error(str(e))
+    finally:
+        for source in sources.values():
+            source.close()
+    for error in report['errors']:
+        print(f"{error['file']} row {error['row']}" + (f" {error['column']}" if error['column'] else "") + f": {error['error']}")
+    print(f"{report['jobs']} jobs, {report['tasks']} tasks, {report['errorCount']} errors")
+    if req is None:
+        sys.exit(1)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(req.model_dump(mode="json"), f)
+        print(f"Solve request written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
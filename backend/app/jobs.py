@@ -0,0 +1,265 @@
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+import uuid
+
+from . import metrics
+from .admission import DEFAULT_CLIENT, AdmissionQueue, Ticket
+from .cache import request_cache_key, schedule_cache
+from .models import SolveRequest
+from .profiles import resolve_solver_profile
+from .solver import solve_frozen, solve_scenario, solve_schedule
+
+# Number of solver processes. Each one holds a full CP-SAT model while solving.
+SOLVER_WORKERS = int(os.environ.get("SOLVER_WORKERS", min(4, os.cpu_count() or 1)))
+# Finished jobs are kept this long so clients can still fetch the result
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 3600))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_manager = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Lazily create the bounded solver process pool."""
+    global _executor
+    if _executor is None:
+        # 'spawn' avoids forking the uvicorn process with its threads and open sockets
+        _executor = ProcessPoolExecutor(
+            max_workers=SOLVER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def get_manager():
+    """Lazily start the manager process that shares progress queues and stop events with the workers."""
+    global _manager
+    if _manager is None:
+        _manager = multiprocessing.get_context("spawn").Manager()
+    return _manager
+
+
+def _drop_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def shutdown_executor():
+    global _manager
+    _drop_executor()
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+
+
+def submit(fn, *args) -> Future:
+    try:
+        return get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory): start a fresh pool and retry once. The
+        # manager stays up, running jobs still report progress and stop through it.
+        _drop_executor()
+        return get_executor().submit(fn, *args)
+
+
+async def run_in_pool(fn, *args):
+    """Run a blocking function in the solver pool without blocking the event loop."""
+    return await asyncio.wrap_future(submit(fn, *args))
+
+
+def submit_solve(req: SolveRequest, progress=None, stop_event=None,
+                 client: str = DEFAULT_CLIENT, priority: str = "normal") -> Future:
+    """
+    Submit a solve through the admission queue, answering from the schedule cache when the
+    same request was already solved. Only deterministic solver profiles are cached: for them
+    a cached result is the one a new solve would give. Results accepted before the search
+    finished are not cached.
+    """
+    def start(ticket: Ticket) -> Future:
+        return admission_queue.submit(ticket, solve_schedule, ticket.request, None, progress, stop_event)
+    return _submit_cached(req, start, client, priority)
+
+
+def submit_scenario(scenario_req: SolveRequest, base_req: SolveRequest, base_key: str,
+                    modifications: List, frozen_ids: List[str],
+                    client: str = DEFAULT_CLIENT, priority: str = "interactive") -> Future:
+    """
+    Submit a what-if scenario, solved on a variant of the base request's compiled model
+    (see solver.solve_scenario). The scenario's own request keys the schedule cache and is
+    what the admission queue sizes.
+    """
+    def start(ticket: Ticket) -> Future:
+        if ticket.degraded:
+            # Too large for one model: the scenario's request runs as a rolling horizon
+            return admission_queue.submit(ticket, solve_frozen, ticket.request, frozen_ids)
+        return admission_queue.submit(ticket, solve_scenario, base_req, base_key, modifications, frozen_ids)
+    return _submit_cached(scenario_req, start, client, priority)
+
+
+def _submit_cached(req: SolveRequest, start, client: str, priority: str) -> Future:
+    """Admit `req` and start(ticket) it, through the schedule cache (see submit_solve)."""
+    _, profile = resolve_solver_profile(req.options)
+    if not profile["deterministic"]:
+        return _recorded(start(admission_queue.admit(req, client, priority)))
+    key = request_cache_key(req, profile)
+    cached = schedule_cache.get(key)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    def store(done: Future):
+        if done.cancelled() or done.exception() is not None:
+            return
+        result = done.result()
+        if result.get("status") == "success" and not result.get("stats", {}).get("accepted_early"):
+            schedule_cache.put(key, result)
+
+    future = _recorded(start(admission_queue.admit(req, client, priority)))
+    future.add_done_callback(store)
+    return future
+
+
+def _recorded(future: Future) -> Future:
+    """Feed the solve's outcome and phase spans to /metrics once it is done (cache hits are not solves)."""
+    def record(done: Future):
+        if not done.cancelled() and done.exception() is None:
+            metrics.record_solve(done.result())
+    future.add_done_callback(record)
+    return future
+
+
+async def run_solve(req: SolveRequest, client: str = DEFAULT_CLIENT, priority: str = "normal") -> Dict:
+    return await asyncio.wrap_future(submit_solve(req, client=client, priority=priority))
+
+
+async def run_scenario(scenario_req: SolveRequest, base_req: SolveRequest, base_key: str,
+                       modifications: List, frozen_ids: List[str],
+                       client: str = DEFAULT_CLIENT, priority: str = "interactive") -> Dict:
+    return await asyncio.wrap_future(submit_scenario(scenario_req, base_req, base_key, modifications, frozen_ids,
+                                                     client, priority))
+
+
+class SolveJob:
+    """
+    A solve submitted to the pool, tracked so clients can poll it.
+    The worker reports improving solutions on `progress`; they are kept in `solutions` so
+    every stream client can replay them. Setting `stop_event` ends the search early.
+    """
+
+    def __init__(self, req: SolveRequest, client: str = DEFAULT_CLIENT, priority: str = "normal"):
+        manager = get_manager()
+        self.id = uuid.uuid4().hex
+        self.progress = manager.Queue()
+        self.stop_event = manager.Event()
+        self.solutions: List[Dict] = []
+        self.cancelled = False
+        self.created_at = time.time()
+        self.first_solution_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future = submit_solve(req, self.progress, self.stop_event, client, priority)
+        self.future.add_done_callback(self._on_done)
+
+    def _on_done(self, _future: Future):
+        self.finished_at = time.time()
+
+    def poll_solutions(self) -> List[Dict]:
+        """Move the solutions reported so far from the worker into `solutions`."""
+        while True:
+            try:
+                solution = self.progress.get_nowait()
+            except (queue.Empty, OSError, EOFError):
+                return self.solutions
+            if self.first_solution_at is None:
+                self.first_solution_at = solution["timestamp"]
+            self.solutions.append(solution)
+
+    def accept(self) -> bool:
+        """Stop the search and keep the best solution found so far."""
+        if self.future.done():
+            return False
+        self.stop_event.set()
+        return True
+
+    def cancel(self) -> bool:
+        if self.future.cancel():
+            return True
+        if self.future.done():
+            return False
+        # Already running in a worker: stop the search and drop its result
+        self.cancelled = True
+        self.stop_event.set()
+        return True
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled() or self.cancelled:
+            return "cancelled"
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "done"
+        if self.future.running():
+            return "running"
+        return "queued"
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        status = self.status
+        data = {
+            "jobId": self.id,
+            "status": status,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+            "solutions": len(self.poll_solutions()),
+            "timeToFirstSolution": self.first_solution_at - self.created_at if self.first_solution_at else None,
+        }
+        if status == "done" and include_result:
+            data["result"] = self.future.result()
+        elif status == "failed":
+            data["error"] = str(self.future.exception())
+        return data
+
+
+class JobManager:
+    """In-memory registry of solve jobs, keyed by job id."""
+
+    def __init__(self, ttl_seconds: int = JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.jobs: Dict[str, SolveJob] = {}
+
+    def submit(self, req: SolveRequest, client: str = DEFAULT_CLIENT, priority: str = "normal") -> SolveJob:
+        self.purge()
+        job = SolveJob(req, client, priority)
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[SolveJob]:
+        self.purge()
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job: queued jobs never start, running ones stop their search."""
+        job = self.jobs.get(job_id)
+        return job is not None and job.cancel()
+
+    def accept(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        return job is not None and job.accept()
+
+    def purge(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+admission_queue = AdmissionQueue(submit, SOLVER_WORKERS)
+job_manager = JobManager()
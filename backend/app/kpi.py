@@ -0,0 +1,218 @@
+from typing import Dict, List, Optional
+import math
+import numpy as np
+
+from .calendars import CalendarSet
+from .models import SolveRequest
+from .preprocess import ProblemIndex, index_previous_schedule
+
+# Job end times in impact reports are shown from this reference time (schedules are in minutes)
+REPORT_BASE_TIME = np.datetime64('2024-01-01T08:00')
+
+
+class KpiEngine:
+    """
+    Schedule KPIs computed on NumPy arrays, one element per task of the request.
+    The request (jobs, due dates, resources, setup matrix) is indexed once and the baseline
+    schedule's KPIs are computed once, so comparing many scenarios against the same
+    baseline only costs one array pass per scenario.
+    """
+
+    def __init__(self, req: SolveRequest, baseline_tasks: Optional[List[Dict]] = None):
+        self.req = req
+        index = ProblemIndex(req)
+        self.calendars = index.calendars
+        self.line_ids = index.line_ids
+        self.operator_ids = index.operator_ids
+        self.line_pos = {line_id: i for i, line_id in enumerate(self.line_ids)}
+        self.operator_pos = {op_id: i for i, op_id in enumerate(self.operator_ids)}
+
+        # Tasks in request order; job_offsets[j] is the first task of job j
+        self.task_ids = [t.id for job in req.jobs for t in job.tasks]
+        self.job_ids = [job.id for job in req.jobs]
+        self.job_names = [job.name for job in req.jobs]
+        task_counts = np.array([len(job.tasks) for job in req.jobs], dtype=np.int64)
+        self.has_tasks = task_counts > 0
+        self.job_of_task = np.repeat(np.arange(len(req.jobs)), task_counts)
+        self.job_offsets = (np.cumsum(task_counts) - task_counts)[self.has_tasks]
+        self.due = np.array([job.dueDate if job.dueDate is not None else np.nan for job in req.jobs], dtype=float)
+        self.priority = np.array([job.priority for job in req.jobs], dtype=float)
+
+        # Setup matrix as sorted integer keys (line, from job, to job) for vectorized lookups
+        job_pos = {job_id: i for i, job_id in enumerate(self.job_ids)}
+        n_jobs = max(1, len(self.job_ids))
+        keys, values = [], []
+        for (line_id, from_job, to_job), duration in index.setup_index.items():
+            if line_id in self.line_pos and from_job in job_pos and to_job in job_pos:
+                keys.append((self.line_pos[line_id] * n_jobs + job_pos[from_job]) * n_jobs + job_pos[to_job])
+                values.append(duration)
+        order = np.argsort(keys)
+        self.setup_keys = np.array(keys, dtype=np.int64)[order]
+        self.setup_values = np.array(values, dtype=float)[order]
+        self.n_jobs = n_jobs
+
+        self.baseline = self.kpis(self.arrays(baseline_tasks)) if baseline_tasks is not None else None
+
+    # --- schedule -> arrays ---
+
+    def arrays(self, tasks: List[Dict]) -> Dict[str, np.ndarray]:
+        """
+        Start/end/line/operator arrays aligned with the request's tasks, from a flat task list
+        or the nested /solve output. Tasks missing from the schedule get NaN times and index -1.
+        """
+        placed = index_previous_schedule(tasks)
+        n = len(self.task_ids)
+        start = np.full(n, np.nan)
+        end = np.full(n, np.nan)
+        line = np.full(n, -1, dtype=np.int64)
+        operator = np.full(n, -1, dtype=np.int64)
+        for i, task_id in enumerate(self.task_ids):
+            task = placed.get(task_id)
+            if task is None:
+                continue
+            start[i] = float(task['start'])
+            end[i] = float(task['end']) if task.get('end') is not None else start[i] + float(task.get('duration', 0))
+            line[i] = self.line_pos.get(task.get('line'), -1)
+            operator[i] = self.operator_pos.get(task.get('operator'), -1)
+        return {'start': start, 'end': end, 'line': line, 'operator': operator}
+
+    # --- KPIs ---
+
+    def kpis(self, arrays: Dict[str, np.ndarray], req: Optional[SolveRequest] = None) -> Dict:
+        """
+        KPIs of one schedule. Availabilities come from `req` when given (e.g. a scenario that
+        changed shifts), otherwise from the engine's request.
+        """
+        start, end, line = arrays['start'], arrays['end'], arrays['line']
+        scheduled = ~np.isnan(end)
+        makespan = float(np.max(end[scheduled])) if scheduled.any() else 0.0
+        busy = np.where(scheduled, end - start, 0.0)
+
+        # Job completion and weighted tardiness
+        job_end = np.full(len(self.job_ids), np.nan)
+        if len(self.job_offsets):
+            job_end[self.has_tasks] = np.fmax.reduceat(end, self.job_offsets)
+        with np.errstate(invalid='ignore'):
+            tardiness = np.where(np.isnan(self.due) | np.isnan(job_end), 0.0, np.maximum(0.0, job_end - self.due))
+            late = np.where(np.isnan(self.due), False, job_end > self.due)
+
+        # Consecutive tasks on each line: setup time between them and idle time left over
+        on_line = np.flatnonzero(scheduled & (line >= 0))
+        order = on_line[np.lexsort((start[on_line], line[on_line]))]
+        same_line = line[order[1:]] == line[order[:-1]]
+        prev, nxt = order[:-1][same_line], order[1:][same_line]
+        setup = np.zeros(len(prev))
+        if len(self.setup_keys) and len(prev):
+            keys = (line[prev] * self.n_jobs + self.job_of_task[prev]) * self.n_jobs + self.job_of_task[nxt]
+            pos = np.minimum(np.searchsorted(self.setup_keys, keys), len(self.setup_keys) - 1)
+            setup = np.where(self.setup_keys[pos] == keys, self.setup_values[pos], 0.0)
+        gaps = np.maximum(0.0, start[nxt] - end[prev])
+        setup = np.minimum(setup, gaps)
+        idle = gaps - setup
+        n_lines = len(self.line_ids)
+        setup_per_line = np.bincount(line[prev], weights=setup, minlength=n_lines)
+        idle_per_line = np.bincount(line[prev], weights=idle, minlength=n_lines)
+
+        # Utilization: busy time over the time each resource was available up to the makespan
+        line_busy = np.bincount(line[on_line], weights=busy[on_line], minlength=n_lines)
+        on_operator = np.flatnonzero(scheduled & (arrays['operator'] >= 0))
+        operator_busy = np.bincount(arrays['operator'][on_operator], weights=busy[on_operator],
+                                    minlength=len(self.operator_ids))
+        line_capacity = self._capacity(self.line_ids, makespan, req)
+        operator_capacity = self._capacity(self.operator_ids, makespan, req)
+
+        return {
+            'makespan': makespan,
+            'jobEnd': job_end,
+            'tardiness': tardiness,
+            'weightedTardiness': float(np.sum(tardiness * self.priority)),
+            'deadlinesMet': int(np.sum(self.has_tasks & ~late)),
+            'lateJobs': int(np.sum(late)),
+            'setupTime': float(np.sum(setup)),
+            'idleTime': float(np.sum(idle)),
+            'utilization': _percent(line_busy.sum(), line_capacity.sum()),
+            'lineUtilization': _percent(line_busy, line_capacity),
+            'operatorUtilization': _percent(operator_busy, operator_capacity),
+            'lineSetupTime': setup_per_line,
+            'lineIdleTime': idle_per_line,
+        }
+
+    def _capacity(self, resource_ids: List[str], makespan: float, req: Optional[SolveRequest]) -> np.ndarray:
+        """Available minutes of each resource in [0, makespan] (all of it when it has no shifts)."""
+        calendars = CalendarSet(req) if req is not None else self.calendars
+        capacity = np.full(len(resource_ids), makespan)
+        for i, resource_id in enumerate(resource_ids):
+            calendar = calendars.get(resource_id)
+            if calendar is not None:
+                capacity[i] = calendar.available(0, int(math.ceil(makespan)))
+        return capacity
+
+    # --- what-if comparison ---
+
+    def impact(self, tasks_after: List[Dict], req_after: Optional[SolveRequest] = None) -> Dict:
+        """Impact analysis of a scenario schedule against the baseline, in the /whatif format."""
+        before = self.baseline
+        after = self.kpis(self.arrays(tasks_after), req_after)
+
+        end_before = np.nan_to_num(before['jobEnd'])
+        end_after = np.where(np.isnan(after['jobEnd']), end_before, after['jobEnd'])
+        delta_hours = np.round((end_after - end_before) / 60.0, 2)
+        status = np.where(delta_hours < -0.5, 'improved', np.where(delta_hours > 0.5, 'degraded', 'neutral'))
+        times_before = _report_times(end_before)
+        times_after = _report_times(end_after)
+        tardiness_delta = after['tardiness'] - before['tardiness']
+
+        job_impacts = [
+            {
+                'jobId': self.job_ids[j],
+                'jobName': self.job_names[j],
+                'endTimeBefore': times_before[j],
+                'endTimeAfter': times_after[j],
+                'deltaHours': float(delta_hours[j]),
+                'status': str(status[j]),
+                'tardinessBefore': float(before['tardiness'][j]),
+                'tardinessAfter': float(after['tardiness'][j]),
+                'tardinessDelta': float(tardiness_delta[j]),
+            }
+            for j in np.flatnonzero(self.has_tasks)
+        ]
+
+        return {
+            'jobImpacts': job_impacts,
+            'globalMetrics': {
+                'makespanBefore': before['makespan'],
+                'makespanAfter': after['makespan'],
+                'makespanDelta': after['makespan'] - before['makespan'],
+                'utilizationBefore': before['utilization'],
+                'utilizationAfter': after['utilization'],
+                'deadlinesMetBefore': before['deadlinesMet'],
+                'deadlinesMetAfter': after['deadlinesMet'],
+                'weightedTardinessBefore': before['weightedTardiness'],
+                'weightedTardinessAfter': after['weightedTardiness'],
+                'setupTimeBefore': before['setupTime'],
+                'setupTimeAfter': after['setupTime'],
+                'idleTimeBefore': before['idleTime'],
+                'idleTimeAfter': after['idleTime'],
+                'lineUtilization': _per_resource(self.line_ids, before['lineUtilization'], after['lineUtilization']),
+                'operatorUtilization': _per_resource(self.operator_ids, before['operatorUtilization'],
+                                                     after['operatorUtilization']),
+            }
+        }
+
+
+def _percent(busy, capacity):
+    """Busy time as a percentage of capacity (0 where there was no capacity)."""
+    busy, capacity = np.asarray(busy, dtype=float), np.asarray(capacity, dtype=float)
+    result = np.divide(busy * 100.0, capacity, out=np.zeros_like(busy), where=capacity > 0)
+    return round(float(result), 1) if result.ndim == 0 else np.round(result, 1)
+
+
+def _report_times(minutes: np.ndarray) -> List[str]:
+    return list(np.datetime_as_string(REPORT_BASE_TIME + np.round(minutes).astype('timedelta64[m]'), unit='s'))
+
+
+def _per_resource(resource_ids: List[str], before: np.ndarray, after: np.ndarray) -> Dict[str, Dict]:
+    return {
+        resource_id: {'before': float(b), 'after': float(a)}
+        for resource_id, b, a in zip(resource_ids, before, after)
+    }
@@ -0,0 +1,380 @@
+from typing import Dict, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import math
+import operator
+import random
+import time
+
+from .models import AvailabilityInterval, ResourceAvailability, SolveOptions, SolveRequest
+from .dispatch import dispatch_schedule
+from .metrics import merge_phases
+from .preprocess import ProblemIndex, index_previous_schedule
+from .profiles import resolve_solver_profile
+from .solver import solve_schedule
+
+# Neighbourhood kinds, tried in turn
+NEIGHBORHOODS = ('tardy', 'line', 'window')
+# Smallest neighbourhood (in jobs) the adaptive size shrinks to
+MIN_NEIGHBORHOOD_JOBS = 3
+# What a solution event reports as changed about a task
+PLACEMENT = operator.itemgetter('start', 'end', 'line', 'operator')
+
+
+class ProgressCounter:
+    """Passes solution events on to a progress queue, counting them so the LNS continues their numbering."""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.count = 0
+
+    def put(self, event: Dict):
+        self.count += 1
+        self.progress.put(event)
+
+
+def schedule_objective(req: SolveRequest, jobs: List[Dict]):
+    """(objective, makespan, weighted tardiness) of a schedule, weighted as in solve_schedule."""
+    makespan = 0
+    tardiness = 0
+    starts = 0
+    for job, res_job in zip(req.jobs, jobs):
+        for task in res_job['tasks']:
+            makespan = max(makespan, task['end'])
+            starts += task['start']
+        if job.dueDate is not None and res_job['tasks']:
+            tardiness += max(0, res_job['tasks'][-1]['end'] - job.dueDate) * job.priority
+    return tardiness * 10000 + makespan * 100 + starts, makespan, tardiness
+
+
+def schedule_conflicts(index: ProblemIndex, req: SolveRequest, jobs: List[Dict], changed: Set[int]) -> bool:
+    """
+    Whether a task of the `changed` jobs overlaps another task on its line or operator, or
+    sits closer to its neighbour on a line than their setup time. Neighbourhoods solved in
+    parallel start from the same schedule, so combining their results needs this check.
+    """
+    by_resource = collections.defaultdict(list)
+    for job_idx, res_job in enumerate(jobs):
+        job_id = req.jobs[job_idx].id
+        for task in res_job['tasks']:
+            for key in ('line', 'operator'):
+                by_resource[key, task[key]].append((task['start'], task['end'], job_id, job_idx in changed))
+    changed_resources = {(key, task[key]) for j in changed for task in jobs[j]['tasks'] for key in ('line', 'operator')}
+    for key, resource_id in changed_resources:
+        if resource_id in ("Unknown", "None"):
+            continue
+        placed = sorted(by_resource[key, resource_id])
+        for before, after in zip(placed, placed[1:]):
+            if not (before[3] or after[3]):
+                continue
+            setup = index.setup_index.get((resource_id, before[2], after[2]), 0) if key == 'line' else 0
+            if before[1] + setup > after[0]:
+                return True
+    return False
+
+
+class LnsDriver:
+    """
+    Large-neighbourhood search around the CP-SAT model. From the current best schedule it
+    frees a few jobs at a time - the tardiest ones, those sequenced together on one line,
+    or those running in one time window - and re-solves only them. Every other task becomes
+    reserved time on its line and operator, so each sub-model stays small however large the
+    plan is. Improvements are kept. Several neighbourhoods are solved at once on threads
+    (CP-SAT releases the GIL while it searches) and merged in a fixed order.
+    """
+
+    def __init__(self, req: SolveRequest, parameters: Optional[Dict] = None, progress=None, stop_event=None):
+        self.req = req
+        self.options = req.options or SolveOptions()
+        self.index = ProblemIndex(req)
+        _, profile = resolve_solver_profile(self.options)
+        solver_parameters = {**profile["parameters"], **(parameters or {})}
+        self.budget = solver_parameters.get("max_time_in_seconds", 10.0)
+        self.parallel = max(1, self.options.lnsParallel or solver_parameters.get("num_search_workers", 1))
+        self.rng = random.Random(solver_parameters.get("random_seed", 0))
+        self.progress = ProgressCounter(progress) if progress is not None else None
+        self.stop_event = stop_event
+        self.size = max(MIN_NEIGHBORHOOD_JOBS, self.options.lnsNeighborhoodJobs)
+
+        frozen = set(self.options.frozenTaskIds)
+        self.movable = [j for j, job in enumerate(req.jobs)
+                        if job.tasks and not any(t.id in frozen for t in job.tasks)]
+        # Setup time bounds per job, to pad reserved time on lines with setups
+        self.setups_from = collections.defaultdict(dict)  # (line, from job) -> {to job: duration}
+        self.setups_into = collections.defaultdict(dict)  # (line, to job) -> {from job: duration}
+        for (line_id, from_job, to_job), duration in self.index.setup_index.items():
+            self.setups_from[line_id, from_job][to_job] = duration
+            self.setups_into[line_id, to_job][from_job] = duration
+
+    # --- neighbourhoods ---
+
+    def neighborhood(self, kind: str, jobs: List[Dict], taken: Set[int]) -> List[int]:
+        """Job indices to re-solve; jobs already taken this round are skipped."""
+        candidates = [j for j in self.movable if j not in taken]
+        if not candidates:
+            return []
+        size = min(int(self.size), len(candidates))
+        placed = [(task['start'], j, task) for j in candidates for task in jobs[j]['tasks']]
+
+        if kind == 'tardy':
+            late = []
+            for j in candidates:
+                job = self.req.jobs[j]
+                if job.dueDate is not None:
+                    late.append((max(0, jobs[j]['tasks'][-1]['end'] - job.dueDate) * job.priority, j))
+            late = [j for lateness, j in sorted(late, reverse=True) if lateness > 0]
+            if late:
+                # Some of the tardiest jobs, then whatever runs around them in time
+                chosen = self.rng.sample(late[:size], max(1, min(len(late), size) // 2))
+                anchor = jobs[chosen[0]]['tasks'][0]['start']
+                return self._fill(chosen, placed, anchor, size)
+            kind = 'window'
+
+        if kind == 'line':
+            by_line = collections.defaultdict(list)
+            for start, j, task in placed:
+                by_line[task['line']].append((start, j))
+            line_id = self.rng.choice(sorted(by_line))
+            sequence = sorted(by_line[line_id])
+            first = self.rng.randrange(len(sequence))
+            chosen = list(dict.fromkeys(j for _, j in sequence[first:first + size]))
+            return self._fill(chosen, placed, sequence[first][0], size)
+
+        anchor = self.rng.choice(placed)[0]
+        return self._fill([], placed, anchor, size)
+
+    @staticmethod
+    def _fill(chosen: List[int], placed, anchor: int, size: int) -> List[int]:
+        """Top up `chosen` with the jobs whose tasks start closest to `anchor`."""
+        chosen = list(dict.fromkeys(chosen))[:size]
+        seen = set(chosen)
+        for _, j, _ in sorted(placed, key=lambda p: abs(p[0] - anchor)):
+            if len(chosen) >= size:
+                break
+            if j not in seen:
+                seen.add(j)
+                chosen.append(j)
+        return chosen
+
+    # --- sub-models ---
+
+    def sub_request(self, free: List[int], jobs: List[Dict]) -> SolveRequest:
+        """The free jobs alone, with everything else reserved on the resources it occupies (or frozen next to them)."""
+        free_set = set(free)
+        free_ids = {self.req.jobs[j].id for j in free}
+
+        # On lines with setups the fixed tasks right before and after a free one stay in the
+        # model, frozen, so the setups between them are exact and the current placement
+        # remains a valid hint
+        boundary = set()
+        by_line = collections.defaultdict(list)
+        for j, res_job in enumerate(jobs):
+            for t_idx, task in enumerate(res_job['tasks']):
+                if task['line'] in self.index.lines_with_setups:
+                    by_line[task['line']].append((task['start'], j, t_idx))
+        room = {}  # (job, task) -> idle time before and after it on its line
+        for sequence in by_line.values():
+            sequence.sort()
+            for k, (_, j, t_idx) in enumerate(sequence):
+                if j in free_set:
+                    boundary.update(n[1:] for n in sequence[max(0, k - 1):k + 2] if n[1] not in free_set)
+                task = jobs[j]['tasks'][t_idx]
+                before = task['start'] - jobs[sequence[k - 1][1]]['tasks'][sequence[k - 1][2]]['end'] if k > 0 else task['start']
+                after = (jobs[sequence[k + 1][1]]['tasks'][sequence[k + 1][2]]['start'] - task['end']
+                         if k + 1 < len(sequence) else math.inf)
+                room[j, t_idx] = (before, after)
+
+        reserved = collections.defaultdict(list)
+        open_end = 0
+        for j, res_job in enumerate(jobs):
+            for t_idx, task in enumerate(res_job['tasks']):
+                open_end = max(open_end, task['end'])
+                if j in free_set or (j, t_idx) in boundary:
+                    continue
+                job_id = self.req.jobs[j].id
+                line_id = task['line']
+                # Further away, keep room for the worst setup to or from a free job (the idle time
+                # up to the neighbouring fixed tasks at most)
+                room_before, room_after = room.get((j, t_idx), (0, 0))
+                before = min(room_before, max((d for f, d in self.setups_into[line_id, job_id].items() if f in free_ids), default=0))
+                after = min(room_after, max((d for t, d in self.setups_from[line_id, job_id].items() if t in free_ids), default=0))
+                reserved[line_id].append((task['start'] - before, task['end'] + after))
+                reserved[task['operator']].append((task['start'], task['end']))
+        open_end = 2 * max(open_end, self.index.horizon())
+
+        availabilities = []
+        for resource_id in list(self.index.line_ids) + list(self.index.operator_ids):
+            avail = self.index.availability_for(resource_id)
+            blocked = [AvailabilityInterval(start=max(0, s), end=e) for s, e in reserved.get(resource_id, []) if e > max(0, s)]
+            if not blocked:
+                if avail is not None:
+                    availabilities.append(avail)
+                continue
+            if avail is None:
+                avail = ResourceAvailability(resourceId=resource_id, intervals=[AvailabilityInterval(start=0, end=open_end)])
+            availabilities.append(avail.model_copy(update={'reserved': avail.reserved + blocked}))
+
+        boundary_jobs = []
+        for j, t_idx in sorted(boundary):
+            job = self.req.jobs[j]
+            boundary_jobs.append(job.model_copy(update={
+                'tasks': [job.tasks[t_idx].model_copy(update={'eligibleLines': [jobs[j]['tasks'][t_idx]['line']],
+                                                              'manualStart': None})],
+                'dueDate': None,
+            }))
+
+        # Free jobs first, so the result's first len(free) jobs are theirs
+        return SolveRequest(
+            jobs=[self.req.jobs[j] for j in free] + boundary_jobs,
+            lines=self.req.lines,
+            operators=self.req.operators,
+            setupTimes=self.req.setupTimes,
+            availabilities=availabilities,
+            calendars=self.req.calendars,
+            options=self.options.model_copy(update={
+                'decomposition': 'none',
+                'frozenTaskIds': [jobs[j]['tasks'][t_idx]['id'] for j, t_idx in sorted(boundary)],
+                'fallback': False,
+            }),
+            previousSchedule=[jobs[j] for j in free] + [jobs[j]['tasks'][t_idx] for j, t_idx in sorted(boundary)],
+        )
+
+    # --- search ---
+
+    def put_progress(self, best: List[Dict], objective: float, changed: List[Dict], t_start: float):
+        """Stream a better schedule, numbered after the solutions the initial solve streamed."""
+        _, makespan, tardiness = schedule_objective(self.req, best)
+        self.progress.put({
+            "solution": self.progress.count + 1,
+            "objective": objective,
+            "bestBound": None,
+            "makespan": makespan,
+            "tardiness": tardiness,
+            "wallTime": time.perf_counter() - t_start,
+            "timestamp": time.time(),
+            "changedTasks": changed,
+        })
+
+    def run(self) -> Dict:
+        t_start = time.perf_counter()
+        deadline = t_start + self.budget
+        initial_seconds = min(self.options.lnsInitialSeconds, self.budget)
+        if initial_seconds > 0:
+            initial = solve_schedule(
+                self.req.model_copy(update={'options': self.options.model_copy(update={'decomposition': 'none'})}),
+                {'max_time_in_seconds': initial_seconds, 'num_search_workers': self.parallel},
+                self.progress, self.stop_event,
+            )
+        else:
+            # Plans too large to even build the full model in time start from the greedy schedule
+            previous = index_previous_schedule(self.req.previousSchedule)
+            fixed = {t: previous[t] for t in self.options.frozenTaskIds if t in previous}
+            initial = dispatch_schedule(self.req, self.options.dispatchRule, self.index, fixed)
+            initial["fallback"] = True
+        if initial.get('status') != 'success':
+            return initial
+        best = initial['tasks']
+        best_objective = schedule_objective(self.req, best)[0]
+        initial_objective = best_objective
+        if self.progress is not None and self.progress.count == 0:
+            # The first event lists every task; the initial solve streamed nothing (greedy start or fallback)
+            self.put_progress(best, best_objective, [dict(t, jobId=job['id']) for job in best for t in job['tasks']], t_start)
+        stats = [initial.get('stats', {})]
+        rounds = neighborhoods = improvements = 0
+        kinds = collections.Counter()
+        improved_by = collections.Counter()
+        # A first solve proved optimal leaves nothing for the neighbourhoods to find
+        optimal = not initial.get('fallback') and initial.get('stats', {}).get('gap') == 0
+        stall = 0
+        stop_reason = "initial solution is optimal" if optimal else None
+
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            while self.movable and not optimal:
+                remaining = deadline - time.perf_counter()
+                if remaining < 0.05 or (self.stop_event is not None and self.stop_event.is_set()):
+                    break
+                if stall >= self.options.lnsStallRounds:
+                    stop_reason = f"no improvement in {stall} rounds"
+                    break
+                # One round: a few disjoint neighbourhoods, solved side by side
+                taken = set()
+                round_plan = []
+                for k in range(self.parallel):
+                    kind = NEIGHBORHOODS[(rounds * self.parallel + k) % len(NEIGHBORHOODS)]
+                    free = self.neighborhood(kind, best, taken)
+                    if free:
+                        taken.update(free)
+                        round_plan.append((kind, free))
+                if not round_plan:
+                    break
+                # Probing the many holes reserved time leaves in the start domains takes longer
+                # than the search itself on these small models
+                parameters = {'max_time_in_seconds': min(self.options.lnsNeighborhoodSeconds, remaining),
+                              'num_search_workers': 1, 'cp_model_probing_level': 0}
+                futures = [executor.submit(solve_schedule, self.sub_request(free, best), parameters, None, self.stop_event)
+                           for _, free in round_plan]
+                rounds += 1
+                stall += 1
+
+                for (kind, free), future in zip(round_plan, futures):
+                    result = future.result()
+                    neighborhoods += 1
+                    kinds[kind] += 1
+                    if result.get('status') != 'success' or result.get('fallback'):
+                        self.size = max(MIN_NEIGHBORHOOD_JOBS, self.size * 0.9)
+                        continue
+                    stats.append(result.get('stats', {}))
+                    # Neighbourhoods the solver closes quickly can be larger
+                    proved = result.get('stats', {}).get('gap', 1.0) == 0
+                    self.size = min(len(self.movable), self.size * 1.1) if proved else max(MIN_NEIGHBORHOOD_JOBS, self.size * 0.95)
+
+                    candidate = list(best)
+                    for j, res_job in zip(free, result['tasks']):
+                        candidate[j] = res_job
+                    objective = schedule_objective(self.req, candidate)[0]
+                    if objective < best_objective and not schedule_conflicts(self.index, self.req, candidate, set(free)):
+                        changed = [dict(t, jobId=candidate[j]['id']) for j in free
+                                   for t, before in zip(candidate[j]['tasks'], best[j]['tasks'])
+                                   if PLACEMENT(t) != PLACEMENT(before)]
+                        best, best_objective = candidate, objective
+                        improvements += 1
+                        improved_by[kind] += 1
+                        stall = 0
+                        if self.progress is not None:
+                            self.put_progress(best, objective, changed, t_start)
+
+        objective, makespan, tardiness = schedule_objective(self.req, best)
+        return {
+            "status": "success",
+            "makespan": makespan,
+            "tardiness": tardiness,
+            "stats": {
+                "rounds": rounds,
+                "neighborhoods": neighborhoods,
+                "improvements": improvements,
+                "neighborhood_kinds": dict(kinds),
+                "improvements_by_kind": dict(improved_by),
+                "initial_objective": initial_objective,
+                "objective": objective,
+                "parallel": self.parallel,
+                "wall_time": time.perf_counter() - t_start,
+                "build_time": sum(s.get('build_time', 0) for s in stats),
+                "solve_time": sum(s.get('solve_time', 0) for s in stats),
+                "phases": merge_phases(s.get('phases') for s in stats),
+                "accepted_early": bool(self.stop_event is not None and self.stop_event.is_set()),
+                "stopped_early": stop_reason is not None,
+            },
+            "tasks": best,
+            "logs": [
+                f"Solver Status: LNS ({rounds} rounds, {improvements}/{neighborhoods} neighborhoods improved)",
+                f"SME Objective (Weighted Tardiness): {tardiness}",
+                f"Production Makespan: {makespan}",
+                f"Objective: {initial_objective} -> {objective}",
+            ] + (["Initial solution from the dispatch-rule schedule."] if initial.get('fallback') else [])
+              + ([f"Stopped early: {stop_reason}."] if stop_reason else []),
+        }
+
+
+def solve_lns(req: SolveRequest, parameters: Optional[Dict] = None, progress=None, stop_event=None) -> Dict:
+    """Solve a large plan by large-neighbourhood search within the profile's time limit."""
+    return LnsDriver(req, parameters, progress, stop_event).run()
@@ -1,20 +1,25 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Optional
-import collections
-from ortools.sat.python import cp_model
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import collections
+import json
 import os
-import math
+import time
 
 app = FastAPI()
 
 # Global exception handler to catch Pydantic validation errors
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    body = await request.body()
+    try:
+        body = await request.body()
+    except RuntimeError:
+        body = b"<multipart form, already read>"  # e.g. /import uploads
     print("=" * 80)
     print("PYDANTIC VALIDATION ERROR CAUGHT!")
     print(f"URL: {request.url}")
@@ -27,6 +32,14 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": exc.errors()}
     )
 
+from .admission import DEFAULT_CLIENT, PRIORITY_CLASSES, AdmissionRejected
+
+# Solves the admission queue turns away: 429 when the queue is full, 413 when the model is too large
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    headers = {"Retry-After": "10"} if exc.status_code == 429 else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -37,343 +50,479 @@ app.add_middleware(
 
 from .models import (
     Task, Job, Operator, Line, SetupTime, AvailabilityInterval, 
-    ResourceAvailability, SolveRequest, WhatIfModification, 
-    WhatIfScenario, WhatIfSimulateRequest, JobImpact, ImpactAnalysis
+    ResourceAvailability, SolveRequest, SolveOptions, WhatIfModification, 
+    WhatIfScenario, WhatIfSimulateRequest, WhatIfBatchRequest, JobImpact, ImpactAnalysis,
+    JobPatch, TaskPatch, AvailabilityPatch
+)
+from .whatif_helpers import (
+    ScenarioBase, apply_whatif_modifications, downstream_task_ids, find_touched_task_ids, placed_task_ids
 )
+from .kpi import KpiEngine
+from . import jobs, metrics
+from .cache import schedule_cache
+from .profiles import resolve_solver_profile
+from .calendars import check_calendars
+from .encoding import diff_schedule, encode_response, format_tasks
+from .ingest import UnsupportedFileFormat, file_format, import_files
+from .store import get_store
+
+@app.on_event("shutdown")
+async def shutdown_solver_pool():
+    jobs.admission_queue.cancel_waiting()
+    jobs.shutdown_executor()
+
+def _check_request(req: SolveRequest):
+    try:
+        resolve_solver_profile(req.options)
+        check_calendars(req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _admission(request: Request, default_priority: str) -> Dict:
+    """Client and priority class of a solve: the X-Client-Id and X-Priority headers, else the endpoint's default."""
+    priority = request.headers.get('x-priority', default_priority)
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority class '{priority}', expected one of {list(PRIORITY_CLASSES)}")
+    client = request.headers.get('x-client-id') or (request.client.host if request.client else DEFAULT_CLIENT)
+    return {'client': client, 'priority': priority}
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    request.state.received_at = time.perf_counter()
+    response = await call_next(request)
+    metrics.registry.observe("scheduler_request_seconds", time.perf_counter() - request.state.received_at,
+                             path=request.url.path)
+    return response
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format: solve phase spans, model sizes, request durations, cache counters and the solve queue."""
+    cache_stats = schedule_cache.get_stats()
+    gauges = {
+        f"scheduler_cache_{key}": cache_stats[key]
+        for key in ("hits", "diskHits", "misses", "stores", "evictions", "entries", "bytes")
+    }
+    return PlainTextResponse(metrics.registry.render(gauges), media_type="text/plain; version=0.0.4")
 
 @app.post("/solve")
-async def solve_production(req: SolveRequest):
-    print("=" * 50)
-    print("SOLVE REQUEST RECEIVED")
-    print(f"Jobs: {len(req.jobs)}")
-    print(f"Lines: {len(req.lines)}")
-    print(f"Operators: {len(req.operators)}")
-    print("=" * 50)
-    model = cp_model.CpModel()
-    
-    # Pre-computation (Heuristic Horizon)
-    # Sum of all durations + buffer. In production, might want 'Start of earliest job + sum of durations'
-    horizon = int(sum(t.duration for j in req.jobs for t in j.tasks) + 1000)
-    
-    task_info = collections.defaultdict(list) # (job_id, task_idx) -> list of machine options
-    job_starts = {} # (job_id, task_idx) -> start_var
-    job_ends = {} # (job_id, task_idx) -> end_var
-    
-    line_to_intervals = collections.defaultdict(list)
-    operator_to_intervals = collections.defaultdict(list)
-    
-    for job_idx, job in enumerate(req.jobs):
-        for t_idx, task in enumerate(job.tasks):
-            suffix = f"_{job_idx}_{t_idx}"
-            
-            # Global start/end for the task
-            start_var = model.new_int_var(0, horizon, f"start{suffix}")
-            end_var = model.new_int_var(0, horizon, f"end{suffix}")
-            
-            # --- MANUAL OVERRIDE LOGIC ---
-            if task.manualStart is not None:
-                model.add(start_var == task.manualStart)
-            
-            job_starts[job_idx, t_idx] = start_var
-            job_ends[job_idx, t_idx] = end_var
-            
-            # --- MACHINE ASSIGNMENT ---
-            machine_options = []
-            for line_id in task.eligibleLines:
-                alt_suffix = f"{suffix}_{line_id}"
-                l_presence = model.new_bool_var(f"presence_line{alt_suffix}")
-                l_interval = model.new_optional_interval_var(start_var, int(math.ceil(task.duration)), end_var, l_presence, f"interval_line{alt_suffix}")
-                
-                machine_options.append((line_id, l_presence))
-                line_to_intervals[line_id].append({
-                    'interval': l_interval,
-                    'presence': l_presence,
-                    'job_id': job.id,
-                    'start': start_var,
-                    'end': end_var
-                })
-
-            if machine_options:
-                model.add_exactly_one([opt[1] for opt in machine_options])
-            
-            # --- OPERATOR ASSIGNMENT ---
-            capable_ops = [op for op in req.operators if task.skill in op.skills]
-            op_options = []
-            for op in capable_ops:
-                alt_op_suffix = f"{suffix}_{op.id}"
-                op_presence = model.new_bool_var(f"presence_op{alt_op_suffix}")
-                op_interval = model.new_optional_interval_var(start_var, int(math.ceil(task.duration)), end_var, op_presence, f"interval_op{alt_op_suffix}")
-                
-                op_options.append((op.id, op_presence))
-                operator_to_intervals[op.id].append(op_interval)
-            
-            if op_options:
-                model.add_exactly_one([opt[1] for opt in op_options])
-            
-            task_info[job_idx, t_idx] = {
-                'lines': machine_options,
-                'operators': op_options
-            }
-
-    # --- SHIFTS / AVAILABILITIES (FORBIDDEN INTERVALS) ---
-    def apply_availability(resource_id, all_intervals, availabilities):
-        # Find if this resource has specific availability
-        res_avail = next((a for a in availabilities if a.resourceId == resource_id), None)
-        if not res_avail:
-            return
-        
-        # Create forbidden intervals (gaps where the resource is NOT available)
-        # Assuming horizon is the max time
-        forbidden = []
-        last_end = 0
-        sorted_intervals = sorted(res_avail.intervals, key=lambda x: x.start)
-        
-        for interval in sorted_intervals:
-            if interval.start > last_end:
-                # Gap between last end and current start
-                forbidden.append(model.new_interval_var(last_end, interval.start - last_end, interval.start, f"gap_{resource_id}_{last_end}"))
-            last_end = interval.end
-        
-        if last_end < horizon:
-            forbidden.append(model.new_interval_var(last_end, horizon - last_end, horizon, f"gap_{resource_id}_{last_end}"))
-        
-        # Add no overlap between task intervals and forbidden gaps
-        model.add_no_overlap(all_intervals + forbidden)
-
-    # Constraint: No overlap on lines (including shifts and setup times)
-    for line_id, data_list in line_to_intervals.items():
-        intervals = [d['interval'] for d in data_list]
-        
-        # Apply shifts if any
-        if req.availabilities:
-            apply_availability(line_id, intervals, req.availabilities)
-        else:
-            model.add_no_overlap(intervals)
-            
-        # Apply setup times if any
-        if req.setupTimes:
-            line_setups = [s for s in req.setupTimes if s.lineId == line_id]
-            if line_setups:
-                num_tasks = len(data_list)
-                nodes = range(num_tasks + 1)
-                depot = num_tasks
-                arcs = []
-                for i in range(num_tasks):
-                    presence_i = data_list[i]['presence']
-                    
-                    # Depot -> i
-                    lit_start = model.new_bool_var(f"arc_depot_{i}_{line_id}")
-                    # Depot outgoing arcs sum to 1 (AddCircuit handles this if we include depot)
-                    arcs.append((depot, i, lit_start))
-                    
-                    # i -> Depot
-                    lit_end = model.new_bool_var(f"arc_{i}_depot_{line_id}")
-                    arcs.append((i, depot, lit_end))
-                    
-                    # i -> i (if not present)
-                    lit_self = model.new_bool_var(f"arc_{i}_{i}_{line_id}")
-                    model.add(lit_self == presence_i.Not())
-                    arcs.append((i, i, lit_self))
-                    
-                    for j in range(num_tasks):
-                        if i == j: continue
-                        lit_ij = model.new_bool_var(f"arc_{i}_{j}_{line_id}")
-                        arcs.append((i, j, lit_ij))
-                        
-                        # Find setup time
-                        setup = next((s for s in line_setups if s.fromJobId == data_list[i]['job_id'] and s.toJobId == data_list[j]['job_id']), None)
-                        if setup:
-                            model.add(data_list[i]['end'] + setup.duration <= data_list[j]['start']).only_enforce_if(lit_ij)
-                
-                # Depot loop (optional if no tasks assigned)
-                # Not needed if depot is just a routing point
-                model.add_circuit(arcs)
-
-    # Constraint: No overlap for operators (including shifts)
-    for op_id, intervals in operator_to_intervals.items():
-        if req.availabilities:
-            apply_availability(op_id, intervals, req.availabilities)
-        else:
-            model.add_no_overlap(intervals)
-
-    # Constraint: Precedence in jobs (Strict sequence)
-    for job_idx, job in enumerate(req.jobs):
-        for t_idx in range(len(job.tasks) - 1):
-            model.add(job_starts[job_idx, t_idx + 1] >= job_ends[job_idx, t_idx])
-
-    # --- SME Specific Objectives ---
-    # 1. Total Makespan
-    makespan = model.new_int_var(0, horizon, "makespan")
-    if req.jobs:
-        job_ends_vars = []
-        for j_idx, job in enumerate(req.jobs):
-            if job.tasks:
-                 job_ends_vars.append(job_ends[j_idx, len(job.tasks)-1])
-        if job_ends_vars:
-            model.add_max_equality(makespan, job_ends_vars)
+async def solve_production(req: SolveRequest, request: Request):
+    """
+    Solve a request. Options responseFormat and diffOnly shape the tasks in the response;
+    'Accept: application/msgpack' returns MessagePack instead of JSON.
+    """
+    # Body read and validation happen before the handler runs
+    parse_time = time.perf_counter() - request.state.received_at
+    metrics.registry.observe("scheduler_phase_seconds", parse_time, phase="parse")
+    _check_request(req)
+    # The model build and solve run in the worker pool so the event loop stays responsive
+    result = await jobs.run_solve(req, **_admission(request, 'normal'))
+    t_response = time.perf_counter()
+    if 'tasks' in result:
+        result = {**result, **format_tasks(result['tasks'], req)}
+    response_time = time.perf_counter() - t_response
+    metrics.registry.observe("scheduler_phase_seconds", response_time, phase="response")
+    if 'stats' in result:
+        phases = result['stats'].get('phases', {})
+        result['stats']['phases'] = {
+            'parse': {'seconds': parse_time, 'variables': 0, 'constraints': 0},
+            **phases,
+            'response': {'seconds': response_time, 'variables': 0, 'constraints': 0},
+        }
+    return encode_response(result, request.headers.get('accept'))
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return schedule_cache.get_stats()
+
+@app.delete("/cache")
+async def clear_cache():
+    schedule_cache.clear()
+    return schedule_cache.get_stats()
+
+@app.get("/queue/stats")
+async def get_queue_stats():
+    """Solves waiting by priority class and client, running solves and the memory they reserve."""
+    return jobs.admission_queue.get_stats()
+
+# ===== ASYNC SOLVE JOBS =====
+
+@app.post("/jobs/solve", status_code=202)
+async def submit_solve_job(req: SolveRequest, request: Request):
+    """Queue a solve and return immediately with a job id to poll."""
+    _check_request(req)
+    job = jobs.job_manager.submit(req, **_admission(request, 'normal'))
+    return job.to_dict()
+
+def _get_job_or_404(job_id: str):
+    job = jobs.job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_solve_job(job_id: str):
+    return _get_job_or_404(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_solve_job(job_id: str):
+    """
+    Server-Sent Events stream: a 'status' event on every state change, a 'solution' event
+    for every improving solution (objective, makespan, tardiness and the tasks that changed
+    since the previous one; the first lists every task), then a final 'result' event once
+    the job has finished.
+    """
+    job = _get_job_or_404(job_id)
+
+    async def events():
+        last_status = None
+        sent = 0
+        while True:
+            data = job.to_dict(include_result=False)
+            if data["status"] != last_status:
+                last_status = data["status"]
+                yield f"event: status\ndata: {json.dumps(data)}\n\n"
+            solutions = job.poll_solutions()
+            for solution in solutions[sent:]:
+                yield f"event: solution\ndata: {json.dumps(solution)}\n\n"
+            sent = len(solutions)
+            if job.future.done() or job.cancelled:
+                yield f"event: result\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/jobs/{job_id}/accept")
+async def accept_solve_job(job_id: str):
+    """Stop the search early; the job finishes with the best solution found so far."""
+    job = _get_job_or_404(job_id)
+    accepted = jobs.job_manager.accept(job_id)
+    return {"jobId": job_id, "accepted": accepted, "status": job.status}
+
+@app.delete("/jobs/{job_id}")
+async def cancel_solve_job(job_id: str):
+    job = _get_job_or_404(job_id)
+    cancelled = jobs.job_manager.cancel(job_id)
+    return {"jobId": job_id, "cancelled": cancelled, "status": job.status}
+
+# ===== SAVED SCHEDULES =====
+
+# One patch at a time per schedule: each re-solve starts from the previous one's result
+_schedule_locks: Dict[str, asyncio.Lock] = collections.defaultdict(asyncio.Lock)
+
+def _get_schedule_or_404(schedule_id: str):
+    saved = get_store().get(schedule_id)
+    if saved is None:
+        raise HTTPException(status_code=404, detail=f"Unknown schedule {schedule_id}")
+    return saved
+
+def _find_job_or_404(solve_request: SolveRequest, job_id: str) -> int:
+    for job_idx, job in enumerate(solve_request.jobs):
+        if job.id == job_id:
+            return job_idx
+    raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+
+def _apply_patch(model: BaseModel, patch: BaseModel) -> BaseModel:
+    """The model with the fields set in the patch, validated again so e.g. a null duration is a 422."""
+    try:
+        return type(model).model_validate({**model.model_dump(), **patch.model_dump(exclude_unset=True)})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+@app.post("/schedules", status_code=201)
+async def create_schedule(req: SolveRequest, request: Request):
+    """Solve a plan and save it with its schedule. Later calls refer to it by scheduleId."""
+    _check_request(req)
+    result = await jobs.run_solve(req, **_admission(request, 'normal'))
+    if result.get('status') != 'success':
+        return result
+    schedule_id, version = get_store().create(req.model_copy(update={'previousSchedule': None}), result)
+    return {'scheduleId': schedule_id, 'version': version, **result}
+
+@app.get("/schedules")
+async def list_schedules():
+    return get_store().list()
+
+@app.get("/schedules/{schedule_id}")
+async def get_schedule(schedule_id: str):
+    solve_request, result, version = _get_schedule_or_404(schedule_id)
+    return {'scheduleId': schedule_id, 'version': version, 'request': solve_request.model_dump(mode='json'), **result}
+
+@app.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: str):
+    return {'scheduleId': schedule_id, 'deleted': get_store().delete(schedule_id)}
+
+async def update_schedule(schedule_id: str, update, admission: Dict) -> Dict:
+    """
+    Apply `update(request, result) -> (new request, directly affected task ids)` to a saved
+    plan and re-solve only the affected portion: the affected tasks and the rest of their
+    jobs move, every other task stays frozen where it is (a full hinted re-solve is the
+    fallback). Returns only the tasks that changed.
+    """
+    async with _schedule_locks[schedule_id]:
+        solve_request, result, version = _get_schedule_or_404(schedule_id)
+        new_request, affected = update(solve_request, result)
+        _check_request(new_request)
+        touched = downstream_task_ids(new_request, affected)
+        frozen_ids = [t.id for j in new_request.jobs for t in j.tasks if t.id not in touched]
+        new_result = await solve_with_frozen(new_request.model_copy(update={'previousSchedule': result['tasks']}),
+                                             frozen_ids, admission)
+        if new_result.get('status') != 'success':
+            return {'scheduleId': schedule_id, 'version': version, **new_result}
+
+        version = get_store().update(schedule_id, new_request, new_result)
+        diff = diff_schedule(new_result['tasks'], result['tasks'])
+        return {
+            'scheduleId': schedule_id,
+            'version': version,
+            **{key: value for key, value in new_result.items() if key != 'tasks'},
+            'tasks': diff.pop('jobs'),
+            'diff': diff,
+        }
+
+@app.patch("/schedules/{schedule_id}/jobs/{job_id}")
+async def patch_schedule_job(schedule_id: str, job_id: str, patch: JobPatch, request: Request):
+    def update(solve_request: SolveRequest, result: Dict):
+        job_idx = _find_job_or_404(solve_request, job_id)
+        job = solve_request.jobs[job_idx]
+        jobs_list = list(solve_request.jobs)
+        jobs_list[job_idx] = _apply_patch(job, patch)
+        return solve_request.model_copy(update={'jobs': jobs_list}), {t.id for t in job.tasks}
+    return await update_schedule(schedule_id, update, _admission(request, 'interactive'))
+
+@app.patch("/schedules/{schedule_id}/tasks/{task_id}")
+async def patch_schedule_task(schedule_id: str, task_id: str, patch: TaskPatch, request: Request):
+    def update(solve_request: SolveRequest, result: Dict):
+        for job_idx, job in enumerate(solve_request.jobs):
+            for t_idx, task in enumerate(job.tasks):
+                if task.id == task_id:
+                    tasks = list(job.tasks)
+                    tasks[t_idx] = _apply_patch(task, patch)
+                    jobs_list = list(solve_request.jobs)
+                    jobs_list[job_idx] = job.model_copy(update={'tasks': tasks})
+                    return solve_request.model_copy(update={'jobs': jobs_list}), {task_id}
+        raise HTTPException(status_code=404, detail=f"Unknown task {task_id}")
+    return await update_schedule(schedule_id, update, _admission(request, 'interactive'))
+
+@app.patch("/schedules/{schedule_id}/availabilities/{resource_id}")
+async def patch_schedule_availability(schedule_id: str, resource_id: str, patch: AvailabilityPatch, request: Request):
+    """Replace the shifts (or calendar) of a line or operator; the tasks placed on it are re-solved."""
+    def update(solve_request: SolveRequest, result: Dict):
+        others = [a for a in solve_request.availabilities or [] if a.resourceId != resource_id]
+        availabilities = others + [ResourceAvailability(resourceId=resource_id, **patch.model_dump())]
+        new_request = solve_request.model_copy(update={'availabilities': availabilities})
+        return new_request, placed_task_ids(result['tasks'], resource_id)
+    return await update_schedule(schedule_id, update, _admission(request, 'interactive'))
+
+@app.post("/schedules/{schedule_id}/jobs")
+async def add_schedule_job(schedule_id: str, job: Job, request: Request):
+    """Add an order to a saved plan; only its tasks are scheduled, around the existing ones."""
+    def update(solve_request: SolveRequest, result: Dict):
+        if any(j.id == job.id for j in solve_request.jobs):
+            raise HTTPException(status_code=409, detail=f"Job {job.id} already exists")
+        return solve_request.model_copy(update={'jobs': solve_request.jobs + [job]}), {t.id for t in job.tasks}
+    return await update_schedule(schedule_id, update, _admission(request, 'interactive'))
+
+@app.delete("/schedules/{schedule_id}/jobs/{job_id}")
+async def delete_schedule_job(schedule_id: str, job_id: str):
+    """Remove an order from a saved plan. The rest of the schedule is kept as it is."""
+    async with _schedule_locks[schedule_id]:
+        solve_request, result, version = _get_schedule_or_404(schedule_id)
+        job_idx = _find_job_or_404(solve_request, job_id)
+        jobs_list = solve_request.jobs[:job_idx] + solve_request.jobs[job_idx + 1:]
+        result = dict(result, tasks=[j for j in result['tasks'] if j['id'] != job_id])
+        version = get_store().update(schedule_id, solve_request.model_copy(update={'jobs': jobs_list}), result)
+        return {'scheduleId': schedule_id, 'version': version, 'removedJobId': job_id}
+
+# ===== BULK IMPORT =====
+
+def _read_import(uploads: Dict[str, Optional[UploadFile]], options: Optional[str]):
+    """Import uploaded row files (see ingest.ROW_MODELS). Blocking: run it in a thread."""
+    try:
+        solve_options = SolveOptions.model_validate_json(options) if options else None
+        files = {name: (upload.file, file_format(upload.filename)) for name, upload in uploads.items() if upload is not None}
+        return import_files(files, solve_options)
+    except UnsupportedFileFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/import/validate")
+async def validate_import(jobs_file: UploadFile = File(..., alias="jobs"),
+                          tasks_file: UploadFile = File(..., alias="tasks"),
+                          operators_file: UploadFile = File(..., alias="operators"),
+                          lines_file: Optional[UploadFile] = File(None, alias="lines"),
+                          setups_file: Optional[UploadFile] = File(None, alias="setups"),
+                          availabilities_file: Optional[UploadFile] = File(None, alias="availabilities")):
+    """Check CSV or Parquet exports without solving: row counts and errors by file, row and column."""
+    uploads = {'jobs': jobs_file, 'tasks': tasks_file, 'operators': operators_file, 'lines': lines_file,
+               'setups': setups_file, 'availabilities': availabilities_file}
+    _, report = await run_in_threadpool(_read_import, uploads, None)
+    return report
+
+@app.post("/import/schedules", status_code=201)
+async def import_schedule(request: Request,
+                          jobs_file: UploadFile = File(..., alias="jobs"),
+                          tasks_file: UploadFile = File(..., alias="tasks"),
+                          operators_file: UploadFile = File(..., alias="operators"),
+                          lines_file: Optional[UploadFile] = File(None, alias="lines"),
+                          setups_file: Optional[UploadFile] = File(None, alias="setups"),
+                          availabilities_file: Optional[UploadFile] = File(None, alias="availabilities"),
+                          options: Optional[str] = Form(None)):
+    """
+    Import CSV or Parquet exports (one file per table, see ingest.ROW_MODELS; `options` is
+    SolveOptions as JSON), then solve and save the plan as POST /schedules does.
+    Any row error answers 422 with the import report and nothing is solved.
+    """
+    uploads = {'jobs': jobs_file, 'tasks': tasks_file, 'operators': operators_file, 'lines': lines_file,
+               'setups': setups_file, 'availabilities': availabilities_file}
+    req, report = await run_in_threadpool(_read_import, uploads, options)
+    if req is None:
+        return JSONResponse(status_code=422, content=report)
+    _check_request(req)
+    result = await jobs.run_solve(req, **_admission(request, 'normal'))
+    if result.get('status') != 'success':
+        return {'import': report, **result}
+    schedule_id, version = get_store().create(req, result)
+    return {'scheduleId': schedule_id, 'version': version, 'import': report, **result}
+
+async def solve_with_frozen(request: SolveRequest, frozen_ids: List[str], admission: Dict) -> Dict:
+    """Solve with the given tasks pinned to their previousSchedule placement."""
+    if frozen_ids:
+        options = (request.options or SolveOptions()).model_copy(update={'frozenTaskIds': frozen_ids, 'fallback': False})
+        solve_result = await jobs.run_solve(request.model_copy(update={'options': options}), **admission)
+        if solve_result.get('status') == 'success':
+            return solve_result
+        # Frozen tasks leave no room for the change: fall back to a full (hinted) re-solve
+    return await jobs.run_solve(request, **admission)
+
+async def run_whatif_scenario(scenario: WhatIfScenario, base: ScenarioBase, current_tasks: List[Dict],
+                              freeze_untouched: bool, kpi_engine: KpiEngine, admission: Dict) -> Dict:
+    """Apply one scenario's modifications to the base request, re-solve and analyse the impact."""
+    base_request = base.req
+    # Apply modifications to the base solve request (as an overlay sharing untouched jobs)
+    modified_solve_request = apply_whatif_modifications(
+        base_request, 
+        scenario.modifications,
+        base
+    )
+    # Warm start from the schedule the planner is looking at
+    modified_solve_request.previousSchedule = current_tasks
     
-    # 2. Tardiness
-    total_weighted_tardiness = model.new_int_var(0, horizon * 10000, "tardiness") # Increased bounds
-    job_tardiness_vars = []
+    frozen_ids = []
+    if freeze_untouched:
+        touched = find_touched_task_ids(base_request, scenario.modifications, current_tasks)
+        if touched is not None:
+            frozen_ids = [t.id for j in modified_solve_request.jobs for t in j.tasks if t.id not in touched]
     
-    for job_idx, job in enumerate(req.jobs):
-        if not job.tasks: continue
-        if job.dueDate is None: continue  # No deadline = no tardiness penalty
-        finish_time = job_ends[job_idx, len(job.tasks) - 1]
-        tardiness = model.new_int_var(0, horizon, f"tardiness_j{job_idx}")
-        
-        # tardiness >= finish - due
-        # tardiness >= 0
-        model.add(tardiness >= finish_time - job.dueDate)
-        model.add(tardiness >= 0)
-        
-        weighted_tardiness = model.new_int_var(0, horizon * 100, f"weighted_tardiness_j{job_idx}")
-        model.add(weighted_tardiness == tardiness * job.priority)
-        job_tardiness_vars.append(weighted_tardiness)
-        
-    if job_tardiness_vars:
-        model.add(total_weighted_tardiness == sum(job_tardiness_vars))
-    else:
-        model.add(total_weighted_tardiness == 0)
-
-    # Objective: Minimize Weighted Tardiness (Primary) + Makespan (Secondary) + StartTimes (Tertiary/Tie-Breaker)
-    # Scaled to prioritize tardiness
-    # Adding 'start_vars' sum helps compact the schedule to the left, reducing "floating" tasks and stabilizing results.
-    all_start_ints = []
-    for job_idx, job in enumerate(req.jobs):
-         for t_idx in range(len(job.tasks)):
-             all_start_ints.append(job_starts[job_idx, t_idx])
+    # Re-solve on a variant of the base's compiled model (a new model when the change needs one);
+    # the scenario's own request, with what it freezes, keys the schedule cache
+    options = (modified_solve_request.options or SolveOptions()).model_copy(update={'frozenTaskIds': frozen_ids})
+    solve_result = await jobs.run_scenario(
+        modified_solve_request.model_copy(update={'options': options}),
+        base_request, base.key, scenario.modifications, frozen_ids, **admission
+    )
     
-    model.minimize(total_weighted_tardiness * 10000 + makespan * 100 + sum(all_start_ints))
-
-    # Solve
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 10.0
-    # FORCE DETERMINISM: Single thread ensures results are identical for the same input
-    solver.parameters.num_search_workers = 1 
-    status = solver.solve(model)
-
-    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-        results = []
-        for job_idx, job in enumerate(req.jobs):
-            res_job = {"id": job.id, "name": job.name, "tasks": [], "color": job.color}
-            for t_idx, task in enumerate(job.tasks):
-                start_val = solver.value(job_starts[job_idx, t_idx])
-                end_val = solver.value(job_ends[job_idx, t_idx])
-                
-                info = task_info[job_idx, t_idx]
-                
-                line_id = "Unknown"
-                for l_id, l_presence in info['lines']:
-                    if solver.boolean_value(l_presence):
-                        line_id = l_id
-                        break
-                
-                op_id = "None"
-                for o_id, o_presence in info['operators']:
-                    if solver.boolean_value(o_presence):
-                        op_id = o_id
-                        break
-                
-                res_job["tasks"].append({
-                    "id": task.id,
-                    "name": task.name,
-                    "start": start_val,
-                    "end": end_val,
-                    "duration": task.duration,
-                    "color": job.color,
-                    "line": line_id,
-                    "operator": op_id,
-                    "priority": job.priority,
-                    "dueDate": job.dueDate,
-                    "manualStart": task.manualStart
-                })
-            results.append(res_job)
-        
-        return {
-            "status": "success",
-            "makespan": solver.value(makespan),
-            "tardiness": solver.value(total_weighted_tardiness),
-            "stats": {
-                "branches": solver.num_branches,
-                "conflicts": solver.num_conflicts,
-                "wall_time": solver.wall_time
-            },
-            "tasks": results,
-            "logs": [
-                f"Solver Status: {solver.status_name(status)}",
-                f"SME Objective (Weighted Tardiness): {solver.value(total_weighted_tardiness)}",
-                f"Production Makespan: {solver.value(makespan)}",
-            ]
-        }
-    else:
+    if solve_result.get('status') != 'success':
         return {
-            "status": "failed", 
-            "logs": [
-                f"Solver Status: {solver.status_name(status)}", 
-                "Infeasible constraints. Potential conflict with manual overrides."
-            ]
+            'status': 'failed',
+            'error': 'Failed to solve modified scenario',
+            'logs': solve_result.get('logs', [])
         }
+    
+    # Calculate impact analysis against the current schedule
+    impact = kpi_engine.impact(solve_result['tasks'], modified_solve_request)
+    
+    return {
+        'status': 'success',
+        'simulatedSchedule': {
+            # responseFormat/diffOnly of the base request apply; diffs are against currentTasks
+            **format_tasks(solve_result['tasks'], modified_solve_request),
+            'makespan': solve_result['makespan'],
+            'logs': solve_result['logs'],
+            'updatedAt': '2024-01-01T00:00:00Z'
+        },
+        'impactAnalysis': impact
+    }
+
+def _error_response(e: Exception) -> Dict:
+    import traceback
+    return {
+        'status': 'error',
+        'error': str(e),
+        'traceback': traceback.format_exc()
+    }
+
+def _whatif_base(base_schedule_id: str, solve_request: Optional[SolveRequest], current_tasks: Optional[List[Dict]]):
+    """The base request and current tasks of a what-if: as posted, or from the saved schedule."""
+    if solve_request is not None and current_tasks is not None:
+        return solve_request, current_tasks
+    saved = get_store().get(base_schedule_id)
+    if saved is None:
+        raise HTTPException(status_code=404, detail=f"Unknown schedule {base_schedule_id}")
+    saved_request, saved_result, _ = saved
+    if current_tasks is None:
+        current_tasks = [task for job in saved_result['tasks'] for task in job['tasks']]
+    return solve_request or saved_request, current_tasks
 
 @app.post("/whatif/simulate")
-async def simulate_whatif_scenario(req: WhatIfSimulateRequest):
+async def simulate_whatif_scenario(req: WhatIfSimulateRequest, request: Request):
     """
     Simulate a What-If scenario by applying modifications and re-solving.
     Returns the new schedule and impact analysis.
     """
+    solve_request, current_tasks = _whatif_base(req.scenario.baseScheduleId, req.currentSolveRequest, req.currentTasks)
+    admission = _admission(request, 'interactive')
     try:
-        from .whatif_helpers import apply_whatif_modifications, calculate_impact_analysis
-        
-        # Apply modifications to the base solve request
-        modified_solve_request = apply_whatif_modifications(
-            req.currentSolveRequest, 
-            req.scenario.modifications
-        )
-        
-        # Store original makespan
-        original_makespan = 0
-        if req.currentTasks:
-            original_makespan = max(
-                (task.get('start', 0) + task.get('duration', 0)) 
-                for task in req.currentTasks
-            )
-        
-        # Re-solve with modified parameters
-        solve_result = await solve_production(modified_solve_request)
-        
-        if solve_result.get('status') != 'success':
-            return {
-                'status': 'failed',
-                'error': 'Failed to solve modified scenario',
-                'logs': solve_result.get('logs', [])
-            }
-        
-        # Calculate impact analysis
-        impact = calculate_impact_analysis(
-            req.currentTasks,
-            solve_result['tasks'],
-            original_makespan,
-            solve_result['makespan']
+        result = await run_whatif_scenario(
+            req.scenario,
+            ScenarioBase(solve_request.model_copy(update={'previousSchedule': current_tasks})),
+            current_tasks,
+            req.freezeUntouched,
+            KpiEngine(solve_request, current_tasks),
+            admission
         )
-        
-        return {
-            'status': 'success',
-            'simulatedSchedule': {
-                'tasks': solve_result['tasks'],
-                'makespan': solve_result['makespan'],
-                'logs': solve_result['logs'],
-                'updatedAt': '2024-01-01T00:00:00Z'
-            },
-            'impactAnalysis': impact
-        }
-    
+    except AdmissionRejected:
+        raise
     except Exception as e:
-        import traceback
-        return {
-            'status': 'error',
-            'error': str(e),
-            'traceback': traceback.format_exc()
-        }
+        result = _error_response(e)
+    return encode_response(result, request.headers.get('accept'))
+
+@app.post("/whatif/batch")
+async def simulate_whatif_batch(req: WhatIfBatchRequest, request: Request):
+    """
+    Evaluate many scenarios against one base request. The request is parsed once and the
+    scenario solves run in parallel in the worker pool. Results are streamed as
+    newline-delimited JSON, one line per scenario, in completion order.
+    """
+    base_schedule_id = req.scenarios[0].baseScheduleId if req.scenarios else ''
+    solve_request, current_tasks = _whatif_base(base_schedule_id, req.currentSolveRequest, req.currentTasks)
+    # Baseline KPIs are computed once and shared by every scenario
+    kpi_engine = KpiEngine(solve_request, current_tasks)
+    admission = _admission(request, 'interactive')
+    # Indexed (and compiled by the workers) once; each scenario only copies the jobs it changes.
+    # The current tasks warm-start every scenario, so they are part of the base.
+    base = ScenarioBase(solve_request.model_copy(update={'previousSchedule': current_tasks}))
+
+    async def run(scenario: WhatIfScenario):
+        try:
+            result = await run_whatif_scenario(
+                scenario, base, current_tasks, req.freezeUntouched, kpi_engine, admission
+            )
+        except Exception as e:
+            result = _error_response(e)
+        return {'scenarioId': scenario.id, 'scenarioName': scenario.name, **result}
+
+    async def results():
+        pending = [asyncio.ensure_future(run(scenario)) for scenario in req.scenarios]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,149 @@
+from typing import Dict, Iterable, Optional, Tuple
+import collections
+import threading
+import time
+
+# Histogram buckets in seconds, from quick model builds to full-length solves
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class PhaseTimer:
+    """
+    Per-phase spans of one solve. lap(name) charges the wall time since the previous lap,
+    and the CP-SAT variables and constraints created since then, to `name`; phases that
+    are entered several times (e.g. once per resource) add up.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.phases: Dict[str, Dict] = {}
+        self.last = time.perf_counter()
+        self.last_size = (0, 0)
+
+    def set_model(self, model):
+        self.model = model
+        self.last_size = self._size()
+
+    def _size(self) -> Tuple[int, int]:
+        if self.model is None:
+            return 0, 0
+        return len(self.model.proto.variables), len(self.model.proto.constraints)
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        size = self._size()
+        entry = self.phases.setdefault(name, {"seconds": 0.0, "variables": 0, "constraints": 0})
+        entry["seconds"] += now - self.last
+        entry["variables"] += size[0] - self.last_size[0]
+        entry["constraints"] += size[1] - self.last_size[1]
+        self.last = now
+        self.last_size = size
+
+    def to_dict(self) -> Dict[str, Dict]:
+        return {name: dict(entry) for name, entry in self.phases.items()}
+
+
+def merge_phases(phase_dicts: Iterable[Optional[Dict[str, Dict]]]) -> Dict[str, Dict]:
+    """Sum the phases of several solves (e.g. the windows of a rolling-horizon solve)."""
+    merged = {}
+    for phases in phase_dicts:
+        for name, entry in (phases or {}).items():
+            total = merged.setdefault(name, {"seconds": 0.0, "variables": 0, "constraints": 0})
+            for key in total:
+                total[key] += entry.get(key, 0)
+    return merged
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus text-format registry: labelled counters, gauges and histograms.
+    Solves run in worker processes, so their phase spans are recorded here, in the API
+    process, from the stats each result carries back.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self.counters = collections.defaultdict(float)  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+
+    def counter(self, name: str, help_text: str):
+        self.help.setdefault(name, ("counter", help_text))
+
+    def gauge(self, name: str, help_text: str):
+        self.help.setdefault(name, ("gauge", help_text))
+
+    def histogram(self, name: str, help_text: str):
+        self.help.setdefault(name, ("histogram", help_text))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self.lock:
+            self.counters[name, tuple(sorted(labels.items()))] += value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[name, tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            buckets, total, count = self.histograms.get(key, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            self.histograms[key] = (buckets, total + value, count + 1)
+
+    def render(self, extra_gauges: Optional[Dict[str, float]] = None) -> str:
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in sorted(self.help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind in ("counter", "gauge"):
+                    values = self.counters if kind == "counter" else self.gauges
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_labels(labels)} {value}")
+                else:
+                    for (metric, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                        if metric != name:
+                            continue
+                        for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                            lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {bucket_count}")
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                        lines.append(f"{name}_sum{_labels(labels)} {total}")
+                        lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, value in sorted((extra_gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+registry = MetricsRegistry()
+registry.counter("scheduler_solves_total", "Solves run by the worker pool, by result status.")
+registry.histogram("scheduler_phase_seconds", "Wall time of each solve pipeline phase.")
+registry.counter("scheduler_phase_variables_total", "CP-SAT variables created by each model building phase.")
+registry.counter("scheduler_phase_constraints_total", "CP-SAT constraints posted by each model building phase.")
+registry.histogram("scheduler_request_seconds", "HTTP request duration by path.")
+registry.counter("scheduler_admissions_total", "Solves offered to the admission queue, by priority class and outcome.")
+registry.gauge("scheduler_queue_depth", "Solves waiting for a worker, by priority class.")
+registry.histogram("scheduler_queue_wait_seconds", "Time solves waited for a worker, by priority class.")
+registry.gauge("scheduler_solves_running", "Solves running in the worker pool.")
+registry.gauge("scheduler_solver_memory_reserved_bytes", "Estimated memory of the models being solved.")
+
+
+def record_solve(result: Dict):
+    """Record the outcome and phase spans of one solve result."""
+    registry.inc("scheduler_solves_total", status=result.get("status", "unknown"),
+                 fallback=str(bool(result.get("fallback"))).lower())
+    for name, entry in result.get("stats", {}).get("phases", {}).items():
+        registry.observe("scheduler_phase_seconds", entry["seconds"], phase=name)
+        registry.inc("scheduler_phase_variables_total", entry["variables"], phase=name)
+        registry.inc("scheduler_phase_constraints_total", entry["constraints"], phase=name)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
 
 class Task(BaseModel):
     id: str
@@ -9,6 +9,9 @@ class Task(BaseModel):
     skill: str
     order: Optional[int] = 0
     manualStart: Optional[int] = None
+    # Work stops during breaks of its line and operator and resumes in their next shift:
+    # duration is working time and the task spans the breaks
+    pausable: bool = False
 
 class Job(BaseModel):
     id: str
@@ -17,6 +20,7 @@ class Job(BaseModel):
     color: str
     priority: int
     dueDate: Optional[int] = None
+    setupFamily: Optional[str] = None  # Jobs sharing a family need no setup between them (defaults to the job id)
 
 class Operator(BaseModel):
     id: str
@@ -37,9 +41,81 @@ class AvailabilityInterval(BaseModel):
     start: int
     end: int
 
+class CalendarTemplate(BaseModel):
+    # Recurring shift pattern: intervals are offsets in a period and repeat every `period`
+    # minutes from validFrom (until validUntil, when given)
+    id: str
+    period: int = 7 * 24 * 60
+    intervals: List[AvailabilityInterval]
+    validFrom: int = 0
+    validUntil: Optional[int] = None
+
 class ResourceAvailability(BaseModel):
     resourceId: str
-    intervals: List[AvailabilityInterval]
+    intervals: List[AvailabilityInterval] = []
+    # Recurring template (SolveRequest.calendars) on top of the explicit intervals
+    calendarId: Optional[str] = None
+    # Unavailable periods (holidays, maintenance) taken out of both
+    exceptions: List[AvailabilityInterval] = []
+    # Time taken by other work (e.g. orders committed elsewhere): nothing runs then, and
+    # pausable tasks cannot pause across it either
+    reserved: List[AvailabilityInterval] = []
+
+class SolveOptions(BaseModel):
+    # How sequence-dependent setup times are modelled on each line:
+    # 'circuit' - exact, one circuit node per task on the line
+    # 'sparse'  - pairwise disjunctions only for job pairs with a setup entry (assumes triangle inequality)
+    # 'family'  - one circuit node per setup family, tasks of a family run back to back
+    setupModel: Literal['circuit', 'sparse', 'family'] = 'circuit'
+    # 'individual' - one optional interval per (task, line) and (task, operator)
+    # 'pooled'     - identical lines/operators share a cumulative pool, members assigned after solving
+    resourceModel: Literal['individual', 'pooled'] = 'individual'
+    # 'optional' - each line and operator alternative is an optional interval over the task's start and end
+    # 'lean'     - one interval per task; alternatives are fixed-size offsets of its start, a task's
+    #              only line or operator uses it directly, and redundant cumulatives bound how many
+    #              tasks run at once on each set of lines and operators
+    intervalEncoding: Literal['optional', 'lean'] = 'optional'
+    # 'none'    - one model for the whole plan
+    # 'rolling' - solve overlapping windows of jobs (by release/due date) and commit them one at a time
+    # 'lns'     - improve a first schedule by re-solving a few jobs at a time, the rest fixed
+    # 'hierarchical' - assign lines first, then sequence every line on its own and repair operator conflicts
+    decomposition: Literal['none', 'rolling', 'lns', 'hierarchical'] = 'none'
+    rollingWindowJobs: int = 20
+    rollingOverlapJobs: int = 5
+    rollingWindowSeconds: float = 2.0
+    lnsNeighborhoodJobs: int = 10
+    lnsNeighborhoodSeconds: float = 1.0
+    # Time for the first full solve; 0 starts from the dispatch-rule schedule instead
+    lnsInitialSeconds: float = 2.0
+    # Neighbourhoods solved side by side; defaults to the profile's search workers
+    lnsParallel: Optional[int] = None
+    # Rounds in a row without a better schedule before the search gives up early
+    lnsStallRounds: int = 50
+    hierarchicalAssignSeconds: float = 1.0
+    # Time per line; defaults to what is left of the time limit, shared between the lines
+    hierarchicalLineSeconds: Optional[float] = None
+    # Lines sequenced side by side in worker processes; defaults to, and is capped at,
+    # HIERARCHICAL_PROCESSES (SOLVER_THREADS unless set)
+    hierarchicalParallel: Optional[int] = None
+    # Dispatch-rule schedule ('edd', 'wspt' or 'atc') used as solution hint and as the answer
+    # when CP-SAT finds nothing in time
+    dispatchRule: Literal['edd', 'wspt', 'atc'] = 'atc'
+    warmStart: bool = True
+    fallback: bool = True
+    # Named solver profile ('deterministic', 'parallel', 'anytime'); defaults to SOLVER_PROFILE
+    solverProfile: Optional[str] = None
+    # Per-request overrides of the profile
+    timeLimitSeconds: Optional[float] = None
+    relativeGapLimit: Optional[float] = None
+    noImprovementSeconds: Optional[float] = None
+    numWorkers: Optional[int] = None
+    # Task ids pinned to their start, line and operator from previousSchedule
+    frozenTaskIds: List[str] = []
+    # 'rows'     - nested jobs with one dict per task
+    # 'columnar' - parallel arrays per task field, job metadata, lines and operators sent once
+    responseFormat: Literal['rows', 'columnar'] = 'rows'
+    # Only return tasks whose placement differs from previousSchedule
+    diffOnly: bool = False
 
 class SolveRequest(BaseModel):
     jobs: List[Job]
@@ -47,6 +123,11 @@ class SolveRequest(BaseModel):
     operators: List[Operator]
     setupTimes: Optional[List[SetupTime]] = []
     availabilities: Optional[List[ResourceAvailability]] = []
+    calendars: Optional[List[CalendarTemplate]] = []
+    options: Optional[SolveOptions] = None
+    # Previous schedule (flat tasks with id/start/end/line/operator, or the nested /solve output)
+    # used to warm start the solver with solution hints
+    previousSchedule: Optional[List[Dict]] = None
 
 # ===== WHAT-IF MODELS =====
 
@@ -64,8 +145,42 @@ class WhatIfScenario(BaseModel):
 
 class WhatIfSimulateRequest(BaseModel):
     scenario: WhatIfScenario
-    currentSolveRequest: SolveRequest
-    currentTasks: List[Dict]
+    # Both default to the saved schedule named by scenario.baseScheduleId
+    currentSolveRequest: Optional[SolveRequest] = None
+    currentTasks: Optional[List[Dict]] = None
+    # Pin every task the modifications do not touch to its current placement
+    freezeUntouched: bool = False
+
+class WhatIfBatchRequest(BaseModel):
+    scenarios: List[WhatIfScenario]
+    # Both default to the saved schedule named by the first scenario's baseScheduleId
+    currentSolveRequest: Optional[SolveRequest] = None
+    currentTasks: Optional[List[Dict]] = None
+    freezeUntouched: bool = False
+
+# ===== SAVED SCHEDULE PATCHES =====
+# Only the fields present in the body are changed
+
+class JobPatch(BaseModel):
+    name: Optional[str] = None
+    color: Optional[str] = None
+    priority: Optional[int] = None
+    dueDate: Optional[int] = None
+    setupFamily: Optional[str] = None
+
+class TaskPatch(BaseModel):
+    name: Optional[str] = None
+    eligibleLines: Optional[List[str]] = None
+    duration: Optional[float] = None
+    skill: Optional[str] = None
+    manualStart: Optional[int] = None
+    pausable: Optional[bool] = None
+
+class AvailabilityPatch(BaseModel):
+    intervals: List[AvailabilityInterval] = []
+    calendarId: Optional[str] = None
+    exceptions: List[AvailabilityInterval] = []
+    reserved: List[AvailabilityInterval] = []
 
 class JobImpact(BaseModel):
     jobId: str
@@ -74,6 +189,10 @@ class JobImpact(BaseModel):
     endTimeAfter: str
     deltaHours: float
     status: str
+    # Minutes past the job's dueDate (not weighted by priority)
+    tardinessBefore: float = 0.0
+    tardinessAfter: float = 0.0
+    tardinessDelta: float = 0.0
 
 class ImpactAnalysis(BaseModel):
     jobImpacts: List[JobImpact]
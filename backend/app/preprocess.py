@@ -0,0 +1,181 @@
+from typing import Dict, List, Optional, Tuple
+import collections
+import math
+
+from .calendars import Calendar, CalendarSet
+from .models import Operator, ResourceAvailability, SetupTime, SolveRequest, Task
+
+
+def build_setup_index(setup_times: Optional[List[SetupTime]]) -> Dict[Tuple[str, str, str], int]:
+    """
+    Index the setup matrix as (lineId, fromJobId, toJobId) -> duration.
+    Zero entries are dropped: a line whose setups are all zero only needs its no-overlap.
+    """
+    index = {}
+    for s in setup_times or []:
+        if s.duration > 0:
+            index[s.lineId, s.fromJobId, s.toJobId] = s.duration
+    return index
+
+
+class ProblemIndex:
+    """
+    Lookup tables built once per request so model building never scans the raw lists:
+    interned line/operator ids, a skill -> operators inverted index, availabilities keyed
+    by resource (and their lazily expanded calendars), the indexed setup matrix and the
+    rounded task durations.
+    """
+
+    def __init__(self, req: SolveRequest):
+        self.req = req
+        # Whole-minute durations, [job_idx][t_idx]: rounded once here for every model that needs them
+        self.durations: List[List[int]] = [[int(math.ceil(t.duration)) for t in job.tasks] for job in req.jobs]
+
+        # Interned ids: position in these lists is the resource's index in the model
+        self.line_ids: List[str] = []
+        self.line_index: Dict[str, int] = {}
+        for line_id in [line.id for line in req.lines] + [l for j in req.jobs for t in j.tasks for l in t.eligibleLines]:
+            if line_id not in self.line_index:
+                self.line_index[line_id] = len(self.line_ids)
+                self.line_ids.append(line_id)
+
+        self.operator_ids: List[str] = []
+        self.operator_index: Dict[str, int] = {}
+        self.operators: Dict[str, Operator] = {}
+        self.operators_by_skill: Dict[str, List[Operator]] = collections.defaultdict(list)
+        for op in req.operators:
+            if op.id in self.operator_index:
+                continue
+            self.operator_index[op.id] = len(self.operator_ids)
+            self.operator_ids.append(op.id)
+            self.operators[op.id] = op
+            for skill in set(op.skills):
+                self.operators_by_skill[skill].append(op)
+
+        # First entry wins, as the old linear lookup did
+        self.availability: Dict[str, ResourceAvailability] = {}
+        for avail in req.availabilities or []:
+            self.availability.setdefault(avail.resourceId, avail)
+        self.calendars = CalendarSet(req)
+
+        self.setup_index = build_setup_index(req.setupTimes)
+        self.lines_with_setups = {line_id for line_id, _, _ in self.setup_index}
+
+        # Resource pools: each line/operator is its own pool unless build_pools() groups them
+        self.pool_of: Dict[str, str] = {}
+        self.pool_members: Dict[str, List[str]] = {}
+
+    def build_pools(self):
+        """
+        Group interchangeable resources into capacity pools, keyed by their first member's id.
+        Operators are interchangeable when they have the same skills and the same shifts. Lines
+        are when the same tasks are eligible on them, they have the same shifts and no setup
+        times. Lines with setups always stay on their own so they keep their circuit.
+        """
+        eligible_tasks = collections.defaultdict(list)
+        for job_idx, job in enumerate(self.req.jobs):
+            for t_idx, task in enumerate(job.tasks):
+                for line_id in task.eligibleLines:
+                    eligible_tasks[line_id].append((job_idx, t_idx))
+
+        groups = collections.defaultdict(list)
+        for line_id in self.line_ids:
+            if line_id in self.lines_with_setups:
+                key = ('line', line_id)
+            else:
+                key = ('line', tuple(eligible_tasks[line_id]), self.calendars.key(line_id))
+            groups[key].append(line_id)
+        for op_id in self.operator_ids:
+            key = ('operator', frozenset(self.operators[op_id].skills), self.calendars.key(op_id))
+            groups[key].append(op_id)
+
+        for members in groups.values():
+            for member in members:
+                self.pool_of[member] = members[0]
+            self.pool_members[members[0]] = members
+
+    def pool(self, resource_id: str) -> str:
+        return self.pool_of.get(resource_id, resource_id)
+
+    def pool_capacity(self, pool_id: str) -> int:
+        return len(self.pool_members.get(pool_id, [pool_id]))
+
+    def line_choices(self, task: Task) -> List[str]:
+        """Eligible lines of a task, as pool ids when pooling is on (deduplicated, in order)."""
+        return list(dict.fromkeys(self.pool(line_id) for line_id in task.eligibleLines))
+
+    def operator_choices(self, task: Task) -> List[str]:
+        return list(dict.fromkeys(self.pool(op.id) for op in self.capable_operators(task)))
+
+    def horizon(self, fixed: Optional[Dict[str, Dict]] = None) -> int:
+        """
+        Upper bound for every time variable, from real bounds rather than 'all durations + 1000':
+        a serial schedule after the last manually placed or `fixed` (frozen) task needs at most every duration plus
+        the worst setup before each task, each shift gap can delay it by at most its length,
+        and when every resource the tasks can use has shifts nothing can end after the last shift.
+        Recurring calendars have no last shift: their gaps are counted until they have offered
+        all of that work.
+        """
+        release = 0
+        work = 0
+        max_setup_into = collections.defaultdict(int)
+        for (_, _, to_job), duration in self.setup_index.items():
+            max_setup_into[to_job] = max(max_setup_into[to_job], duration)
+        used = set()
+        for job, durations in zip(self.req.jobs, self.durations):
+            for task, duration in zip(job.tasks, durations):
+                work += duration + max_setup_into[job.id]
+                if task.manualStart is not None:
+                    release = max(release, task.manualStart + duration)
+                used.update(task.eligibleLines)
+                used.update(op.id for op in self.capable_operators(task))
+        for placement in (fixed or {}).values():
+            if placement.get('end') is not None:
+                release = max(release, int(float(placement['end'])))
+
+        gaps = 0
+        shift_end = 0
+        all_on_shifts = bool(used)
+        counted = set()
+        for resource_id in used:
+            calendar = self.calendar_for(resource_id)
+            if calendar is None or calendar.end == 0:
+                all_on_shifts = False
+                continue
+            # Resources with the same shifts are delayed by the same gaps
+            if id(calendar) in counted:
+                continue
+            counted.add(id(calendar))
+            if calendar.end is None:
+                all_on_shifts = False
+                end = calendar.finish(0, release + work) or 0
+                gaps += max(0, end - release - work)
+                continue
+            last_end = calendar.ends[-1] if calendar.windows(0, calendar.end) else 0
+            gaps += last_end - calendar.available(0, last_end)
+            shift_end = max(shift_end, last_end)
+
+        horizon = release + work + gaps
+        if all_on_shifts:
+            horizon = min(horizon, max(shift_end, release))
+        return max(horizon, 1)
+
+    def capable_operators(self, task: Task) -> List[Operator]:
+        return self.operators_by_skill.get(task.skill, [])
+
+    def availability_for(self, resource_id: str) -> Optional[ResourceAvailability]:
+        return self.availability.get(resource_id)
+
+    def calendar_for(self, resource_id: str) -> Optional[Calendar]:
+        """Working time of a line or operator (or pool: its members share it), None when always available."""
+        return self.calendars.get(resource_id)
+
+
+def index_previous_schedule(entries: Optional[List[Dict]]) -> Dict[str, Dict]:
+    """Map task id -> previous placement. Accepts flat task lists or the nested /solve output."""
+    previous = {}
+    for entry in entries or []:
+        for task in entry['tasks'] if 'tasks' in entry else [entry]:
+            if task.get('id') is not None and task.get('start') is not None:
+                previous.setdefault(task['id'], task)
+    return previous
@@ -0,0 +1,146 @@
+from typing import Dict, List, Optional, Tuple
+
+from .calendars import Calendar
+from .models import SolveRequest
+from .preprocess import ProblemIndex
+
+
+def earliest_fit(calendar: Optional[Calendar], lo: int, hi: int, duration: int) -> Optional[int]:
+    """Earliest start in [lo, hi] with the whole task inside one window."""
+    if calendar is None:
+        return lo if lo <= hi else None
+    return calendar.earliest_fit(lo, hi, duration)
+
+
+def latest_fit(calendar: Optional[Calendar], lo: int, hi: int, duration: int) -> Optional[int]:
+    """Latest start in [lo, hi] with the whole task inside one window."""
+    if calendar is None:
+        return hi if lo <= hi else None
+    return calendar.latest_fit(lo, hi, duration)
+
+
+def pausable_end(calendar: Optional[Calendar], start: int, work: int) -> Optional[int]:
+    return start + work if calendar is None else calendar.finish(start, work)
+
+
+class Presolve:
+    """
+    Bounds and reduced alternatives computed before the model is built.
+
+    est/lst are the earliest and latest start of every task, from job precedence, manual
+    starts, frozen placements, the horizon and the shifts of its remaining alternatives.
+    Lines and operators on which the task fits in no availability window between those
+    bounds are dropped. Tasks whose bounds are contradictory keep the full horizon and all
+    their alternatives, so the solver still reports the conflict as before.
+    Pausable tasks only need their resources to be working when they start, and end no
+    earlier than the work takes on the earliest calendar of their remaining alternatives.
+    """
+
+    def __init__(self, req: SolveRequest, index: ProblemIndex, horizon: int, pinned: Dict[str, Dict]):
+        self.bounds: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self.lines: Dict[Tuple[int, int], List[str]] = {}
+        self.operators: Dict[Tuple[int, int], List[str]] = {}
+        self.pinned = set()
+        self.stats = {
+            "pinnedTasks": 0,
+            "lineAlternatives": 0,
+            "prunedLineAlternatives": 0,
+            "operatorAlternatives": 0,
+            "prunedOperatorAlternatives": 0,
+            "domainReduction": 0.0,
+        }
+        domain_kept = 0
+        domain_full = 0
+        for job_idx, job in enumerate(req.jobs):
+            durations = index.durations[job_idx]
+            pins = []
+            choices = []
+            for task in job.tasks:
+                pin = pinned.get(task.id)
+                lines = index.line_choices(task)
+                operators = index.operator_choices(task)
+                if pin is not None:
+                    # Frozen tasks keep their resources too (when still eligible)
+                    lines = [l for l in lines if l == pin.get('line')] or lines
+                    operators = [o for o in operators if o == pin.get('operator')] or operators
+                pins.append(task.manualStart if task.manualStart is not None else
+                            (int(float(pin['start'])) if pin is not None else None))
+                choices.append((lines, operators))
+
+            # Backward pass: latest starts from the horizon and later pinned tasks
+            lst = [0] * len(job.tasks)
+            latest_end = horizon
+            for t_idx in range(len(job.tasks) - 1, -1, -1):
+                lst[t_idx] = latest_end - durations[t_idx]
+                if pins[t_idx] is not None:
+                    lst[t_idx] = min(lst[t_idx], pins[t_idx])
+                latest_end = lst[t_idx]
+
+            # Forward pass: earliest starts, dropping alternatives that cannot fit anywhere
+            earliest = 0
+            est = [0] * len(job.tasks)
+            for t_idx in range(len(job.tasks)):
+                duration = durations[t_idx]
+                # Pausable work may start in any working minute
+                fit = min(duration, 1) if job.tasks[t_idx].pausable else duration
+                lo = max(earliest, pins[t_idx]) if pins[t_idx] is not None else earliest
+                hi = pins[t_idx] if pins[t_idx] is not None else lst[t_idx]
+                lines, operators = choices[t_idx]
+                line_fits = {l: earliest_fit(index.calendar_for(l), lo, hi, fit) for l in lines}
+                op_fits = {o: earliest_fit(index.calendar_for(o), lo, hi, fit) for o in operators}
+                kept_lines = [l for l in lines if line_fits[l] is not None]
+                kept_ops = [o for o in operators if op_fits[o] is not None]
+                if (lines and not kept_lines) or (operators and not kept_ops):
+                    kept_lines, kept_ops = lines, operators  # no room anywhere: leave it to the solver
+                else:
+                    fits = [lo]
+                    if kept_lines:
+                        fits.append(min(line_fits[l] for l in kept_lines))
+                    if kept_ops:
+                        fits.append(min(op_fits[o] for o in kept_ops))
+                    lo = max(fits)
+                    # Latest start at which some remaining line and operator still fit
+                    for resources in (kept_lines, kept_ops):
+                        if resources:
+                            found = [s for s in (latest_fit(index.calendar_for(r), lo, hi, fit) for r in resources)
+                                     if s is not None]
+                            hi = min(hi, max(found)) if found else lo - 1
+                est[t_idx] = lo
+                lst[t_idx] = hi
+                earliest = lo + duration
+                if job.tasks[t_idx].pausable and lo <= hi:
+                    # The work pauses at least for the breaks of the line and of the operator
+                    for resources in (kept_lines, kept_ops):
+                        ends = [pausable_end(index.calendar_for(r), lo, duration) for r in resources]
+                        if ends and None not in ends:
+                            earliest = max(earliest, min(ends))
+
+                self.lines[job_idx, t_idx] = kept_lines
+                self.operators[job_idx, t_idx] = kept_ops
+                self.stats["lineAlternatives"] += len(kept_lines)
+                self.stats["prunedLineAlternatives"] += len(lines) - len(kept_lines)
+                self.stats["operatorAlternatives"] += len(kept_ops)
+                self.stats["prunedOperatorAlternatives"] += len(operators) - len(kept_ops)
+
+            # Later tasks may have moved: tighten the earlier tasks' latest starts again
+            for t_idx in range(len(job.tasks) - 2, -1, -1):
+                lst[t_idx] = min(lst[t_idx], lst[t_idx + 1] - durations[t_idx])
+
+            for t_idx in range(len(job.tasks)):
+                domain_full += horizon + 1
+                if est[t_idx] <= lst[t_idx]:
+                    self.bounds[job_idx, t_idx] = (est[t_idx], lst[t_idx])
+                    domain_kept += lst[t_idx] - est[t_idx] + 1
+                    if est[t_idx] == lst[t_idx]:
+                        self.pinned.add((job_idx, t_idx))
+                else:
+                    domain_kept += horizon + 1
+
+        self.stats["pinnedTasks"] = len(self.pinned)
+        self.stats["domainReduction"] = 1 - domain_kept / domain_full if domain_full else 0.0
+
+    def start_bounds(self, job_idx: int, t_idx: int, horizon: int) -> Tuple[int, int]:
+        return self.bounds.get((job_idx, t_idx), (0, horizon))
+
+    def is_pinned(self, job_idx: int, t_idx: int) -> bool:
+        return (job_idx, t_idx) in self.pinned
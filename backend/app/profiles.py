@@ -0,0 +1,125 @@
+from typing import Dict, Optional, Tuple
+import os
+import threading
+import time
+from ortools.sat.python import cp_model
+
+from .models import SolveOptions
+
+# CP-SAT threads for the parallel profiles. With SOLVER_WORKERS processes each running one of
+# them, keep SOLVER_WORKERS * SOLVER_THREADS close to the number of cores.
+SOLVER_THREADS = int(os.environ.get("SOLVER_THREADS", os.cpu_count() or 1))
+# Processes each solver worker sequences the lines of hierarchical solves in. They run while
+# the worker waits, in place of the CP-SAT threads of a monolithic solve
+HIERARCHICAL_PROCESSES = int(os.environ.get("HIERARCHICAL_PROCESSES", SOLVER_THREADS))
+
+# Named solver profiles. 'parameters' go to CP-SAT as-is; 'noImprovementSeconds' stops the
+# search once the objective has not improved for that long; only 'deterministic' profiles
+# give the same answer for the same input and may be served from the schedule cache.
+SOLVER_PROFILES = {
+    "deterministic": {
+        "parameters": {
+            "max_time_in_seconds": 10.0,
+            # FORCE DETERMINISM: Single thread ensures results are identical for the same input
+            "num_search_workers": 1,
+        },
+        "deterministic": True,
+    },
+    "parallel": {
+        "parameters": {
+            "max_time_in_seconds": 10.0,
+            "num_search_workers": SOLVER_THREADS,
+            "random_seed": 0,
+        },
+        "deterministic": False,
+    },
+    "anytime": {
+        "parameters": {
+            "max_time_in_seconds": 60.0,
+            "num_search_workers": SOLVER_THREADS,
+            "random_seed": 0,
+            "relative_gap_limit": 0.02,
+        },
+        "noImprovementSeconds": 5.0,
+        "deterministic": False,
+    },
+}
+
+DEFAULT_SOLVER_PROFILE = os.environ.get("SOLVER_PROFILE", "deterministic")
+
+
+def resolve_solver_profile(options: Optional[SolveOptions]) -> Tuple[str, Dict]:
+    """The profile a request runs with: its named profile plus any per-request overrides."""
+    options = options or SolveOptions()
+    name = options.solverProfile or DEFAULT_SOLVER_PROFILE
+    if name not in SOLVER_PROFILES:
+        raise ValueError(f"Unknown solver profile '{name}', expected one of {sorted(SOLVER_PROFILES)}")
+    base = SOLVER_PROFILES[name]
+    profile = {**base, "parameters": dict(base["parameters"])}
+
+    if options.timeLimitSeconds is not None:
+        profile["parameters"]["max_time_in_seconds"] = options.timeLimitSeconds
+    if options.relativeGapLimit is not None:
+        profile["parameters"]["relative_gap_limit"] = options.relativeGapLimit
+    if options.numWorkers is not None:
+        profile["parameters"]["num_search_workers"] = options.numWorkers
+        profile["deterministic"] = profile["deterministic"] and options.numWorkers == 1
+    if options.noImprovementSeconds is not None:
+        # A wall-clock stop depends on machine speed and load, not only on the request
+        profile["noImprovementSeconds"] = options.noImprovementSeconds
+        profile["deterministic"] = False
+    return name, profile
+
+
+def hierarchical_processes(options: SolveOptions, lines: int) -> int:
+    """Processes a hierarchical solve sequences its lines in (1: in the solver worker itself)."""
+    return max(1, min(lines, options.hierarchicalParallel or HIERARCHICAL_PROCESSES, HIERARCHICAL_PROCESSES))
+
+
+class SearchMonitor(cp_model.CpSolverSolutionCallback):
+    """
+    Solution callback watching a running search. It can stop the search when no better
+    solution has been found for `patience` seconds (the clock starts at the first solution,
+    so a slow first solution is never cut off) or when `stop_event` is set by another process,
+    and calls `on_solution(self)` for every improving solution.
+    """
+
+    def __init__(self, patience: Optional[float] = None, stop_event=None, on_solution=None):
+        super().__init__()
+        self.patience = patience
+        self.stop_event = stop_event
+        self.on_solution = on_solution
+        self.last_improvement = None
+        self.solution_count = 0
+        self.done = threading.Event()
+        self.stopped_early = False
+        self.stopped_by_request = False
+        self.watcher = threading.Thread(target=self._watch, daemon=True)
+
+    def on_solution_callback(self):
+        self.last_improvement = time.monotonic()
+        self.solution_count += 1
+        if self.on_solution is not None:
+            self.on_solution(self)
+        if self.stopped_by_request or self.stopped_early:
+            self.stop_search()
+
+    def _watch(self):
+        while not self.done.wait(0.1):
+            if self.stop_event is not None and self.stop_event.is_set():
+                self.stopped_by_request = True
+            elif self.patience and self.last_improvement is not None \
+                    and time.monotonic() - self.last_improvement > self.patience:
+                self.stopped_early = True
+            if self.stopped_by_request or self.stopped_early:
+                # Asked again until the solve returns: a stop before the search has started
+                # (e.g. a cancel during the model build) is otherwise lost
+                self.stop_search()
+
+    def __enter__(self):
+        self.watcher.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.watcher.join()
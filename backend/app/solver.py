@@ -0,0 +1,204 @@
+from typing import Dict, List, Optional
+import logging
+import time
+from ortools.sat.python import cp_model
+
+from .compiler import CompiledModel, ModelChangeError, compiled_model
+from .models import SolveOptions, SolveRequest
+from .dispatch import dispatch_schedule
+from .preprocess import index_previous_schedule
+from .profiles import SearchMonitor, resolve_solver_profile
+from .whatif_helpers import ScenarioBase
+
+logger = logging.getLogger(__name__)
+
+
+def solve_schedule(req: SolveRequest, parameters: Optional[Dict] = None, progress=None, stop_event=None) -> Dict:
+    """
+    Build (see compiler.CompiledModel) and solve the CP-SAT model for a solve request.
+    This is CPU bound and blocking: async code must go through the worker pool in jobs.py.
+    `parameters` overrides CP-SAT parameters of the request's solver profile
+    (e.g. a shorter time limit per window).
+    Every improving solution is put on the `progress` queue, when given, as the tasks that
+    changed since the previous one. Setting `stop_event` ends the search with the best
+    solution found so far.
+    """
+    options = req.options or SolveOptions()
+    if options.decomposition == 'rolling':
+        from .decomposition import solve_rolling_horizon
+        return solve_rolling_horizon(req, parameters)
+    if options.decomposition == 'hierarchical':
+        from .decomposition import solve_hierarchical
+        return solve_hierarchical(req, parameters)
+    if options.decomposition == 'lns':
+        from .lns import solve_lns
+        return solve_lns(req, parameters, progress, stop_event)
+
+    print("=" * 50)
+    print("SOLVE REQUEST RECEIVED")
+    print(f"Jobs: {len(req.jobs)}")
+    print(f"Lines: {len(req.lines)}")
+    print(f"Operators: {len(req.operators)}")
+    print("=" * 50)
+    return solve_compiled(CompiledModel(req), parameters, progress, stop_event)
+
+
+def solve_compiled(compiled: CompiledModel, parameters: Optional[Dict] = None, progress=None, stop_event=None) -> Dict:
+    """Solve a compiled model, or a variant of one; the arguments are those of solve_schedule."""
+    options = compiled.options
+    model = compiled.model
+    makespan = compiled.makespan
+    total_weighted_tardiness = compiled.total_weighted_tardiness
+    timer = compiled.timer
+    t_built = compiled.t_built
+
+    profile_name, profile = resolve_solver_profile(options)
+    solver = cp_model.CpSolver()
+    for name, value in {**profile["parameters"], **(parameters or {})}.items():
+        setattr(solver.parameters, name, value)
+
+    # --- INTERMEDIATE SOLUTIONS ---
+    last_streamed = {}  # task id -> (start, end, line, operator) of the last streamed solution
+
+    def stream_solution(monitor):
+        changed = []
+        for res_job in compiled.read_results(monitor):
+            for t in res_job["tasks"]:
+                placement = (t["start"], t["end"], t["line"], t["operator"])
+                if last_streamed.get(t["id"]) != placement:
+                    last_streamed[t["id"]] = placement
+                    changed.append(dict(t, jobId=res_job["id"]))
+        progress.put({
+            "solution": monitor.solution_count,
+            "objective": monitor.objective_value,
+            "bestBound": monitor.best_objective_bound,
+            "makespan": monitor.value(makespan),
+            "tardiness": monitor.value(total_weighted_tardiness),
+            "wallTime": monitor.wall_time,
+            "timestamp": time.time(),
+            "changedTasks": changed,
+        })
+
+    monitor = None
+    patience = profile.get("noImprovementSeconds")
+    if patience or progress is not None or stop_event is not None:
+        on_solution = stream_solution if progress is not None else None
+        with SearchMonitor(patience, stop_event, on_solution) as monitor:
+            status = solver.solve(model, monitor)
+    else:
+        status = solver.solve(model)
+    t_solved = time.perf_counter()
+    timer.lap("solve")
+
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        results = compiled.read_results(solver)
+        timer.lap("results")
+        
+        return {
+            "status": "success",
+            "makespan": solver.value(makespan),
+            "tardiness": solver.value(total_weighted_tardiness),
+            "stats": {
+                "branches": solver.num_branches,
+                "conflicts": solver.num_conflicts,
+                "wall_time": solver.wall_time,
+                "preprocess_time": compiled.t_preprocessed - compiled.t_start,
+                "build_time": t_built - compiled.t_preprocessed,
+                "solve_time": t_solved - t_built,
+                "phases": timer.to_dict(),
+                "presolve": compiled.presolve.stats,
+                "reused_model": compiled.reused,
+                "num_variables": len(model.proto.variables),
+                "num_constraints": len(model.proto.constraints),
+                "profile": profile_name,
+                "objective": solver.objective_value,
+                "best_bound": solver.best_objective_bound,
+                "gap": objective_gap(solver.objective_value, solver.best_objective_bound),
+                "stopped_early": bool(monitor and monitor.stopped_early),
+                "accepted_early": bool(monitor and monitor.stopped_by_request)
+            },
+            "tasks": results,
+            "logs": [
+                f"Solver Status: {solver.status_name(status)}",
+                f"SME Objective (Weighted Tardiness): {solver.value(total_weighted_tardiness)}",
+                f"Production Makespan: {solver.value(makespan)}",
+                f"Solver Profile: {profile_name} (gap {objective_gap(solver.objective_value, solver.best_objective_bound):.2%})",
+            ]
+        }
+    elif options.fallback:
+        # Never leave the planner without a plan: answer with the dispatch-rule schedule
+        # (with resources taken out of a variant, the compiled index no longer applies)
+        index = None if compiled.disabled else compiled.index
+        result = dispatch_schedule(compiled.req, options.dispatchRule, index, compiled.fixed)
+        result["fallback"] = True
+        timer.lap("fallback")
+        result["stats"].update({"solve_time": t_solved - t_built, "build_time": t_built - compiled.t_preprocessed,
+                                "phases": timer.to_dict()})
+        result["logs"] = [
+            f"Solver Status: {solver.status_name(status)}",
+            "No CP-SAT solution in time: returning the dispatch-rule schedule.",
+        ] + result["logs"]
+        return result
+    else:
+        return {
+            "status": "failed", 
+            "logs": [
+                f"Solver Status: {solver.status_name(status)}", 
+                "Infeasible constraints. Potential conflict with manual overrides."
+            ]
+        }
+
+
+def solve_scenario(base_req: SolveRequest, base_key: str, modifications: List, frozen_ids: List[str]) -> Dict:
+    """
+    Solve a what-if scenario of `base_req` on a variant of its compiled model, which this
+    process keeps under `base_key` for the next scenarios of the same plan. Modifications
+    the model has no handle for (e.g. new shifts) are solved from the scenario's request.
+    Tasks in `frozen_ids` stay at their previousSchedule placement; when that leaves no room
+    for the change, the scenario is solved again without them. Plans solved by decomposition
+    have no single model to vary and are solved from the scenario's request too.
+    """
+    overlay = ScenarioBase(base_req).overlay(modifications)
+    if (base_req.options or SolveOptions()).decomposition != 'none':
+        return solve_frozen(overlay.build(), frozen_ids)
+    try:
+        variant = compiled_model(base_req, base_key).copy()
+        overlay.apply_to(variant)
+    except ModelChangeError as e:
+        logger.debug("What-if scenario needs a new model: %s", e)
+        return solve_frozen(overlay.build(), frozen_ids)
+
+    logger.debug("What-if scenario on the compiled model of %d jobs", len(base_req.jobs))
+    if frozen_ids:
+        frozen = variant.copy()
+        previous = index_previous_schedule(base_req.previousSchedule)
+        try:
+            for task_id in frozen_ids:
+                if task_id in previous:
+                    frozen.freeze(task_id, previous[task_id])
+            frozen.options = frozen.options.model_copy(update={'frozenTaskIds': frozen_ids, 'fallback': False})
+            result = solve_compiled(frozen)
+            if result.get('status') == 'success':
+                return result
+        except ModelChangeError:
+            pass
+    result = solve_compiled(variant)
+    if result.get('status') != 'success':
+        # The compiled horizon or bounds may be too tight for the change: build its own model
+        return solve_schedule(overlay.build())
+    return result
+
+
+def solve_frozen(req: SolveRequest, frozen_ids: List[str]) -> Dict:
+    """Solve with the given tasks pinned to their previousSchedule placement, or without them if that fails."""
+    if frozen_ids:
+        options = (req.options or SolveOptions()).model_copy(update={'frozenTaskIds': frozen_ids, 'fallback': False})
+        result = solve_schedule(req.model_copy(update={'options': options}))
+        if result.get('status') == 'success':
+            return result
+    return solve_schedule(req)
+
+
+def objective_gap(objective: float, bound: float) -> float:
+    """Relative gap between the objective found and the best proven bound."""
+    return abs(objective - bound) / max(1.0, abs(objective))
@@ -0,0 +1,97 @@
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .models import SolveRequest
+
+# SQLite file holding saved plans and their schedules (':memory:' keeps them for the process only)
+SCHEDULE_STORE_PATH = os.environ.get("SCHEDULE_STORE_PATH", "schedules.db")
+
+
+class ScheduleStore:
+    """
+    Saved plans: the solve request and its latest solved schedule, keyed by schedule id.
+    Every update bumps the version so clients can tell which schedule they are looking at.
+    """
+
+    def __init__(self, path: str = SCHEDULE_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schedules (
+                id TEXT PRIMARY KEY,
+                request TEXT NOT NULL,
+                result TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def create(self, req: SolveRequest, result: Dict) -> Tuple[str, int]:
+        schedule_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO schedules (id, request, result, version, created_at, updated_at) VALUES (?, ?, ?, 1, ?, ?)",
+                (schedule_id, req.model_dump_json(), json.dumps(result), now, now),
+            )
+            self.conn.commit()
+        return schedule_id, 1
+
+    def get(self, schedule_id: str) -> Optional[Tuple[SolveRequest, Dict, int]]:
+        """(request, result, version) of a saved schedule, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT request, result, version FROM schedules WHERE id = ?", (schedule_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        request, result, version = row
+        return SolveRequest.model_validate_json(request), json.loads(result), version
+
+    def update(self, schedule_id: str, req: SolveRequest, result: Dict) -> int:
+        """Replace the request and schedule; returns the new version."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE schedules SET request = ?, result = ?, version = version + 1, updated_at = ? WHERE id = ?",
+                (req.model_dump_json(), json.dumps(result), time.time(), schedule_id),
+            )
+            self.conn.commit()
+            return self.conn.execute("SELECT version FROM schedules WHERE id = ?", (schedule_id,)).fetchone()[0]
+
+    def delete(self, schedule_id: str) -> bool:
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,)).rowcount
+            self.conn.commit()
+        return deleted > 0
+
+    def list(self) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, version, created_at, updated_at FROM schedules ORDER BY updated_at DESC"
+            ).fetchall()
+        return [
+            {"scheduleId": schedule_id, "version": version, "createdAt": created_at, "updatedAt": updated_at}
+            for schedule_id, version, created_at, updated_at in rows
+        ]
+
+
+_store: Optional[ScheduleStore] = None
+
+
+def get_store() -> ScheduleStore:
+    """Open the store on first use, so importing the app does not create the database file."""
+    global _store
+    if _store is None:
+        _store = ScheduleStore()
+    return _store
@@ -1,188 +1,257 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
+import collections
 from datetime import datetime, timedelta
-from .models import ResourceAvailability, AvailabilityInterval, SolveRequest
+from .models import ResourceAvailability, AvailabilityInterval, SolveRequest, Task
+from .cache import request_cache_key
+from .compiler import ModelChangeError
 
-# Helper function to apply What-If modifications
-def apply_whatif_modifications(solve_request, modifications: List) -> any:
+def parse_task_ref(task_id: str):
     """
-    Apply What-If modifications to a solve request.
-    Returns a modified copy of the solve request.
+    Split a frontend task id into (job_id, task_idx).
+    Frontend uses: order.id + "-task-" + idx, legacy/internal format is jobId-tX.
+    Returns (None, 0) when the id cannot be parsed.
     """
-    import copy
-    modified_request = copy.deepcopy(solve_request)
-    
-    for mod in modifications:
+    if '-task-' in task_id:
+        # Handle modern frontend format
+        job_id, task_part = task_id.rsplit('-task-', 1)
+    elif '-t' in task_id:
+        # Handle legacy/internal format
+        job_id, task_part = task_id.rsplit('-t', 1)
+    else:
+        return None, 0
+    try:
+        return job_id, int(task_part)
+    except ValueError:
+        # In case of partial match like "ask-1" from split error before
+        print(f"Error parsing task index from {task_part}")
+        return None, 0
+
+class ScenarioBase:
+    """
+    A base solve request shared by many what-if scenarios. The request is never modified:
+    it is indexed once by job, task and line, and each scenario is applied as an overlay of
+    deltas. Building a scenario's request copies only the jobs and tasks it changes; every
+    other Job/Task object is shared with the base and with the other scenarios.
+    """
+
+    def __init__(self, solve_request: SolveRequest):
+        self.req = solve_request
+        self.job_index = {job.id: job_idx for job_idx, job in enumerate(solve_request.jobs)}
+        self.tasks_by_line = collections.defaultdict(list)  # line id -> [(job_idx, t_idx)]
+        for job_idx, job in enumerate(solve_request.jobs):
+            for t_idx, task in enumerate(job.tasks):
+                for line_id in task.eligibleLines:
+                    self.tasks_by_line[line_id].append((job_idx, t_idx))
+        self._key = None
+
+    @property
+    def key(self) -> str:
+        """Cache key of the base request, under which workers keep its compiled model."""
+        if self._key is None:
+            self._key = request_cache_key(self.req, {})
+        return self._key
+
+    def task(self, job_idx: int, t_idx: int) -> Task:
+        return self.req.jobs[job_idx].tasks[t_idx]
+
+    def overlay(self, modifications: List) -> 'ScenarioOverlay':
+        overlay = ScenarioOverlay(self)
+        for mod in modifications:
+            overlay.apply(mod)
+        return overlay
+
+    def apply(self, modifications: List) -> SolveRequest:
+        """The base request with the modifications applied (the base itself is left untouched)."""
+        return self.overlay(modifications).build()
+
+
+class ScenarioOverlay:
+    """The deltas one scenario makes to a ScenarioBase."""
+
+    def __init__(self, base: ScenarioBase):
+        self.base = base
+        self.task_updates = collections.defaultdict(dict)  # (job_idx, t_idx) -> field updates
+        self.removed_lines = set()
+        self.removed_operators = set()
+        self.availability_overrides = {}  # resource id -> [AvailabilityInterval]
+
+    def current(self, job_idx: int, t_idx: int, field: str):
+        """A task field as the overlay sees it so far."""
+        updates = self.task_updates.get((job_idx, t_idx), {})
+        return updates[field] if field in updates else getattr(self.base.task(job_idx, t_idx), field)
+
+    def apply(self, mod):
         mod_type = mod.type
         params = mod.parameters
-        
+
         if mod_type == 'delay_order':
             # Delay a specific order by X hours
             order_id = params.get('orderId')
             delay_hours = params.get('delayHours', 0)
             delay_minutes = int(delay_hours * 60)
-            
-            # Find the job and delay all its tasks
-            for job in modified_request.jobs:
-                if job.id == order_id:
-                    for task in job.tasks:
-                        if task.manualStart is not None:
-                            task.manualStart += delay_minutes
-                        else:
-                            task.manualStart = delay_minutes
-        
+
+            job_idx = self.base.job_index.get(order_id)
+            if job_idx is not None:
+                tasks = self.base.req.jobs[job_idx].tasks
+                pinned = [t_idx for t_idx in range(len(tasks)) if self.current(job_idx, t_idx, 'manualStart') is not None]
+                # Shift the manual starts the order has; otherwise hold its first task back.
+                # Pinning every task at the same start would break the job's own sequence.
+                for t_idx in pinned:
+                    self.task_updates[job_idx, t_idx]['manualStart'] = self.current(job_idx, t_idx, 'manualStart') + delay_minutes
+                if not pinned and tasks:
+                    self.task_updates[job_idx, 0]['manualStart'] = delay_minutes
+
         elif mod_type == 'machine_down':
-            # Remove a machine from available lines
+            # Remove a machine from available lines, and from the eligible lines of the tasks using it
             machine_id = params.get('machineId')
-            modified_request.lines = [line for line in modified_request.lines if line.id != machine_id]
-            
-            # Remove machine from eligible lines in tasks
-            for job in modified_request.jobs:
-                for task in job.tasks:
-                    if machine_id in task.eligibleLines:
-                        task.eligibleLines.remove(machine_id)
-        
+            self.removed_lines.add(machine_id)
+            for job_idx, t_idx in self.base.tasks_by_line.get(machine_id, []):
+                eligible = self.current(job_idx, t_idx, 'eligibleLines')
+                self.task_updates[job_idx, t_idx]['eligibleLines'] = [l for l in eligible if l != machine_id]
+
         elif mod_type == 'operator_unavailable':
             # Remove an operator
-            operator_id = params.get('operatorId')
-            modified_request.operators = [op for op in modified_request.operators if op.id != operator_id]
-        
+            self.removed_operators.add(params.get('operatorId'))
+
         elif mod_type == 'task_move':
             # Move a specific task to a new start time
             task_id = params.get('taskId')
             new_start = params.get('newStartTime')  # in minutes
-            
-            # Parse task_id (format: jobId-tX)
-            # Parse task_id (format: jobId-task-X or jobId-tX)
-            # Frontend uses: order.id + "-task-" + idx
-            task_idx = 0
-            job_id_found = None
-            
-            if '-task-' in task_id:
-                 # Handle modern frontend format
-                 job_id_found, task_part = task_id.rsplit('-task-', 1)
-                 try:
-                     task_idx = int(task_part)
-                 except ValueError:
-                     print(f"Error parsing task index from {task_part}")
-                     continue
-            elif '-t' in task_id:
-                # Handle legacy/internal format
-                job_id_found, task_part = task_id.rsplit('-t', 1)
+
+            job_id_found, task_idx = parse_task_ref(task_id)
+            job_idx = self.base.job_index.get(job_id_found)
+            if job_idx is not None and task_idx < len(self.base.req.jobs[job_idx].tasks):
+                # Ensure new_start is an integer
                 try:
-                    task_idx = int(task_part)
-                except ValueError:
-                    # In case of partial match like "ask-1" from split error before
-                    continue
-            
-            if job_id_found:
-                for job in modified_request.jobs:
-                    if job.id == job_id_found:
-                         if task_idx < len(job.tasks):
-                             # Ensure new_start is an integer
-                             try:
-                                job.tasks[task_idx].manualStart = int(float(new_start))
-                             except (ValueError, TypeError):
-                                print(f"Invalid newStartTime: {new_start}")
-        
+                    self.task_updates[job_idx, task_idx]['manualStart'] = int(float(new_start))
+                except (ValueError, TypeError):
+                    print(f"Invalid newStartTime: {new_start}")
+
         elif mod_type == 'shift_change':
             # Add or override availability for a resource
             resource_id = params.get('resourceId')
             new_intervals = params.get('intervals', []) # List of {start, end}
-            
-            # Find or create
-            found = False
-            if modified_request.availabilities:
-                for avail in modified_request.availabilities:
-                    if avail.resourceId == resource_id:
-                        avail.intervals = [AvailabilityInterval(**i) for i in new_intervals]
-                        found = True
-                        break
-            
-            if not found:
-                if modified_request.availabilities is None:
-                    modified_request.availabilities = []
-                modified_request.availabilities.append(ResourceAvailability(
-                    resourceId=resource_id,
-                    intervals=[AvailabilityInterval(**i) for i in new_intervals]
-                ))
-        
+            self.availability_overrides[resource_id] = [AvailabilityInterval(**i) for i in new_intervals]
+
         # Add more modification types as needed
-    
-    return modified_request
 
+    def apply_to(self, compiled):
+        """
+        Make the same changes to a variant of the base's compiled model (see compiler.CompiledModel).
+        Raises ModelChangeError for changes the model has no handle for.
+        """
+        if self.availability_overrides:
+            raise ModelChangeError("Shift changes need a new model")
+        for (job_idx, t_idx), fields in self.task_updates.items():
+            for field, value in fields.items():
+                if field == 'manualStart':
+                    compiled.fix_start(self.base.task(job_idx, t_idx).id, value)
+                elif field != 'eligibleLines':  # follows from the removed lines below
+                    raise ModelChangeError(f"No model handle for task field {field}")
+        for line_id in self.removed_lines:
+            compiled.set_resource_enabled(line_id, False)
+        for op_id in self.removed_operators:
+            compiled.set_resource_enabled(op_id, False)
+
+    def build(self) -> SolveRequest:
+        req = self.base.req
+        updates = {}
+
+        if self.task_updates:
+            task_updates_by_job = collections.defaultdict(dict)
+            for (job_idx, t_idx), fields in self.task_updates.items():
+                task_updates_by_job[job_idx][t_idx] = fields
+            jobs = list(req.jobs)
+            for job_idx, job_updates in task_updates_by_job.items():
+                job = jobs[job_idx]
+                tasks = list(job.tasks)
+                for t_idx, fields in job_updates.items():
+                    tasks[t_idx] = tasks[t_idx].model_copy(update=fields)
+                jobs[job_idx] = job.model_copy(update={'tasks': tasks})
+            updates['jobs'] = jobs
+
+        if self.removed_lines:
+            updates['lines'] = [line for line in req.lines if line.id not in self.removed_lines]
+        if self.removed_operators:
+            updates['operators'] = [op for op in req.operators if op.id not in self.removed_operators]
+
+        if self.availability_overrides:
+            availabilities = []
+            for avail in req.availabilities or []:
+                if avail.resourceId in self.availability_overrides:
+                    # The new shifts replace the resource's calendar too
+                    avail = avail.model_copy(update={'intervals': self.availability_overrides[avail.resourceId],
+                                                     'calendarId': None, 'exceptions': []})
+                availabilities.append(avail)
+            known = {avail.resourceId for avail in availabilities}
+            availabilities += [
+                ResourceAvailability(resourceId=resource_id, intervals=intervals)
+                for resource_id, intervals in self.availability_overrides.items() if resource_id not in known
+            ]
+            updates['availabilities'] = availabilities
+
+        # Shallow copy: untouched jobs, tasks and resources are shared with the base
+        return req.model_copy(update=updates)
 
-def calculate_impact_analysis(tasks_before: List[Dict], tasks_after: List[Dict], makespan_before: int, makespan_after: int) -> Dict:
+
+def apply_whatif_modifications(solve_request, modifications: List, base: Optional[ScenarioBase] = None) -> SolveRequest:
     """
-    Calculate impact analysis comparing before/after schedules.
+    Apply What-If modifications to a solve request.
+    Returns a modified copy of the solve request; pass `base` to reuse its indexes across scenarios.
     """
-    # Group tasks by job
-    job_times_before = {}
-    job_times_after = {}
-    
-    for task in tasks_before:
-        job_id = task.get('job_id', '')
-        job_name = task.get('job_name', '')
-        end_time = task.get('start', 0) + task.get('duration', 0)
-        
-        if job_id not in job_times_before:
-            job_times_before[job_id] = {'name': job_name, 'end': end_time}
-        else:
-            job_times_before[job_id]['end'] = max(job_times_before[job_id]['end'], end_time)
-    
-    for task in tasks_after:
-        job_id = task.get('job_id', '')
-        job_name = task.get('job_name', '')
-        end_time = task.get('start', 0) + task.get('duration', 0)
-        
-        if job_id not in job_times_after:
-            job_times_after[job_id] = {'name': job_name, 'end': end_time}
+    return (base or ScenarioBase(solve_request)).apply(modifications)
+
+
+def find_touched_task_ids(solve_request, modifications: List, current_tasks: List[Dict]):
+    """
+    Task ids whose placement a set of modifications can change directly, plus the
+    downstream tasks of the same jobs. Returns None when a modification type is not
+    understood, meaning nothing can safely be frozen.
+    """
+    placed_on = collections.defaultdict(set)  # resource id -> task ids scheduled on it
+    for task in current_tasks:
+        for key in ('line', 'operator'):
+            if task.get(key) is not None:
+                placed_on[task[key]].add(task.get('id'))
+
+    touched = set()
+    for mod in modifications:
+        params = mod.parameters
+        if mod.type == 'delay_order':
+            touched.update(t.id for j in solve_request.jobs if j.id == params.get('orderId') for t in j.tasks)
+        elif mod.type == 'machine_down':
+            touched |= placed_on.get(params.get('machineId'), set())
+        elif mod.type == 'operator_unavailable':
+            touched |= placed_on.get(params.get('operatorId'), set())
+        elif mod.type == 'shift_change':
+            touched |= placed_on.get(params.get('resourceId'), set())
+        elif mod.type == 'task_move':
+            job_id, task_idx = parse_task_ref(params.get('taskId', ''))
+            for job in solve_request.jobs:
+                if job.id == job_id and task_idx < len(job.tasks):
+                    touched.add(job.tasks[task_idx].id)
         else:
-            job_times_after[job_id]['end'] = max(job_times_after[job_id]['end'], end_time)
-    
-    # Calculate job impacts
-    job_impacts = []
-    for job_id in job_times_before.keys():
-        before = job_times_before.get(job_id, {})
-        after = job_times_after.get(job_id, before)
-        
-        end_before = before.get('end', 0)
-        end_after = after.get('end', 0)
-        delta_minutes = end_after - end_before
-        delta_hours = delta_minutes / 60.0
-        
-        status = 'neutral'
-        if delta_hours < -0.5:
-            status = 'improved'
-        elif delta_hours > 0.5:
-            status = 'degraded'
-        
-        from datetime import datetime, timedelta
-        base_time = datetime(2024, 1, 1, 8, 0)  # Start at 8 AM
-        
-        job_impacts.append({
-            'jobId': job_id,
-            'jobName': before.get('name', job_id),
-            'endTimeBefore': (base_time + timedelta(minutes=end_before)).isoformat(),
-            'endTimeAfter': (base_time + timedelta(minutes=end_after)).isoformat(),
-            'deltaHours': round(delta_hours, 2),
-            'status': status
-        })
-    
-    # Global metrics
-    utilization_before = 75.0  # Placeholder
-    utilization_after = 73.0   # Placeholder
-    deadlines_met_before = len([j for j in job_impacts if j['deltaHours'] <= 0])
-    deadlines_met_after = len([j for j in job_impacts if j['status'] != 'degraded'])
-    
-    return {
-        'jobImpacts': job_impacts,
-        'globalMetrics': {
-            'makespanBefore': makespan_before,
-            'makespanAfter': makespan_after,
-            'makespanDelta': makespan_after - makespan_before,
-            'utilizationBefore': utilization_before,
-            'utilizationAfter': utilization_after,
-            'deadlinesMetBefore': deadlines_met_before,
-            'deadlinesMetAfter': deadlines_met_after
-        }
-    }
+            return None
+
+    return downstream_task_ids(solve_request, touched)
+
+
+def downstream_task_ids(solve_request, task_ids) -> set:
+    """The given task ids plus every later task of their jobs: anything after a touched task may have to move too."""
+    touched = set(task_ids)
+    for job in solve_request.jobs:
+        for t_idx, task in enumerate(job.tasks):
+            if task.id in touched:
+                touched.update(t.id for t in job.tasks[t_idx:])
+                break
+    return touched
+
+
+def placed_task_ids(current_tasks: List[Dict], resource_id: str) -> set:
+    """Ids of the tasks a schedule (flat or nested /solve output) places on a line or operator."""
+    placed = set()
+    for entry in current_tasks:
+        for task in entry['tasks'] if 'tasks' in entry else [entry]:
+            if resource_id in (task.get('line'), task.get('operator')):
+                placed.add(task.get('id'))
+    return placed
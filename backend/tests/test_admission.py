@@ -0,0 +1,18 @@
+from app import profiles
+from app.admission import BYTES_PER_LINE_PROCESS, estimate_model_bytes
+from app.benchmark import generate_instance
+from app.models import SolveOptions
+
+
+def with_options(req, **options):
+    return req.model_copy(update={'options': SolveOptions(**options)})
+
+
+def test_hierarchical_estimate_counts_line_processes(monkeypatch):
+    monkeypatch.setattr(profiles, 'HIERARCHICAL_PROCESSES', 4)
+    req = generate_instance(1, jobs=10, lines=4)
+    inline = estimate_model_bytes(with_options(req, decomposition='hierarchical', hierarchicalParallel=1))
+    parallel = estimate_model_bytes(with_options(req, decomposition='hierarchical', hierarchicalParallel=2))
+    capped = estimate_model_bytes(with_options(req, decomposition='hierarchical', hierarchicalParallel=16))
+    assert parallel - inline == 2 * BYTES_PER_LINE_PROCESS
+    assert capped - inline == 4 * BYTES_PER_LINE_PROCESS
@@ -0,0 +1,16 @@
+import json
+
+from app import benchmark
+
+
+def test_small_suite_writes_and_compares_results(tmp_path, capsys):
+    output = tmp_path / "results.json"
+    args = ["--suite", "small", "--seeds", "1", "--time-limit", "1", "--output", str(output)]
+    benchmark.main(args + ["--option", "intervalEncoding=lean"])
+    report = json.loads(output.read_text())
+    assert report["options"]["intervalEncoding"] == "lean"
+    assert [r["name"] for r in report["results"]] == [c["name"] for c in benchmark.SUITES["small"]]
+    assert all(r["status"] == "success" and r["numVariables"] for r in report["results"])
+
+    benchmark.main(args[:-1] + [str(tmp_path / "again.json"), "--compare", str(output)])
+    assert "Against" in capsys.readouterr().out
@@ -0,0 +1,23 @@
+import pytest
+
+from app.benchmark import generate_instance
+from app.dispatch import MAX_HOLES, Timeline, dispatch_schedule
+
+
+def test_dispatch_rejects_unknown_rule():
+    req = generate_instance(1, jobs=2)
+    assert dispatch_schedule(req, 'edd')['status'] == 'success'
+    with pytest.raises(ValueError, match="Unknown dispatch rule"):
+        dispatch_schedule(req, 'nope')
+
+
+def test_full_timeline_keeps_the_hole_it_just_split():
+    timeline = Timeline(None, 1)
+    for i in range(MAX_HOLES):
+        timeline.reserve(10 + 2 * i, 11 + 2 * i, f"job{i}")
+    assert len(timeline.hole_starts) == MAX_HOLES
+    # Splitting the oldest hole [0, 10] drops the next oldest, not the new holes
+    timeline.reserve(4, 6, "late")
+    assert len(timeline.hole_starts) == MAX_HOLES
+    assert list(zip(timeline.hole_starts, timeline.hole_ends))[:3] == [(0, 4), (6, 10), (13, 14)]
+    assert timeline.earliest_fit(0, 3, "other", lambda before, after: 0) == 0
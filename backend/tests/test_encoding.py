@@ -0,0 +1,13 @@
+import pytest
+from fastapi import HTTPException
+
+from app import encoding
+
+
+def test_msgpack_only_client_gets_406_without_msgpack(monkeypatch):
+    monkeypatch.setattr(encoding, 'msgpack', None)
+    with pytest.raises(HTTPException) as raised:
+        encoding.encode_response({'a': 1}, 'application/msgpack')
+    assert raised.value.status_code == 406
+    # A client that also takes JSON gets JSON
+    assert encoding.encode_response({'a': 1}, 'application/msgpack, application/json').media_type == 'application/json'
@@ -0,0 +1,14 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import ingest
+from app.main import app
+
+
+def test_parquet_without_pyarrow_is_refused(monkeypatch):
+    monkeypatch.setattr(ingest, 'pq', None)
+    assert ingest.file_format('jobs.csv') == 'csv'
+    with pytest.raises(ingest.UnsupportedFileFormat, match="pyarrow"):
+        ingest.file_format('jobs.parquet')
+    files = {'jobs': ('jobs.parquet', b'PAR1'), 'tasks': ('tasks.csv', b'id\n'), 'operators': ('operators.csv', b'id\n')}
+    assert TestClient(app).post('/import/validate', files=files).status_code == 415
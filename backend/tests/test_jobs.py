@@ -0,0 +1,79 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import jobs
+from app.benchmark import generate_instance
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    # Leaving the client runs the app's shutdown hook, which stops the pool
+    with TestClient(app) as client:
+        yield client
+
+
+def solve_request(jobs_count: int) -> dict:
+    req = generate_instance(1, jobs=jobs_count).model_dump(mode="json")
+    req['options'] = {'timeLimitSeconds': 2}
+    return req
+
+
+def wait_for(client, job_id: str, timeout: float = 60) -> dict:
+    deadline = time.time() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job['status'] not in ('queued', 'running') or time.time() > deadline:
+            return job
+        time.sleep(0.2)
+
+
+def test_job_is_submitted_and_polled(client):
+    response = client.post('/jobs/solve', json=solve_request(3))
+    assert response.status_code == 202
+    job = wait_for(client, response.json()['jobId'])
+    assert job['status'] == 'done'
+    assert job['result']['status'] == 'success'
+    assert client.get('/jobs/unknown').status_code == 404
+
+
+def test_delete_cancels_a_queued_job(client, monkeypatch):
+    # No free worker: the job stays in the admission queue
+    monkeypatch.setattr(jobs.admission_queue, 'workers', 0)
+    job_id = client.post('/jobs/solve', json=solve_request(4)).json()['jobId']
+    assert client.get(f"/jobs/{job_id}").json()['status'] == 'queued'
+    cancelled = client.delete(f"/jobs/{job_id}").json()
+    assert cancelled['cancelled'] and cancelled['status'] == 'cancelled'
+    assert client.get(f"/jobs/{job_id}").json()['status'] == 'cancelled'
+
+
+def test_broken_worker_pool_is_replaced(client):
+    crashed = jobs.submit(os._exit, 1)
+    with pytest.raises(BrokenProcessPool):
+        crashed.result(timeout=60)
+    # The next submit finds the pool broken, starts a new one and retries there
+    assert jobs.submit(pow, 2, 10).result(timeout=60) == 1024
+
+
+def test_pool_restart_keeps_queued_jobs(client, monkeypatch):
+    monkeypatch.setattr(jobs.admission_queue, 'workers', 0)
+    job_id = client.post('/jobs/solve', json=solve_request(4)).json()['jobId']
+    with pytest.raises(BrokenProcessPool):
+        jobs.submit(os._exit, 1).result(timeout=60)
+    assert jobs.submit(pow, 2, 10).result(timeout=60) == 1024
+    assert client.get(f"/jobs/{job_id}").json()['status'] == 'queued'
+
+
+def test_pool_restart_keeps_the_progress_manager(client):
+    manager = jobs.get_manager()
+    stop_event = manager.Event()
+    with pytest.raises(BrokenProcessPool):
+        jobs.submit(os._exit, 1).result(timeout=60)
+    assert jobs.submit(pow, 2, 10).result(timeout=60) == 1024
+    assert jobs.get_manager() is manager
+    stop_event.set()
+    assert stop_event.is_set()
@@ -0,0 +1,46 @@
+import queue
+import time
+
+from app.benchmark import generate_instance
+from app.models import SolveOptions
+from app.solver import solve_schedule
+
+
+def with_options(req, **options):
+    return req.model_copy(update={'options': SolveOptions(**options)})
+
+
+def test_lns_returns_an_optimal_first_solve():
+    req = with_options(generate_instance(1, jobs=2), decomposition='lns', timeLimitSeconds=5)
+    t_start = time.perf_counter()
+    result = solve_schedule(req)
+    assert result['stats']['rounds'] == 0
+    assert result['stats']['stopped_early']
+    assert time.perf_counter() - t_start < 3
+
+
+def test_lns_stops_when_it_stalls():
+    req = with_options(generate_instance(1, jobs=5), decomposition='lns', timeLimitSeconds=20,
+                       lnsInitialSeconds=0, lnsNeighborhoodSeconds=0.2, lnsStallRounds=3)
+    result = solve_schedule(req)
+    assert result['status'] == 'success'
+    assert result['stats']['stopped_early']
+    assert result['stats']['wall_time'] < 10
+
+
+def test_lns_streams_the_start_then_its_changes():
+    req = with_options(generate_instance(1, jobs=5), decomposition='lns', timeLimitSeconds=6,
+                       lnsInitialSeconds=0, lnsNeighborhoodSeconds=0.2, lnsStallRounds=3)
+    progress = queue.Queue()
+    solve_schedule(req, None, progress)
+    events = [progress.get() for _ in range(progress.qsize())]
+    task_count = sum(len(job.tasks) for job in req.jobs)
+    assert [event['solution'] for event in events] == list(range(1, len(events) + 1))
+    assert len(events[0]['changedTasks']) == task_count
+    # Later events list only the tasks that moved
+    placement = lambda task: (task['start'], task['end'], task['line'], task['operator'])
+    known = {task['id']: placement(task) for task in events[0]['changedTasks']}
+    for event in events[1:]:
+        for task in event['changedTasks']:
+            assert placement(task) != known[task['id']]
+            known[task['id']] = placement(task)
@@ -0,0 +1,28 @@
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app.benchmark import generate_instance
+from app.main import app
+from app.models import SolveOptions
+
+
+@pytest.mark.parametrize("field,values", [
+    ('setupModel', ('circuit', 'sparse', 'family')),
+    ('resourceModel', ('individual', 'pooled')),
+    ('decomposition', ('none', 'rolling', 'lns', 'hierarchical')),
+    ('dispatchRule', ('edd', 'wspt', 'atc')),
+    ('responseFormat', ('rows', 'columnar')),
+    ('intervalEncoding', ('optional', 'lean')),
+])
+def test_choice_option_rejects_unknown_values(field, values):
+    for value in values:
+        assert getattr(SolveOptions(**{field: value}), field) == value
+    with pytest.raises(ValidationError):
+        SolveOptions(**{field: 'bogus'})
+
+
+def test_unknown_option_is_a_422():
+    req = generate_instance(1, jobs=2).model_dump(mode="json")
+    req['options'] = {'setupModel': 'bogus'}
+    assert TestClient(app).post('/solve', json=req).status_code == 422
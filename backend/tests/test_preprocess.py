@@ -0,0 +1,20 @@
+from app.benchmark import generate_instance
+from app.models import SolveOptions
+from app.preprocess import ProblemIndex
+from app.solver import solve_schedule
+
+
+def test_late_frozen_task_fits_without_warm_start():
+    req = generate_instance(1, jobs=4)
+    job, task = req.jobs[1], req.jobs[1].tasks[0]
+    previous = [{'id': task.id, 'jobId': job.id, 'start': 1000, 'end': 1000 + int(task.duration),
+                 'line': task.eligibleLines[0], 'operator': req.operators[0].id}]
+    options = SolveOptions(warmStart=False, fallback=False, frozenTaskIds=[task.id], timeLimitSeconds=5)
+    req = req.model_copy(update={'previousSchedule': previous, 'options': options})
+
+    # The rest of the job must fit after the frozen task
+    assert ProblemIndex(req).horizon({task.id: previous[0]}) >= 1000 + sum(int(t.duration) for t in job.tasks)
+    result = solve_schedule(req)
+    assert result['status'] == 'success' and not result.get('fallback')
+    frozen = next(t for j in result['tasks'] for t in j['tasks'] if t['id'] == task.id)
+    assert frozen['start'] == 1000
@@ -0,0 +1,25 @@
+import threading
+import time
+
+from app.benchmark import generate_instance
+from app.models import SolveOptions
+from app.profiles import resolve_solver_profile
+from app.solver import solve_schedule
+
+
+def test_stop_before_search_starts_ends_the_search():
+    req = generate_instance(1, jobs=40, lines=4)
+    req = req.model_copy(update={'options': SolveOptions(timeLimitSeconds=6)})
+    stop = threading.Event()
+    stop.set()
+    t_start = time.perf_counter()
+    result = solve_schedule(req, None, None, stop)
+    assert time.perf_counter() - t_start < 3
+    assert result['status'] == 'success'
+
+
+def test_no_improvement_override_is_not_deterministic():
+    assert resolve_solver_profile(SolveOptions(solverProfile='deterministic'))[1]['deterministic']
+    _, profile = resolve_solver_profile(SolveOptions(solverProfile='deterministic', noImprovementSeconds=2))
+    assert profile['noImprovementSeconds'] == 2
+    assert not profile['deterministic']
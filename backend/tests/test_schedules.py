@@ -0,0 +1,26 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import store
+from app.benchmark import generate_instance
+from app.main import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, '_store', store.ScheduleStore(str(tmp_path / 'schedules.db')))
+    with TestClient(app) as client:
+        yield client
+
+
+def test_patch_to_null_required_field_is_a_422(client):
+    req = generate_instance(1, jobs=3)
+    schedule = client.post('/schedules', json=req.model_dump(mode="json")).json()
+    url = f"/schedules/{schedule['scheduleId']}"
+    job, task = req.jobs[0], req.jobs[0].tasks[0]
+
+    assert client.patch(f"{url}/tasks/{task.id}", json={'duration': None}).status_code == 422
+    assert client.patch(f"{url}/jobs/{job.id}", json={'priority': None}).status_code == 422
+    patched = client.patch(f"{url}/tasks/{task.id}", json={'duration': task.duration + 10})
+    assert patched.status_code == 200
+    assert patched.json()['version'] == 2
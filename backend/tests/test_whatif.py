@@ -0,0 +1,38 @@
+from app.benchmark import generate_instance
+from app.models import SolveOptions, WhatIfModification
+from app.solver import solve_scenario
+from app.whatif_helpers import ScenarioBase
+
+
+def with_options(req, **options):
+    return req.model_copy(update={'options': SolveOptions(**options)})
+
+
+def operator_out(req):
+    return [WhatIfModification(description='operator out', type='operator_unavailable',
+                               parameters={'operatorId': req.operators[0].id})]
+
+
+def test_whatif_varies_the_compiled_model():
+    req = with_options(generate_instance(1, jobs=8), timeLimitSeconds=2)
+    result = solve_scenario(req, ScenarioBase(req).key, operator_out(req), [])
+    assert result['status'] == 'success'
+    assert result['stats']['reused_model']
+    tasks = [task for job in result['tasks'] for task in job['tasks']]
+    assert all(task['operator'] != req.operators[0].id for task in tasks)
+
+
+def test_whatif_rebuilds_what_the_model_cannot_vary():
+    req = with_options(generate_instance(1, jobs=8), timeLimitSeconds=2)
+    shift = [WhatIfModification(description='shift', type='shift_change',
+                                parameters={'resourceId': req.lines[0].id, 'intervals': [{'start': 0, 'end': 5000}]})]
+    result = solve_scenario(req, ScenarioBase(req).key, shift, [])
+    assert result['status'] == 'success'
+    assert not result['stats']['reused_model']
+
+
+def test_whatif_keeps_the_decomposition():
+    req = with_options(generate_instance(1, jobs=12), decomposition='rolling', rollingWindowJobs=5, timeLimitSeconds=2)
+    result = solve_scenario(req, ScenarioBase(req).key, operator_out(req), [])
+    assert result['status'] == 'success'
+    assert result['logs'][0].startswith("Solver Status: ROLLING_HORIZON")